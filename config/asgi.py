@@ -0,0 +1,27 @@
+"""
+ASGI config for smart_physio project.
+
+It exposes the ASGI callable as a module-level variable named ``application``,
+for an ASGI server such as uvicorn:
+
+    gunicorn config.asgi:application -k uvicorn.workers.UvicornWorker
+
+Async views (the patient and treatment autocompletes) only stay on the event
+loop behind async-capable middleware; the kop middleware is sync-only, so Django
+adapts the whole chain into a worker thread for now.
+
+"""
+
+import os
+import sys
+from pathlib import Path
+
+from django.core.asgi import get_asgi_application
+
+# This allows easy placement of apps within the interior
+# smart_physio directory.
+BASE_DIR = Path(__file__).resolve(strict=True).parent.parent
+sys.path.append(str(BASE_DIR / "smart_physio"))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings.production")
+
+application = get_asgi_application()
@@ -0,0 +1,20 @@
+# gunicorn -c config/gunicorn.py
+import glob
+import os
+
+from prometheus_client import multiprocess
+
+
+def on_starting(server):
+    # Workers of an earlier run left their metric files behind; start from zero
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        for path in glob.glob(os.path.join(directory, "*.db")):
+            os.remove(path)
+
+
+def child_exit(server, worker):
+    # Keep a dead worker's counters but drop its live gauges
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(worker.pid)
@@ -149,7 +149,9 @@ MIDDLEWARE = [
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "allauth.account.middleware.AccountMiddleware",
-    "kop.middleware.ThreadLocalUserMiddleware"
+    "kop.middleware.ThreadLocalUserMiddleware",
+    "kop.middleware.MetricsMiddleware",
+    "kop.middleware.RequestProfilingMiddleware",
 ]
 
 # STATIC
@@ -301,5 +303,54 @@ REST_FRAMEWORK = {
 
 API_BASE_URL = 'http://localhost:8000/api'
 
+# Seconds the doctor dashboard counters are served from cache before recomputing
+DOCTOR_DASHBOARD_CACHE_TIMEOUT = env.int("DOCTOR_DASHBOARD_CACHE_TIMEOUT", default=60)
+
+# Seconds a user's role and branch (kop.utils.roles) stay cached; profile changes drop them sooner
+USER_ROLE_CACHE_TIMEOUT = env.int("USER_ROLE_CACHE_TIMEOUT", default=3600)
+
+# List totals (kop.utils.pagination.approximate_count): seconds they are cached, and the
+# planner estimate above which PostgreSQL reports the estimate instead of counting
+PAGINATION_COUNT_CACHE_TIMEOUT = env.int("PAGINATION_COUNT_CACHE_TIMEOUT", default=300)
+PAGINATION_EXACT_COUNT_LIMIT = env.int("PAGINATION_EXACT_COUNT_LIMIT", default=10000)
+
+# Per-view query count and wall time budgets checked by `manage.py check_view_budgets` and the test suite
+VIEW_BUDGETS_FILE = env("VIEW_BUDGETS_FILE", default=str(BASE_DIR / "kop" / "tests" / "view_budgets.json"))
+# Scenario size of the test suite's budget run (1.0 is the production-like size the budgets are recorded at),
+# and whether it checks wall time too, which is only meaningful at that size on comparable hardware
+VIEW_BUDGETS_TEST_SCALE = env.float("VIEW_BUDGETS_TEST_SCALE", default=0.02)
+VIEW_BUDGETS_TEST_LATENCY = env.bool("VIEW_BUDGETS_TEST_LATENCY", default=False)
+
+# Rows fetched per database round trip while streaming CSV/XLSX exports (kop.utils.exports)
+EXPORT_CHUNK_SIZE = env.int("EXPORT_CHUNK_SIZE", default=2000)
+
+# Patient and treatment autocompletes (kop.utils.autocomplete): seconds a term's candidates are cached,
+# and the most candidates kept per term; a term with more matches can't be narrowed in memory
+AUTOCOMPLETE_CACHE_TIMEOUT = env.int("AUTOCOMPLETE_CACHE_TIMEOUT", default=30)
+AUTOCOMPLETE_CANDIDATE_LIMIT = env.int("AUTOCOMPLETE_CANDIDATE_LIMIT", default=500)
+
+# Background jobs (kop.utils.background_jobs), run by `manage.py run_jobs`: attempts per job before it
+# fails, seconds before the first retry (doubled for every later one), seconds a running job may take
+# before another worker takes it for abandoned, and days finished jobs and their files are kept.
+# With BACKGROUND_JOBS_IMMEDIATE jobs run inline as they are queued and nothing is stored (tests).
+BACKGROUND_JOBS_IMMEDIATE = env.bool("BACKGROUND_JOBS_IMMEDIATE", default=False)
+BACKGROUND_JOB_MAX_ATTEMPTS = env.int("BACKGROUND_JOB_MAX_ATTEMPTS", default=3)
+BACKGROUND_JOB_RETRY_DELAY = env.int("BACKGROUND_JOB_RETRY_DELAY", default=30)
+BACKGROUND_JOB_TIMEOUT = env.int("BACKGROUND_JOB_TIMEOUT", default=3600)
+BACKGROUND_JOB_RESULT_DAYS = env.int("BACKGROUND_JOB_RESULT_DAYS", default=7)
+# Invoice treatments that get under way from the worker instead of in the saving request
+TREATMENT_INVOICES_IN_BACKGROUND = env.bool("TREATMENT_INVOICES_IN_BACKGROUND", default=False)
+
+# Request profiling (kop.middleware.RequestProfilingMiddleware): on for every request, or only for
+# superadmin requests sending the header; the last REQUEST_PROFILING_BUFFER_SIZE profiles per process
+# are shown at /kop/profiling/
+REQUEST_PROFILING = env.bool("REQUEST_PROFILING", default=False)
+REQUEST_PROFILING_HEADER = "X-Profile"
+REQUEST_PROFILING_BUFFER_SIZE = env.int("REQUEST_PROFILING_BUFFER_SIZE", default=200)
+
+# Bearer token Prometheus sends to scrape /kop/metrics/; superadmins can always open it. With several
+# gunicorn workers also set the PROMETHEUS_MULTIPROC_DIR environment variable (see config/gunicorn.py)
+METRICS_TOKEN = env("METRICS_TOKEN", default="")
+
 PHONENUMBER_DEFAULT_REGION = "IN"  # Set India as default region
 
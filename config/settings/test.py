@@ -36,3 +36,6 @@ TEMPLATES[0]["OPTIONS"]["debug"] = True  # type: ignore[index]
 MEDIA_URL = "http://media.testserver/"
 # Your stuff...
 # ------------------------------------------------------------------------------
+
+# Jobs run inline as they are queued, so tests see their effects at once
+BACKGROUND_JOBS_IMMEDIATE = True
@@ -1,4 +1,5 @@
 from django.contrib import admin
+from django.utils import timezone
 
 # Register your models here.
 from .models import *
@@ -14,7 +15,7 @@ admin.site.register(PatientTreatment)
 admin.site.register(PatientAttachment)
 admin.site.register(PatientConsultation)
 admin.site.register(Invoice)
-admin.site.register(Payment)
+admin.site.register(InvoiceSequence)
 #
 from django.contrib import admin
 from .models import DoctorProfile
@@ -60,3 +61,26 @@ class DoctorProfileAdmin(admin.ModelAdmin):
     # Add filters for audit fields
     list_filter = ('created_at', 'updated_at')
 
+
+
+@admin.register(BackgroundJob)
+class BackgroundJobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'attempts', 'user', 'created_at', 'finished_at')
+    list_filter = ('status', 'name')
+    readonly_fields = ('created_at', 'started_at', 'finished_at', 'worker')
+    actions = ['retry']
+
+    @admin.action(description='Queue the selected jobs again')
+    def retry(self, request, queryset):
+        queued = queryset.exclude(status='running').update(
+            status='queued', attempts=0, run_after=timezone.now(), error='',
+        )
+        self.message_user(request, f'{queued} jobs queued')
+
+
+@admin.register(Payment)
+class PaymentAdmin(admin.ModelAdmin):
+    def delete_queryset(self, request, queryset):
+        # One at a time, so Payment.delete takes each amount off its invoice
+        for payment in queryset:
+            payment.delete()
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class KopConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'kop'
+
+    def ready(self):
+        import kop.jobs  # noqa: F401
+        import kop.receivers  # noqa: F401
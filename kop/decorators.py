@@ -6,6 +6,8 @@ from django.http import HttpResponseForbidden
 from django.shortcuts import redirect
 from functools import wraps
 
+from kop.utils.roles import get_user_role
+
 
 def branch_admin_required(view_func):
     """
@@ -18,7 +20,7 @@ def branch_admin_required(view_func):
             return redirect('login')
 
         # Check if user has branch admin profile
-        if not hasattr(request.user, 'branch_admin'):
+        if not get_user_role(request.user).is_branch_admin:
             return render(request, '403.html', {
                 'message': "Only branch-admins are allowed to access this page."
             }, status=403)
@@ -37,7 +39,7 @@ def doctor_required(view_func):
             return redirect('login')  # Or your login URL
 
         # For DoctorProfile model approach
-        if hasattr(request.user, 'doctor_profile'):
+        if get_user_role(request.user).is_doctor:
             return view_func(request, *args, **kwargs)
 
         return render(request, '403.html', {
@@ -79,7 +81,7 @@ def doctor_or_superadmin_required(view_func):
             return redirect('login')
 
         # Check if user is a doctor or superadmin
-        if hasattr(request.user, 'doctor_profile') or request.user.is_superuser:
+        if request.user.is_superuser or get_user_role(request.user).is_doctor:
             return view_func(request, *args, **kwargs)
 
         # Render a custom 403 page
@@ -99,7 +101,7 @@ def branch_admin_or_superadmin_required(view_func):
             return redirect('login')
 
         # Check if user is a doctor or superadmin
-        if hasattr(request.user, 'branch_admin') or request.user.is_superuser:
+        if request.user.is_superuser or get_user_role(request.user).is_branch_admin:
             return view_func(request, *args, **kwargs)
 
         # Render a custom 403 page
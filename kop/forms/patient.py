@@ -1,5 +1,7 @@
 from django import forms
 from kop.models import Patient, PatientAttachment, Branch
+from kop.utils.common import get_user_branch
+from kop.utils.roles import get_user_role
 from django.core.validators import FileExtensionValidator
 
 
@@ -36,8 +38,9 @@ class PatientForm(forms.ModelForm):
         self.fields['date_of_birth'].widget.attrs['type'] = 'date'
         self.fields['is_active'].label = 'Active'
 
-        if self.user and hasattr(self.user, 'branch_admin'):
-            branch = self.user.branch_admin.branch
+        role = get_user_role(self.user) if self.user else None
+        if role and role.is_branch_admin:
+            branch = role.branch_for('branch_admin')
             self.fields['branch'].initial = branch
 
             # For existing instances, don't change the branch field behavior
@@ -85,10 +88,11 @@ class PatientSearchForm(forms.Form):
         self.user = kwargs.pop('user', None)
         super().__init__(*args, **kwargs)
 
-        # Limit branch choices for branch admins
-        if self.user and hasattr(self.user, 'branch_admin'):
-            self.fields['branch'].queryset = Branch.objects.filter(id=self.user.branch_admin.branch.id)
-            self.fields['branch'].initial = self.user.branch_admin.branch
+        # Limit branch choices to the branch patient_list is scoped to
+        branch = get_user_branch(self.user) if self.user else None
+        if branch:
+            self.fields['branch'].queryset = Branch.objects.filter(id=branch.id)
+            self.fields['branch'].initial = branch
             self.fields['branch'].empty_label = None  # Remove empty choice
 
 
@@ -2,6 +2,7 @@ from django import forms
 
 from kop.forms.consultation import PatientModelFormMixin
 from kop.models import PatientTreatment, DoctorProfile, Patient
+from kop.utils.roles import get_user_role
 
 
 class PatientTreatmentForm(PatientModelFormMixin):
@@ -22,7 +23,7 @@ class PatientTreatmentForm(PatientModelFormMixin):
                 })
             except Patient.DoesNotExist:
                 pass
-        if user and hasattr(user, 'doctor_profile'):
+        if user and get_user_role(user).is_doctor:
             # Set initial value to the logged-in doctor's profile
             self.fields['doctor'].initial = user.doctor_profile
             # Make the field disabled
@@ -4,7 +4,6 @@ from kop.models import PatientWeeklySchedule, PatientTreatment
 
 class PatientWeeklyScheduleForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
-        print('#####', kwargs)
         patient_id = kwargs['initial']['patient']
         super().__init__(*args, **kwargs)
         # Add form-control class to all fields
@@ -12,7 +11,6 @@ class PatientWeeklyScheduleForm(forms.ModelForm):
             field.widget.attrs['class'] = 'form-control'
 
         # Special field handling
-        print('########', patient_id)
         if patient_id:
             treatments = PatientTreatment.objects.filter(patient_id=patient_id)
 
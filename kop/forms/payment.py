@@ -37,6 +37,8 @@ class PaymentForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         self.invoice = kwargs.pop('invoice', None)
         super().__init__(*args, **kwargs)
+        # Left blank, a PAY-<invoice>-<n> reference is generated on save
+        self.fields['reference'].required = False
 
         if self.invoice:
             self.fields['amount'].widget.attrs['max'] = float(self.invoice.total_cost)
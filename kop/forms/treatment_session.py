@@ -1,7 +1,5 @@
 from django import forms
 from kop.models import TreatmentSession, PatientTreatment, DoctorProfile, Patient
-from dal import autocomplete
-from django.db import models
 
 
 class TreatmentSessionForm(forms.ModelForm):
@@ -53,33 +51,3 @@ class TreatmentSessionForm(forms.ModelForm):
             cleaned_data['treatment'] = None
 
         return cleaned_data
-
-
-class PatientTreatmentAutocomplete(autocomplete.Select2QuerySetView):
-    def get_queryset(self):
-        print('inside get_queryset')
-        if not self.request.user.is_authenticated:
-            return PatientTreatment.objects.none()
-
-        qs = PatientTreatment.objects.all().select_related('patient', 'doctor')
-
-        # For doctors - only show treatments from their branch
-        if hasattr(self.request.user, 'doctor_profile'):
-            doctor_branch = self.request.user.doctor_profile.branch
-            if doctor_branch:
-                qs = qs.filter(doctor__branch=doctor_branch)
-
-        # For staff/superusers - show all treatments
-        elif not self.request.user.is_staff and not self.request.user.is_superuser:
-            return PatientTreatment.objects.none()
-
-        # Apply search filtering
-        if self.q:
-            qs = qs.filter(
-                models.Q(patient__first_name__icontains=self.q) |
-                models.Q(patient__last_name__icontains=self.q) |
-                models.Q(patient__phone__icontains=self.q)
-            ).distinct()
-
-        print(qs)
-        return qs
@@ -0,0 +1,89 @@
+import datetime
+import tempfile
+import uuid
+
+from django.contrib.auth.models import Group
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.http import QueryDict
+from django.utils import timezone
+
+from kop.models import Invoice, PatientTreatment
+from kop.utils.activity_rollup import refresh_rollups
+from kop.utils.background_jobs import background_job, enqueue
+from kop.utils.exports import export_file
+from smart_physio.users.models import User
+
+# Treatments in these states are not invoiced
+UNBILLED_TREATMENT_STATUSES = ('prescribed', 'completed', 'cancelled')
+
+
+@background_job
+def create_treatment_invoice(treatment_id):
+    """Invoice a treatment that is under way and has no invoice yet"""
+    with transaction.atomic():
+        treatment = (
+            PatientTreatment.objects.select_for_update(of=('self',))
+            .select_related('patient', 'treatment_program')
+            .filter(pk=treatment_id)
+            .first()
+        )
+        if treatment is None or treatment.status in UNBILLED_TREATMENT_STATUSES:
+            return None
+        if treatment.is_invoice_already_present_for_treatment:
+            return None
+        today = timezone.now().date()
+        invoice = Invoice.objects.create(
+            patient=treatment.patient,
+            treatment=treatment,
+            invoice_date=today,
+            due_date=today + datetime.timedelta(days=14),
+            status='sent',
+            notes=f"Treatment program: {treatment.treatment_program.name}",
+            total=treatment.total_cost,
+            balance=treatment.total_cost,
+        )
+    return {'invoice': invoice.pk}
+
+
+@background_job
+def create_groups(names):
+    """Make sure the permission groups exist"""
+    for name in names:
+        Group.objects.get_or_create(name=name)
+
+
+@background_job
+def refresh_activity_rollup(doctor_days):
+    """Recompute the rollup rows of [doctor id, 'YYYY-MM-DD'] pairs"""
+    refresh_rollups({(doctor_id, datetime.date.fromisoformat(day)) for doctor_id, day in doctor_days})
+
+
+def queue_rollup_refresh(doctor_days):
+    """Queue a refresh of the rollup rows of (doctor id, date) pairs; pairs missing either are skipped"""
+    doctor_days = sorted({(doctor_id, str(day)) for doctor_id, day in doctor_days if doctor_id and day})
+    if doctor_days:
+        enqueue(refresh_activity_rollup, doctor_days=doctor_days)
+
+
+@background_job
+def write_export(export, user_id, params, export_format='csv', compress=False):
+    """
+    Write one of the list exports (kop.views.exports.EXPORTS) as the user would
+    download it under the list filters in `params`, a query string, to the
+    default storage.
+    """
+    from kop.views.exports import build_export
+
+    built = build_export(export, User.objects.get(pk=user_id), QueryDict(params))
+    if built is None:
+        raise ValueError(f"Invalid {export} filters: {params}")
+    header, rows = built
+    filename, content_type, chunks = export_file(
+        f'{export}-{timezone.now().date().isoformat()}', header, rows, export_format, compress,
+    )
+    with tempfile.TemporaryFile() as out:
+        out.writelines(chunks)
+        path = default_storage.save(f'exports/{uuid.uuid4().hex}/{filename}', File(out))
+    return {'file': path, 'filename': filename, 'content_type': content_type}
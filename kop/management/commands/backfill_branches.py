@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from kop.utils.branches import BRANCH_SOURCES, backfill_branches
+
+MODELS = {model._meta.model_name: model for model in BRANCH_SOURCES}
+
+
+class Command(BaseCommand):
+    help = 'Fill the denormalized branch of treatment sessions, consultations and invoices, in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model', choices=sorted(MODELS), action='append',
+            help='Only backfill this model (repeatable); all of them by default'
+        )
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Primary keys updated per transaction')
+        parser.add_argument(
+            '--missing-only', action='store_true',
+            help='Only fill rows without a branch instead of recomputing every row'
+        )
+
+    def handle(self, *args, **options):
+        for name in options['model'] or sorted(MODELS):
+            model = MODELS[name]
+            total = 0
+            for last_pk, updated in backfill_branches(model, options['chunk_size'], options['missing_only']):
+                total += updated
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'{name}: {updated} rows up to id {last_pk}')
+            self.stdout.write(self.style.SUCCESS(f'{name}: updated {total} rows'))
@@ -0,0 +1,50 @@
+from heapq import merge
+
+from django.core.management.base import BaseCommand
+from django.db import models
+from django.db.models import Value
+
+from kop.models import PatientConsultation, TreatmentSession
+from kop.utils.booking_conflicts import INACTIVE_STATUSES, iter_overlaps
+
+
+class Command(BaseCommand):
+    help = 'List sessions and consultations that double-book a doctor'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start', type=str, help='Only check bookings on or after this date (YYYY-MM-DD)')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Rows fetched per round trip')
+
+    def handle(self, *args, **options):
+        sessions = TreatmentSession.objects.exclude(status__in=INACTIVE_STATUSES)
+        consultations = PatientConsultation.objects.exclude(status__in=INACTIVE_STATUSES)
+        if options['start']:
+            sessions = sessions.filter(date__gte=options['start'])
+            consultations = consultations.filter(date__gte=options['start'])
+
+        # Both tables stream in (doctor, date, start_time) order, so one merged sweep covers them
+        streams = [
+            queryset.annotate(kind=Value(kind, output_field=models.CharField())).values_list(
+                doctor_field, 'date', 'start_time', 'end_time', 'kind', 'pk'
+            ).order_by(doctor_field, 'date', 'start_time').iterator(chunk_size=options['batch_size'])
+            for queryset, doctor_field, kind in (
+                (sessions, 'treatment_doctor_id', 'session'),
+                (consultations, 'doctor_id', 'consultation'),
+            )
+        ]
+
+        found = 0
+        for earlier, later in iter_overlaps(merge(*streams, key=lambda booking: booking[:3])):
+            found += 1
+            self.stdout.write(
+                self.style.WARNING(
+                    f'Doctor {earlier[0]} on {earlier[1]}: {earlier[4]} {earlier[5]} '
+                    f'({earlier[2]:%H:%M}-{earlier[3]:%H:%M}) overlaps {later[4]} {later[5]} '
+                    f'({later[2]:%H:%M}-{later[3]:%H:%M})'
+                )
+            )
+
+        if found:
+            self.stdout.write(self.style.ERROR(f'{found} overlapping bookings found'))
+        else:
+            self.stdout.write(self.style.SUCCESS('No doctor is double-booked'))
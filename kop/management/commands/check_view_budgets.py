@@ -0,0 +1,63 @@
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import override_settings
+from django.utils import timezone
+
+from kop.models import BackgroundJob, PatientAttachment
+from kop.utils.view_budgets import ViewBudgetRun, check_budgets, load_budgets, make_budgets, seed_budget_data, \
+    write_json
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a scenario, GET every kop URL as every role and compare query counts and wall time '
+        'with the stored budgets. Everything seeded is rolled back; run it against a development database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1.0,
+                            help='Scenario size; 1.0 is 2000 patients and 24000 sessions per branch')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the scenario')
+        parser.add_argument('--repeat', type=int, default=3, help='Requests per URL and role; wall time is the median')
+        parser.add_argument('--budgets', default=settings.VIEW_BUDGETS_FILE, help='Budget file to check or update')
+        parser.add_argument('--output', help='Write the measurements and failures to this JSON file')
+        parser.add_argument('--update', action='store_true', help='Store this run as the new budgets')
+        parser.add_argument('--no-latency', action='store_true', help='Only check query counts')
+
+    def handle(self, *args, **options):
+        # The test client's requests come from 'testserver'
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']), transaction.atomic():
+            objects, users = seed_budget_data(scale=options['scale'], seed=options['seed'])
+            try:
+                results = ViewBudgetRun(objects, users, repeat=options['repeat']).run()
+            finally:
+                objects[PatientAttachment].file.delete(save=False)
+                default_storage.delete(objects[BackgroundJob].result['file'])
+            transaction.set_rollback(True)
+
+        if options['update']:
+            write_json(options['budgets'], make_budgets(results))
+            self.stdout.write(self.style.SUCCESS(f"Stored budgets for {len(results)} requests in {options['budgets']}"))
+            failures = []
+        else:
+            failures = check_budgets(results, load_budgets(options['budgets']), latency=not options['no_latency'])
+
+        if options['output']:
+            write_json(options['output'], {
+                'created_at': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'scale': options['scale'],
+                'seed': options['seed'],
+                'repeat': options['repeat'],
+                'results': results,
+                'failures': failures,
+            })
+            self.stdout.write(f"Report written to {options['output']}")
+
+        for failure in failures:
+            self.stdout.write(self.style.WARNING(failure))
+        if failures:
+            raise CommandError(f'{len(failures)} requests over budget')
+        self.stdout.write(self.style.SUCCESS(f'{len(results)} requests within budget'))
@@ -1,62 +1,60 @@
-from django.core.management.base import BaseCommand
-from django.utils import timezone
-from faker import Faker
-from kop.models import Patient, Branch, LeadSource
-from datetime import datetime, timedelta
-import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from kop.utils.scenario import DOCTORS_PER_BRANCH, SESSIONS_PER_TREATMENT, build_scenario
 
 
 class Command(BaseCommand):
-    help = 'Create test patient data'
+    help = (
+        'Create test data: branches with doctors, availability, programs, patients, treatments, schedules, '
+        'sessions, consultations, invoices and payments'
+    )
 
     def add_arguments(self, parser):
-        parser.add_argument('--count', type=int, default=20, help='Number of patients to create')
+        parser.add_argument('--count', type=int, default=20, help='Number of patients per branch')
+        parser.add_argument('--branches', type=int, default=1, help='Number of branches to create')
+        parser.add_argument('--doctors', type=int, default=DOCTORS_PER_BRANCH, help='Number of doctors per branch')
+        parser.add_argument('--sessions', type=int, default=SESSIONS_PER_TREATMENT,
+                            help='Sessions per patient treatment')
+        parser.add_argument('--scale', type=float, default=1.0, help='Multiplies the patients and doctors per branch')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed; the same seed creates the same data')
+        parser.add_argument('--label', default='Test', help='Prefix for branch names and user emails')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per INSERT')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Processes building branches in parallel (PostgreSQL only)')
 
     def handle(self, *args, **options):
-        fake = Faker()
-        count = options['count']
-
-        # Get or create some branches and lead sources
-        branches = list(Branch.objects.all())
-        lead_sources = list(LeadSource.objects.all())
-
-        if not branches:
-            branches = [Branch.objects.create(name=fake.company(), address=fake.address()) for _ in range(3)]
-
-        if not lead_sources:
-            lead_sources = [LeadSource.objects.create(name=source) for source in
-                            ['Website', 'Referral', 'Social Media', 'Walk-in']]
-
-        genders = ['M', 'F', 'O']
-
-        for i in range(count):
-            # Generate random date of birth (18-80 years old)
-            birth_date = fake.date_of_birth(minimum_age=18, maximum_age=80)
-
-            patient = Patient(
-                first_name=fake.first_name(),
-                last_name=fake.last_name(),
-                date_of_birth=birth_date,
-                gender=random.choice(genders),
-                address=fake.address(),
-                phone=fake.phone_number()[:20],
-                email=fake.unique.email() if i % 3 != 0 else None,  # Some without email
-                emergency_contact=fake.name() if i % 4 != 0 else None,
-                emergency_phone=fake.phone_number()[:20] if i % 4 != 0 else None,
-                medical_history=fake.text() if i % 2 == 0 else None,
-                allergies=fake.text() if i % 3 == 0 else None,
-                current_medications=fake.text() if i % 4 == 0 else None,
-                branch=random.choice(branches) if branches else None,
-                is_active=random.choice([True, False]),
-                source_of_lead=random.choice(lead_sources) if lead_sources and i % 2 == 0 else None,
-            )
-
-            patient.save()
+        if options['workers'] > 1 and connection.vendor == 'sqlite':
+            raise CommandError('SQLite allows a single writer; use --workers 1')
 
+        def progress(branch):
             self.stdout.write(
-                self.style.SUCCESS(f'Created patient {i + 1}/{count}: {patient.first_name} {patient.last_name}')
+                f"{branch['branch']}: {branch['patients']} patients, {branch['sessions']} sessions, "
+                f"{branch['invoices']} invoices"
             )
 
+        started = time.monotonic()
+        summary = build_scenario(
+            branches=options['branches'],
+            scale=options['scale'],
+            seed=options['seed'],
+            label=options['label'],
+            patients=options['count'],
+            doctors=options['doctors'],
+            sessions=options['sessions'],
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            progress=progress,
+        )
+
         self.stdout.write(
-            self.style.SUCCESS(f'Successfully created {count} test patients')
+            self.style.SUCCESS(
+                f"Created {summary['branches']} branches, {summary['doctors']} doctors, "
+                f"{summary['patients']} patients, {summary['treatments']} treatments, "
+                f"{summary['sessions']} sessions, {summary['consultations']} consultations, "
+                f"{summary['invoices']} invoices and {summary['payments']} payments "
+                f"in {time.monotonic() - started:.1f}s"
+            )
         )
@@ -0,0 +1,71 @@
+import logging
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from kop.models import TreatmentSession
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        'List treatment sessions booked twice for the same treatment, date and start time '
+        '(migration 0024 refuses to run while there are any)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix', action='store_true',
+            help='Keep one session per slot (the completed one, else the oldest), merge the assessment notes '
+                 'of the others into it and delete them',
+        )
+
+    def handle(self, *args, **options):
+        slots = TreatmentSession.objects.filter(treatment__isnull=False).values(
+            'treatment', 'date', 'start_time'
+        ).annotate(count=Count('id')).filter(count__gt=1).order_by('treatment', 'date', 'start_time')
+
+        found = 0
+        for slot in slots:
+            found += 1
+            sessions = TreatmentSession.objects.filter(
+                treatment_id=slot['treatment'], date=slot['date'], start_time=slot['start_time']
+            )
+            kept, *extra = sorted(sessions, key=lambda session: (session.status != 'completed', session.pk))
+            self.stdout.write(
+                self.style.WARNING(
+                    f"Treatment {slot['treatment']} on {slot['date']} at {slot['start_time']:%H:%M}: "
+                    f"keeps session {kept.pk} ({kept.status}), "
+                    f"duplicates {', '.join(f'{session.pk} ({session.status})' for session in extra)}"
+                )
+            )
+            if options['fix']:
+                self._merge(kept, extra)
+
+        if not found:
+            self.stdout.write(self.style.SUCCESS('No treatment session is booked twice'))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS(f'Merged the duplicates of {found} slots'))
+        else:
+            self.stdout.write(self.style.ERROR(f'{found} slots booked twice, rerun with --fix to merge them'))
+
+    def _merge(self, kept, extra):
+        """Fold the duplicates' notes into the kept session and delete them"""
+        notes = [kept.assessment_notes] + [
+            f'[From duplicate session {session.pk}] {session.assessment_notes}'
+            for session in extra if session.assessment_notes and session.assessment_notes != kept.assessment_notes
+        ]
+        with transaction.atomic():
+            TreatmentSession.objects.filter(pk=kept.pk).update(
+                assessment_notes='\n\n'.join(note for note in notes if note)
+            )
+            for session in extra:
+                pk = session.pk
+                # One by one, so the receivers give a completed copy's count back to the treatment
+                session.delete()
+                logger.warning(
+                    'Deleted duplicate treatment session %s (%s) of treatment %s on %s at %s, kept %s',
+                    pk, session.status, session.treatment_id, session.date, session.start_time, kept.pk,
+                )
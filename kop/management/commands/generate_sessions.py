@@ -0,0 +1,41 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from kop.models import Branch
+from kop.utils.session_generator import generate_sessions
+
+
+class Command(BaseCommand):
+    help = 'Create scheduled treatment sessions from the active patient weekly schedules'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--weeks', type=int, default=12, help='Number of weeks to expand')
+        parser.add_argument('--start', type=datetime.date.fromisoformat, default=None,
+                            help='First day to fill (YYYY-MM-DD), defaults to today')
+        parser.add_argument('--branch', type=int, default=None, help='Only expand schedules of this branch id')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per INSERT')
+
+    def handle(self, *args, **options):
+        branch = None
+        if options['branch']:
+            try:
+                branch = Branch.objects.get(pk=options['branch'])
+            except Branch.DoesNotExist as e:
+                raise CommandError(f"Branch {options['branch']} does not exist") from e
+
+        summary = generate_sessions(
+            options['start'] or timezone.now().date(),
+            weeks=options['weeks'],
+            branch=branch,
+            batch_size=options['batch_size'],
+        )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Expanded {summary['schedules']} schedules from {summary['start_date']} to {summary['end_date']}: "
+                f"{summary['created']} sessions created, {summary['skipped']} already existed, "
+                f"{summary['conflicts']} clashed with other bookings"
+            )
+        )
@@ -0,0 +1,35 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from kop.utils.activity_rollup import rebuild_rollups, source_date_range
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily activity rollup from sessions, consultations, invoices and payments, in chunks of days'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--start', type=datetime.date.fromisoformat,
+            help='First day to rebuild (YYYY-MM-DD); the earliest source row by default'
+        )
+        parser.add_argument(
+            '--end', type=datetime.date.fromisoformat,
+            help='Last day to rebuild (YYYY-MM-DD); the latest source row by default'
+        )
+        parser.add_argument('--chunk-days', type=int, default=31, help='Days rebuilt per transaction')
+
+    def handle(self, *args, **options):
+        first, last = source_date_range()
+        start = options['start'] or first
+        end = options['end'] or last
+        if start is None or end is None:
+            self.stdout.write(self.style.SUCCESS('Nothing to roll up'))
+            return
+
+        total = 0
+        for chunk_start, chunk_end, stored in rebuild_rollups(start, end, options['chunk_days']):
+            total += stored
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{chunk_start} - {chunk_end}: {stored} rows')
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {total} rollup rows for {start} - {end}'))
@@ -0,0 +1,71 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+from django.db.models import F, Q, Sum, Value
+from django.db.models.functions import Coalesce
+
+from kop.models import Invoice, Payment
+
+
+class Command(BaseCommand):
+    help = 'Check the denormalized invoice paid_total/balance against the payment rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Rewrite mismatched totals from the payments')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Invoices fetched and fixed per batch')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        zero = Value(Decimal('0'), output_field=models.DecimalField(max_digits=10, decimal_places=2))
+
+        # One grouped query over all invoices; only the mismatches come back
+        mismatched = Invoice.objects.annotate(
+            actual_paid=Coalesce(Sum(F('payments__amount') + F('payments__discount_amount')), zero)
+        ).filter(
+            ~Q(paid_total=F('actual_paid')) | ~Q(balance=F('total') - F('actual_paid'))
+        ).values_list('pk', 'invoice_number', 'total', 'paid_total', 'balance', 'actual_paid').order_by('pk')
+
+        to_fix = []
+        found = 0
+        for pk, number, total, paid_total, balance, actual_paid in mismatched.iterator(chunk_size=batch_size):
+            found += 1
+            self.stdout.write(
+                self.style.WARNING(
+                    f'{number}: paid_total {paid_total} / balance {balance}, '
+                    f'payments add up to {actual_paid} / balance {total - actual_paid}'
+                )
+            )
+            if options['fix']:
+                to_fix.append(pk)
+                if len(to_fix) >= batch_size:
+                    self._fix(to_fix)
+                    to_fix = []
+
+        if to_fix:
+            self._fix(to_fix)
+
+        if not found:
+            self.stdout.write(self.style.SUCCESS('All invoice totals match their payments'))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS(f'Fixed {found} invoices'))
+        else:
+            self.stdout.write(self.style.ERROR(f'{found} invoices out of step, rerun with --fix to repair them'))
+
+    def _fix(self, pks):
+        """Rewrite the invoices' totals and status from their payments, under the lock Payment.save takes"""
+        with transaction.atomic():
+            # Lock before summing: a payment saved meanwhile has either moved the totals already or waits for us
+            invoices = list(
+                Invoice.objects.select_for_update().filter(pk__in=pks).only('total', 'paid_total', 'balance', 'status')
+                .order_by('pk')
+            )
+            paid = dict(
+                Payment.objects.filter(invoice__in=pks).order_by().values('invoice')
+                .annotate(paid=Sum(F('amount') + F('discount_amount'))).values_list('invoice', 'paid')
+            )
+            for invoice in invoices:
+                invoice.paid_total = paid.get(invoice.pk, Decimal('0'))
+                invoice.balance = invoice.total - invoice.paid_total
+                invoice.status = invoice.status_for(invoice.paid_total)
+            Invoice.objects.bulk_update(invoices, ['paid_total', 'balance', 'status'])
@@ -0,0 +1,56 @@
+import os
+import signal
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from kop.utils.background_jobs import claim_job, prune_jobs, requeue_abandoned_jobs, run_job
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs, retrying failed ones, until stopped (or the queue is empty with --once)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit when no job is due instead of waiting')
+        parser.add_argument('--sleep', type=float, default=1.0, help='Seconds to wait when no job is due')
+        parser.add_argument('--max-jobs', type=int, default=None, help='Exit after running this many jobs')
+
+    def handle(self, *args, **options):
+        worker = f'{socket.gethostname()}:{os.getpid()}'
+        self.stopping = False
+        # Finish the job at hand on SIGTERM (deploys, scaling down) rather than leaving it abandoned
+        previous_handler = signal.signal(signal.SIGTERM, self.stop)
+        try:
+            ran = self.work(worker, options)
+        finally:
+            signal.signal(signal.SIGTERM, previous_handler)
+        self.stdout.write(self.style.SUCCESS(f'Ran {ran} jobs'))
+
+    def work(self, worker, options):
+        requeued, failed = requeue_abandoned_jobs()
+        pruned = prune_jobs()
+        if options['verbosity'] > 1:
+            self.stdout.write(f'{requeued} abandoned jobs queued again, {failed} failed, {pruned} old jobs deleted')
+
+        ran = 0
+        while not self.stopping and (options['max_jobs'] is None or ran < options['max_jobs']):
+            # Long-lived process: drop connections the database has closed, as Django does between
+            # requests (unless the worker runs inside a transaction, as in tests)
+            if not connection.in_atomic_block:
+                close_old_connections()
+            job = claim_job(worker)
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+                continue
+            run_job(job)
+            ran += 1
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{job.name} #{job.pk}: {job.status}')
+        return ran
+
+    def stop(self, signum, frame):
+        self.stopping = True
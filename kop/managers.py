@@ -0,0 +1,26 @@
+from django.db import models
+
+from kop.utils.common import get_user_branch
+
+
+class BranchScopedQuerySet(models.QuerySet):
+    """
+    Queryset of a model that belongs to a branch.
+
+    The model names the lookup that leads to its branch in `branch_field`, so
+    views scope with for_branch()/for_user() instead of spelling out the join
+    (and ORing alternative paths) each time.
+    """
+
+    def for_branch(self, branch):
+        """Rows of `branch` (a Branch or its id); None leaves the queryset as it is"""
+        if branch is None or branch == '':
+            return self
+        return self.filter(**{self.model.branch_field: branch})
+
+    def for_user(self, user):
+        """Rows of the branch of a doctor or branch admin; other users' querysets are left as they are"""
+        return self.for_branch(get_user_branch(user))
+
+
+BranchScopedManager = models.Manager.from_queryset(BranchScopedQuerySet, 'BranchScopedManager')
@@ -1,8 +1,19 @@
 # middleware.py
+import json
+import logging
+import time
+from contextlib import ExitStack
 from threading import local
 
+from django.conf import settings
+from django.db import connections
+
+from kop.utils import metrics, profiling
+
 _thread_locals = local()
 
+logger = logging.getLogger('kop.profiling')
+
 
 def get_current_user():
     return getattr(_thread_locals, 'user', None)
@@ -14,5 +25,99 @@ class ThreadLocalUserMiddleware:
 
     def __call__(self, request):
         _thread_locals.user = request.user if request.user.is_authenticated else None
-        response = self.get_response(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            # Don't leak the user into whatever runs next on this thread
+            _thread_locals.user = None
+        return response
+
+
+class RequestProfilingMiddleware:
+    """
+    Record wall time, SQL count and time, repeated query fingerprints and
+    template render time of a request (kop.utils.profiling).
+
+    On for every request when settings.REQUEST_PROFILING is set, otherwise for a
+    superadmin's requests that send the REQUEST_PROFILING_HEADER header. Each
+    profile is logged as JSON to the 'kop.profiling' logger, kept in this
+    process's ring buffer for the profiling page and summed up in a
+    Server-Timing response header.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        profiling.instrument_templates()
+
+    def enabled(self, request):
+        if settings.REQUEST_PROFILING:
+            return True
+        return bool(request.headers.get(settings.REQUEST_PROFILING_HEADER)) and request.user.is_superuser
+
+    def __call__(self, request):
+        if not self.enabled(request):
+            return self.get_response(request)
+
+        profile = profiling.start_profile()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile))
+                response = self.get_response(request)
+        finally:
+            profiling.stop_profile()
+
+        summary = profile.summary(request, response)
+        profiling.record(summary)
+        logger.info(json.dumps(summary), extra={'profile': summary})
+        response['Server-Timing'] = (
+            f'total;dur={summary["ms"]}, '
+            f'sql;dur={summary["sql_ms"]};desc="{summary["sql_count"]} queries", '
+            f'template;dur={summary["template_ms"]}'
+        )
+        return response
+
+
+class _QueryTimer:
+    """connection.execute_wrapper counting and timing the queries of one request"""
+
+    def __init__(self):
+        self.count = 0
+        self.durations = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.durations.append(time.perf_counter() - started)
+
+
+class MetricsMiddleware:
+    """
+    Observe request latency, queries per request and query time per URL name
+    for the Prometheus endpoint (kop.utils.metrics). Requests that match no URL
+    are labelled 'unmatched' so stray paths can't grow the label set.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = _QueryTimer()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unmatched'
+        metrics.REQUEST_LATENCY.labels(view, request.method, response.status_code).observe(elapsed)
+        metrics.REQUEST_QUERIES.labels(view).observe(timer.count)
+        query_latency = metrics.QUERY_LATENCY.labels(view)
+        for duration in timer.durations:
+            query_latency.observe(duration)
         return response
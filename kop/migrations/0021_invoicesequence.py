@@ -0,0 +1,31 @@
+# Generated by Django 5.1.9 on 2026-10-18 10:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kop', '0020_patientconsultation_primary_diagnosis_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='patienttreatment',
+            name='status',
+            field=models.CharField(choices=[('prescribed', 'Prescribed'), ('ongoing', 'Ongoing'), ('completed', 'Completed'), ('cancelled', 'Cancelled')], default='ongoing', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='InvoiceSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveIntegerField()),
+                ('last_number', models.PositiveIntegerField(default=0)),
+                ('branch', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='invoice_sequences', to='kop.branch')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('branch', 'year'), name='unique_invoice_sequence_branch_year'), models.UniqueConstraint(condition=models.Q(('branch__isnull', True)), fields=('year',), name='unique_invoice_sequence_year_without_branch')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.9 on 2026-10-18 10:53
+
+from django.db import migrations, models
+
+
+def seed_last_payment_number(apps, schema_editor):
+    """
+    Start each invoice's counter past every PAY-<invoice>-<n> reference it already has.
+    Older references used a global payment count as <n>, so the count alone could collide.
+    """
+    Invoice = apps.get_model('kop', 'Invoice')
+    Payment = apps.get_model('kop', 'Payment')
+
+    last_numbers = {}
+    for invoice_id, reference in Payment.objects.values_list('invoice_id', 'reference').iterator():
+        prefix = f"PAY-{invoice_id}-"
+        suffix = reference[len(prefix):] if reference.startswith(prefix) else ''
+        number = int(suffix) if suffix.isdigit() else 0
+        last_numbers[invoice_id] = max(last_numbers.get(invoice_id, 0) + 1, number)
+
+    invoices = [Invoice(pk=invoice_id, last_payment_number=number) for invoice_id, number in last_numbers.items()]
+    Invoice.objects.bulk_update(invoices, ['last_payment_number'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kop', '0021_invoicesequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='last_payment_number',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(seed_last_payment_number, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.9 on 2026-10-18 10:55
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_paid_total(apps, schema_editor):
+    Invoice = apps.get_model('kop', 'Invoice')
+    Payment = apps.get_model('kop', 'Payment')
+
+    paid = Payment.objects.filter(invoice=OuterRef('pk')).values('invoice').annotate(
+        paid=Sum(F('amount') + F('discount_amount'))
+    ).values('paid')
+    zero = Value(0, output_field=models.DecimalField(max_digits=10, decimal_places=2))
+    Invoice.objects.update(paid_total=Coalesce(Subquery(paid), zero))
+    Invoice.objects.update(balance=F('total') - F('paid_total'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kop', '0022_invoice_last_payment_number'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='paid_total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.RunPython(backfill_paid_total, migrations.RunPython.noop),
+    ]
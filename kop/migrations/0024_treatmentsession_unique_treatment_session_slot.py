@@ -0,0 +1,44 @@
+# Generated by Django 5.1.9 on 2026-10-18 10:58
+
+from django.db import migrations, models
+from django.db.models import Count
+
+# Slots listed in the error when duplicates are found
+LISTED = 20
+
+
+def check_duplicate_sessions(apps, schema_editor):
+    """
+    Refuse to add the constraint over sessions booked twice: deleting them here
+    would lose their notes and lower the treatments' completed counts unseen.
+    """
+    TreatmentSession = apps.get_model('kop', 'TreatmentSession')
+
+    duplicated = TreatmentSession.objects.filter(treatment__isnull=False).values(
+        'treatment', 'date', 'start_time'
+    ).annotate(count=Count('id')).filter(count__gt=1).order_by('treatment', 'date', 'start_time')
+    found = duplicated.count()
+    if found:
+        listing = '\n'.join(
+            f"  treatment {slot['treatment']} on {slot['date']} at {slot['start_time']}: {slot['count']} sessions"
+            for slot in duplicated[:LISTED]
+        )
+        raise RuntimeError(
+            f'{found} treatment session slots are booked more than once:\n{listing}\n'
+            'Review them with `manage.py dedupe_treatment_sessions`, merge them with --fix, then migrate again.'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kop', '0023_invoice_paid_total'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_sessions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='treatmentsession',
+            constraint=models.UniqueConstraint(condition=models.Q(('treatment__isnull', False)), fields=('treatment', 'date', 'start_time'), name='unique_treatment_session_slot'),
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 5.1.9 on 2026-10-18 11:04
+
+import logging
+
+from django.conf import settings
+from django.db import migrations, models
+
+logger = logging.getLogger(__name__)
+
+CONSTRAINT = 'session_doctor_no_overlap'
+
+# Same-doctor sessions may not overlap unless cancelled. Needs btree_gist for the
+# equality on treatment_doctor_id inside a GiST index.
+ADD_CONSTRAINT = f"""
+    ALTER TABLE kop_treatmentsession ADD CONSTRAINT {CONSTRAINT} EXCLUDE USING gist (
+        treatment_doctor_id WITH =,
+        tsrange(date + start_time, date + end_time, '[)') WITH &&
+    ) WHERE (status <> 'cancelled')
+"""
+
+EXISTING_OVERLAPS = """
+    SELECT 1 FROM kop_treatmentsession a
+    JOIN kop_treatmentsession b
+      ON a.treatment_doctor_id = b.treatment_doctor_id AND a.date = b.date AND a.id < b.id
+     AND a.start_time < b.end_time AND b.start_time < a.end_time
+    WHERE a.status <> 'cancelled' AND b.status <> 'cancelled'
+    LIMIT 1
+"""
+
+
+def add_overlap_constraint(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'btree_gist'")
+        if not cursor.fetchone():
+            logger.warning('btree_gist is not available; %s not added', CONSTRAINT)
+            return
+        cursor.execute(EXISTING_OVERLAPS)
+        if cursor.fetchone():
+            logger.warning(
+                'Overlapping sessions exist, %s not added; list them with `manage.py check_booking_conflicts`',
+                CONSTRAINT,
+            )
+            return
+
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    schema_editor.execute(ADD_CONSTRAINT)
+
+
+def remove_overlap_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'ALTER TABLE kop_treatmentsession DROP CONSTRAINT IF EXISTS {CONSTRAINT}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kop', '0024_treatmentsession_unique_treatment_session_slot'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patientconsultation',
+            index=models.Index(fields=['doctor', 'date', 'start_time', 'end_time'], name='consultation_doctor_slot_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='treatmentsession',
+            index=models.Index(fields=['treatment_doctor', 'date', 'start_time', 'end_time'], name='session_doctor_slot_idx'),
+        ),
+        migrations.RunPython(add_overlap_constraint, remove_overlap_constraint),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.1.9 on 2026-10-18 11:06
+
+import logging
+import re
+
+from django.db import migrations, models
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 2000
+
+# Substring (icontains) searches on these columns can use a trigram GIN index
+TRIGRAM_COLUMNS = ['first_name', 'last_name', 'phone_digits']
+
+
+def backfill_phone_digits(apps, schema_editor):
+    Patient = apps.get_model('kop', 'Patient')
+
+    batch = []
+    for patient in Patient.objects.only('pk', 'phone').order_by('pk').iterator(chunk_size=BATCH_SIZE):
+        patient.phone_digits = re.sub(r'\D', '', patient.phone or '')
+        batch.append(patient)
+        if len(batch) >= BATCH_SIZE:
+            Patient.objects.bulk_update(batch, ['phone_digits'])
+            batch = []
+    if batch:
+        Patient.objects.bulk_update(batch, ['phone_digits'])
+
+
+def add_trigram_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if not cursor.fetchone():
+            logger.warning('pg_trgm is not available; patient search falls back to sequential scans')
+            return
+
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for column in TRIGRAM_COLUMNS:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS patient_{column}_trgm ON kop_patient USING gin ({column} gin_trgm_ops)'
+        )
+
+
+def remove_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for column in TRIGRAM_COLUMNS:
+            schema_editor.execute(f'DROP INDEX IF EXISTS patient_{column}_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kop', '0025_booking_conflict_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='phone_digits',
+            field=models.CharField(blank=True, default='', editable=False, max_length=20),
+        ),
+        migrations.RunPython(backfill_phone_digits, migrations.RunPython.noop),
+        migrations.RunPython(add_trigram_indexes, remove_trigram_indexes),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.1.9 on 2026-10-18 11:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kop', '0026_patient_phone_digits'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['patient', '-invoice_date'], name='invoice_patient_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['-invoice_date'], name='invoice_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['branch', '-created_at'], name='patient_branch_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patientconsultation',
+            index=models.Index(fields=['doctor', 'date', 'status'], name='consultation_doctor_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patientconsultation',
+            index=models.Index(fields=['-date', '-start_time'], name='consultation_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patienttreatment',
+            index=models.Index(condition=models.Q(('is_active', True), ('status', 'ongoing')), fields=['patient'], name='treatment_ongoing_patient_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patienttreatment',
+            index=models.Index(condition=models.Q(('is_active', True), ('status', 'ongoing')), fields=['doctor'], name='treatment_ongoing_doctor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='treatmentsession',
+            index=models.Index(fields=['treatment_doctor', 'date', 'status'], name='session_doctor_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='treatmentsession',
+            index=models.Index(fields=['-date', '-start_time'], name='session_date_idx'),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.1.9 on 2026-10-18 12:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+
+BATCH_SIZE = 5000
+
+# model: (foreign key the branch is copied from, model it points to), as in kop.utils.branches
+BRANCH_SOURCES = {
+    'treatmentsession': ('treatment_doctor', 'doctorprofile'),
+    'patientconsultation': ('patient', 'patient'),
+    'invoice': ('patient', 'patient'),
+}
+
+
+def backfill_branches(apps, schema_editor):
+    # `manage.py backfill_branches` does the same outside a migration, for rows
+    # written later by code that skips save() or to recompute every row
+    for model_name, (field, source_name) in BRANCH_SOURCES.items():
+        model = apps.get_model('kop', model_name)
+        source = apps.get_model('kop', source_name)
+        branch = Subquery(source.objects.filter(pk=OuterRef(f'{field}_id')).values('branch_id')[:1])
+        rows = model.objects.filter(branch__isnull=True)
+        last_pk = rows.aggregate(last=Max('pk'))['last'] or 0
+        for start in range(0, last_pk + 1, BATCH_SIZE):
+            rows.filter(pk__gte=start, pk__lt=start + BATCH_SIZE).update(branch_id=branch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kop', '0027_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='branch',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='invoices', to='kop.branch'),
+        ),
+        migrations.AddField(
+            model_name='patientconsultation',
+            name='branch',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='consultations', to='kop.branch'),
+        ),
+        migrations.AddField(
+            model_name='treatmentsession',
+            name='branch',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='treatment_sessions', to='kop.branch'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['branch', '-invoice_date'], name='invoice_branch_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patientconsultation',
+            index=models.Index(fields=['branch', '-date', '-start_time'], name='consultation_branch_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='treatmentsession',
+            index=models.Index(fields=['branch', '-date', '-start_time'], name='session_branch_date_idx'),
+        ),
+        migrations.RunPython(backfill_branches, migrations.RunPython.noop),
+    ]
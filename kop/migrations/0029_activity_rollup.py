@@ -0,0 +1,57 @@
+# Generated by Django 5.1.9 on 2026-10-18 12:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kop', '0028_denormalized_branch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyActivityRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('sessions_scheduled', models.PositiveIntegerField(default=0)),
+                ('sessions_completed', models.PositiveIntegerField(default=0)),
+                ('sessions_cancelled', models.PositiveIntegerField(default=0)),
+                ('sessions_no_show', models.PositiveIntegerField(default=0)),
+                ('consultations_scheduled', models.PositiveIntegerField(default=0)),
+                ('consultations_completed', models.PositiveIntegerField(default=0)),
+                ('consultations_cancelled', models.PositiveIntegerField(default=0)),
+                ('consultations_no_show', models.PositiveIntegerField(default=0)),
+                ('revenue_invoiced', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('revenue_collected', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['payment_date'], name='payment_date_idx'),
+        ),
+        migrations.AddField(
+            model_name='dailyactivityrollup',
+            name='branch',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity_rollups', to='kop.branch'),
+        ),
+        migrations.AddField(
+            model_name='dailyactivityrollup',
+            name='doctor',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity_rollups', to='kop.doctorprofile'),
+        ),
+        migrations.AddIndex(
+            model_name='dailyactivityrollup',
+            index=models.Index(fields=['doctor', 'date'], name='activity_rollup_doctor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dailyactivityrollup',
+            index=models.Index(fields=['branch', 'date'], name='activity_rollup_branch_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyactivityrollup',
+            constraint=models.UniqueConstraint(fields=('branch', 'doctor', 'date'), name='unique_activity_rollup_day'),
+        ),
+    ]
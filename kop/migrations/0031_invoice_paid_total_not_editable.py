@@ -0,0 +1,18 @@
+# Generated by Django 5.1.9 on 2026-10-18 13:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kop', '0030_background_job'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='invoice',
+            name='paid_total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+    ]
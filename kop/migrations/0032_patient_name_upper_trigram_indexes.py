@@ -0,0 +1,48 @@
+# Generated by Django 5.1.9 on 2026-10-18 13:45
+
+from django.db import migrations
+
+# icontains compiles to UPPER("first_name"::text) LIKE UPPER(%s) on PostgreSQL, which the trigram
+# indexes 0026 put on the bare name columns can't serve; index the expression the lookup uses instead
+NAME_COLUMNS = ['first_name', 'last_name']
+
+
+def _trigram_installed(schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+def index_upper_names(apps, schema_editor):
+    if not _trigram_installed(schema_editor):
+        return
+    for column in NAME_COLUMNS:
+        schema_editor.execute(f'DROP INDEX IF EXISTS patient_{column}_trgm')
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS patient_{column}_upper_trgm '
+            f'ON kop_patient USING gin (UPPER({column}) gin_trgm_ops)'
+        )
+
+
+def index_bare_names(apps, schema_editor):
+    if not _trigram_installed(schema_editor):
+        return
+    for column in NAME_COLUMNS:
+        schema_editor.execute(f'DROP INDEX IF EXISTS patient_{column}_upper_trgm')
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS patient_{column}_trgm ON kop_patient USING gin ({column} gin_trgm_ops)'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kop', '0031_invoice_paid_total_not_editable'),
+    ]
+
+    operations = [
+        migrations.RunPython(index_upper_names, index_bare_names),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.9 on 2026-10-18 14:40
+
+import logging
+
+from django.db import migrations
+
+logger = logging.getLogger(__name__)
+
+
+def fill_activity_rollups(apps, schema_editor):
+    """
+    0029 created the rollup empty, and the dashboards count from it: sum the
+    existing history in, as `manage.py rebuild_activity_rollups` would. Uses the
+    live rebuild (a month per transaction) so the sums are the ones the save
+    paths keep, which holds while the rollup and its sources keep this schema.
+    """
+    from kop.utils.activity_rollup import rebuild_rollups, source_date_range
+
+    start, end = source_date_range()
+    if start is None:
+        return
+    stored = sum(rows for _, _, rows in rebuild_rollups(start, end))
+    logger.info('Filled %s activity rollup rows for %s - %s', stored, start, end)
+
+
+class Migration(migrations.Migration):
+    # rebuild_rollups commits a transaction per chunk of days
+    atomic = False
+
+    dependencies = [
+        ('kop', '0032_patient_name_upper_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_activity_rollups, migrations.RunPython.noop),
+    ]
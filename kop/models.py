@@ -1,7 +1,9 @@
 from datetime import timedelta
 
 from smart_physio.users.models import User
+from django.conf import settings
 from django.contrib.auth.models import Group, Permission, AbstractUser
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.exceptions import ValidationError
 from datetime import date
 from dateutil.relativedelta import relativedelta
@@ -9,11 +11,15 @@ from slugify import slugify
 
 from django.utils import timezone
 
-from django.db import models
+from django.db import models, transaction
 from django.core.validators import MinValueValidator, MaxValueValidator
 
 from django.core.validators import FileExtensionValidator
 
+from kop.managers import BranchScopedManager
+from kop.utils import metrics
+from kop.utils.common import phone_digits
+
 # User = get_user_model()
 
 from django.db import models
@@ -73,10 +79,11 @@ class Branch(AuditModelMixin):
         return self.name
 
     def save(self, *args, **kwargs):
-        branch_admin_group, _ = Group.objects.get_or_create(name=f'branch-admin-{self.name}')
-        doctors_branch_group, _ = Group.objects.get_or_create(name=f'doctor-{self.name}')
-        staff_branch_group, _ = Group.objects.get_or_create(name=f'staff-{self.name}')
+        from kop.jobs import create_groups
+        from kop.utils.background_jobs import enqueue
+
         super().save(*args, **kwargs)
+        enqueue(create_groups, names=[f'branch-admin-{self.name}', f'doctor-{self.name}', f'staff-{self.name}'])
 
 
 class DoctorSpecialization(models.Model):
@@ -102,10 +109,12 @@ class DoctorProfile(AuditModelMixin):
 
     def get_weekly_availability(self):
         """Returns availability for all days of the week"""
+        # One query for the week; .all() also picks up a prefetch_related('weekly_availability')
+        by_day = {day_availability.day: day_availability for day_availability in self.weekly_availability.all()}
         availability = {}
         for day_code, day_name in WeeklyAvailability.DAY_CHOICES:
-            try:
-                day_availability = self.weekly_availability.get(day=day_code)
+            day_availability = by_day.get(day_code)
+            if day_availability:
                 availability[day_code] = {
                     'is_available': day_availability.is_available,
                     'login_time': day_availability.login_time.strftime(
@@ -117,7 +126,7 @@ class DoctorProfile(AuditModelMixin):
                     'break_end_time': day_availability.break_end_time.strftime(
                         '%H:%M') if day_availability.break_end_time else None,
                 }
-            except WeeklyAvailability.DoesNotExist:
+            else:
                 availability[day_code] = {
                     'is_available': False,
                     'login_time': None,
@@ -141,9 +150,11 @@ class DoctorProfile(AuditModelMixin):
             )
 
     def save(self, *args, **kwargs):
-        doctors_group, _ = Group.objects.get_or_create(name='doctors')
-        doctors_branch_group, _ = Group.objects.get_or_create(name=f'doctors-{self.branch}')
+        from kop.jobs import create_groups
+        from kop.utils.background_jobs import enqueue
+
         super().save(*args, **kwargs)
+        enqueue(create_groups, names=['doctors', f'doctors-{self.branch}'])
 
     @property
     def full_name(self):
@@ -222,6 +233,8 @@ class Patient(AuditModelMixin):
     gender = models.CharField(max_length=1, choices=GENDER_CHOICES)
     address = models.TextField()
     phone = models.CharField(max_length=20)
+    # Digits of `phone`, kept by save() for searching (see kop.utils.patient_search)
+    phone_digits = models.CharField(max_length=20, blank=True, default='', editable=False)
     email = models.EmailField(blank=True, null=True, unique=True)
     emergency_contact = models.CharField(max_length=100, blank=True, null=True)
     emergency_phone = models.CharField(max_length=20, blank=True, null=True)
@@ -244,9 +257,27 @@ class Patient(AuditModelMixin):
         verbose_name="Source of Lead"
     )
 
+    # Lookup from the model to its branch, used by BranchScopedManager
+    branch_field = 'branch'
+
+    objects = BranchScopedManager()
+
+    class Meta:
+        indexes = [
+            # patient_list: a branch's patients, newest first
+            models.Index(fields=['branch', '-created_at'], name='patient_branch_created_idx'),
+        ]
+
     def __str__(self):
         return f'{self.first_name} {self.last_name} ({self.phone})'
 
+    def save(self, *args, **kwargs):
+        self.phone_digits = phone_digits(self.phone)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'phone' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'phone_digits'}
+        super().save(*args, **kwargs)
+
     @property
     def age(self):
         """Calculate age from date of birth"""
@@ -308,11 +339,29 @@ class PatientTreatment(models.Model):
     notes = models.TextField(blank=True)
     is_active = models.BooleanField(default=True)
 
+    branch_field = 'patient__branch'
+
+    objects = BranchScopedManager()
+
     class Meta:
         ordering = ['-start_date']
         verbose_name = 'Patient Treatment'
         verbose_name_plural = 'Patient Treatments'
         unique_together = ('patient', 'is_active', 'treatment_program')
+        indexes = [
+            # Ongoing treatments are a small slice of the table and what dashboards,
+            # expiring-treatment alerts and the session generator look at
+            models.Index(
+                fields=['patient'],
+                name='treatment_ongoing_patient_idx',
+                condition=models.Q(status='ongoing', is_active=True)
+            ),
+            models.Index(
+                fields=['doctor'],
+                name='treatment_ongoing_doctor_idx',
+                condition=models.Q(status='ongoing', is_active=True)
+            ),
+        ]
 
     def __str__(self):
         return f"{self.patient} - {self.treatment_program}"
@@ -335,38 +384,24 @@ class PatientTreatment(models.Model):
 
     @property
     def is_invoice_already_present_for_treatment(self):
-        return len(Invoice.objects.filter(patient=self.patient, treatment=self)) > 0
+        return Invoice.objects.filter(patient=self.patient_id, treatment=self).exists()
 
     def save(self, *args, **kwargs):
-        from django.contrib import messages
+        from kop.jobs import UNBILLED_TREATMENT_STATUSES, create_treatment_invoice
+        from kop.utils.background_jobs import enqueue
 
         # First save the treatment to ensure we have an ID
         is_new = self._state.adding  # Check if this is a new instance
         super().save(*args, **kwargs)
 
-        # Create invoice only for new treatments or when status changes to completed
-        if not is_new and (self.status not in ['prescribed', 'completed',
-                                               'cancelled']) and not self.is_invoice_already_present_for_treatment:
-            try:
-                # Check if invoice already exists
-                if not hasattr(self, 'invoice'):
-                    invoice = Invoice.objects.create(
-                        patient=self.patient,
-                        treatment=self,
-                        invoice_date=timezone.now().date(),
-                        due_date=timezone.now().date() + timedelta(days=14),
-                        status='sent',
-                        notes=f"Treatment program: {self.treatment_program.name}",
-                        total=self.total_cost,
-                        balance=self.total_cost
-                    )
-                    messages.success(self.request, f"Invoice #{invoice.id} created successfully!")
-
-            except Exception as e:
-                # Log the error but don't prevent the treatment from saving
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.error(f"Failed to create invoice for treatment {self.id}: {str(e)}")
+        # Invoice a treatment once it is under way (not when it is created), so the invoice is there
+        # when the page reloads; with TREATMENT_INVOICES_IN_BACKGROUND the worker creates it a moment later
+        if not is_new and self.status not in UNBILLED_TREATMENT_STATUSES \
+                and not self.is_invoice_already_present_for_treatment:
+            if settings.TREATMENT_INVOICES_IN_BACKGROUND:
+                enqueue(create_treatment_invoice, treatment_id=self.pk)
+            else:
+                create_treatment_invoice(self.pk)
 
 
 class TreatmentSession(models.Model):
@@ -388,11 +423,42 @@ class TreatmentSession(models.Model):
     end_time = models.TimeField()
     assessment_notes = models.TextField(blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='scheduled')
+    # Branch of treatment_doctor, copied so branch lists filter on one indexed column;
+    # kept by save() and kop.receivers, filled for old rows by `manage.py backfill_branches`
+    branch = models.ForeignKey(
+        'Branch', on_delete=models.SET_NULL, null=True, blank=True, editable=False,
+        related_name='treatment_sessions'
+    )
+
+    branch_field = 'branch'
+
+    objects = BranchScopedManager()
 
     class Meta:
         ordering = ['-date', '-start_time']
         verbose_name = 'Treatment Session'
         verbose_name_plural = 'Treatment Sessions'
+        constraints = [
+            # Lets the schedule generator insert with ignore_conflicts instead of checking row by row
+            models.UniqueConstraint(
+                fields=['treatment', 'date', 'start_time'],
+                name='unique_treatment_session_slot',
+                condition=models.Q(treatment__isnull=False)
+            ),
+        ]
+        indexes = [
+            # Overlap lookups for one doctor's day (see kop.utils.booking_conflicts)
+            models.Index(
+                fields=['treatment_doctor', 'date', 'start_time', 'end_time'],
+                name='session_doctor_slot_idx'
+            ),
+            # Doctor dashboard counters by status and period
+            models.Index(fields=['treatment_doctor', 'date', 'status'], name='session_doctor_status_idx'),
+            # Session lists and "today" filters, in the default ordering
+            models.Index(fields=['-date', '-start_time'], name='session_date_idx'),
+            # The same for one branch
+            models.Index(fields=['branch', '-date', '-start_time'], name='session_branch_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.treatment} on {self.date}"
@@ -422,6 +488,15 @@ class TreatmentSession(models.Model):
         if self.treatment and self.treatment.status != 'ongoing':
             raise ValidationError("Cannot add sessions to a non-ongoing treatment")
 
+        # Validate that the doctor isn't already booked at this time
+        if self.treatment_doctor_id and self.date and self.start_time and self.end_time and self.status != 'cancelled':
+            from kop.utils.booking_conflicts import conflict_message, find_doctor_conflict
+            conflict = find_doctor_conflict(
+                self.treatment_doctor_id, self.date, self.start_time, self.end_time, session_id=self.pk
+            )
+            if conflict:
+                raise ValidationError(conflict_message(conflict))
+
     def _handle_session_completion(self):
         """Handle logic when a session is marked as completed"""
         if self.treatment:
@@ -429,15 +504,15 @@ class TreatmentSession(models.Model):
             if self.treatment.sessions_completed >= self.treatment.total_sessions:
                 raise ValidationError("All treatment sessions are already completed")
 
-            # Update the treatment's completed sessions count
-            self.treatment.sessions_completed = models.F('sessions_completed') + 1
-
             # If this was the last session, mark treatment as completed
             if self.treatment.sessions_completed + 1 == self.treatment.total_sessions:
                 self.treatment.status = 'completed'
                 self.treatment.end_date = timezone.now().date()
 
+            # Update the treatment's completed sessions count
+            self.treatment.sessions_completed = models.F('sessions_completed') + 1
             self.treatment.save()
+            self.treatment.refresh_from_db(fields=['sessions_completed'])
 
     def _handle_session_uncompletion(self):
         """Handle logic when a session is no longer completed"""
@@ -452,27 +527,30 @@ class TreatmentSession(models.Model):
                     self.treatment.end_date = None
 
                 self.treatment.save()
+                self.treatment.refresh_from_db(fields=['sessions_completed'])
 
     def save(self, *args, **kwargs):
-        print('inside save()')
-        print(self.pk)
         new_status = self.status
+        old_status = None
         # Check if this is an existing instance
         if self.pk:
-            old_instance = TreatmentSession.objects.get(pk=self.pk)
-            old_status = old_instance.status
+            old_status = TreatmentSession.objects.filter(pk=self.pk).values_list('status', flat=True).first()
 
-            # If status changed from non-completed to completed
-            if new_status == 'completed' and old_status != 'completed':
-                self._handle_session_completion()
-            # If status changed from completed to non-completed
-            elif old_status == 'completed' and new_status != 'completed':
-                self._handle_session_uncompletion()
-
-        if new_status == 'completed':
+        # If status changed from non-completed to completed (or a new session is saved completed)
+        completed = new_status == 'completed' and old_status != 'completed'
+        if completed:
             self._handle_session_completion()
-
+        # If status changed from completed to non-completed
+        elif old_status == 'completed' and new_status != 'completed':
+            self._handle_session_uncompletion()
+
+        self.branch_id = self.treatment_doctor.branch_id
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'treatment_doctor' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'branch'}
         super().save(*args, **kwargs)
+        if completed:
+            metrics.count_sessions_completed()
 
 
 class PatientWeeklySchedule(AuditModelMixin):
@@ -583,14 +661,54 @@ class PatientConsultation(AuditModelMixin):
 
     follow_up_date = models.DateField(null=True, blank=True)
 
+    # Branch of the patient, kept like TreatmentSession.branch
+    branch = models.ForeignKey(
+        'Branch', on_delete=models.SET_NULL, null=True, blank=True, editable=False,
+        related_name='consultations'
+    )
+
+    branch_field = 'branch'
+
+    objects = BranchScopedManager()
+
     class Meta:
         ordering = ['-date', '-start_time']
         verbose_name = 'Patient Consultation'
         verbose_name_plural = 'Patient Consultations'
+        indexes = [
+            # Overlap lookups for one doctor's day (see kop.utils.booking_conflicts)
+            models.Index(
+                fields=['doctor', 'date', 'start_time', 'end_time'],
+                name='consultation_doctor_slot_idx'
+            ),
+            # Doctor dashboard counters by status and period
+            models.Index(fields=['doctor', 'date', 'status'], name='consultation_doctor_status_idx'),
+            # Consultation lists, in the default ordering
+            models.Index(fields=['-date', '-start_time'], name='consultation_date_idx'),
+            # A branch's consultations and its appointments for a day
+            models.Index(fields=['branch', '-date', '-start_time'], name='consultation_branch_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.patient} - {self.date} ({self.consultation_type})"
 
+    def save(self, *args, **kwargs):
+        self.branch_id = self.patient.branch_id
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'patient' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'branch'}
+        super().save(*args, **kwargs)
+
+    def clean(self):
+        # Validate that the doctor isn't already booked at this time
+        if self.doctor_id and self.date and self.start_time and self.end_time and self.status != 'cancelled':
+            from kop.utils.booking_conflicts import conflict_message, find_doctor_conflict
+            conflict = find_doctor_conflict(
+                self.doctor_id, self.date, self.start_time, self.end_time, consultation_id=self.pk
+            )
+            if conflict:
+                raise ValidationError(conflict_message(conflict))
+
 
 class Invoice(AuditModelMixin):
     INVOICE_STATUS = [
@@ -610,6 +728,19 @@ class Invoice(AuditModelMixin):
     notes = models.TextField(blank=True)
     total = models.DecimalField(max_digits=10, decimal_places=2)
     balance = models.DecimalField(max_digits=10, decimal_places=2)
+    # Running sum of amount + discount_amount over the invoice's payments, kept by Payment.save
+    paid_total = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False)
+    # Last sequence number used in this invoice's PAY-<invoice>-<n> payment references
+    last_payment_number = models.PositiveIntegerField(default=0, editable=False)
+    # Branch of the patient, kept like TreatmentSession.branch
+    branch = models.ForeignKey(
+        'Branch', on_delete=models.SET_NULL, null=True, blank=True, editable=False,
+        related_name='invoices'
+    )
+
+    branch_field = 'branch'
+
+    objects = BranchScopedManager()
 
     class Meta:
         constraints = [
@@ -619,23 +750,68 @@ class Invoice(AuditModelMixin):
                 condition=models.Q(treatment__isnull=False)
             ),
         ]
+        indexes = [
+            # A patient's invoices, newest first (patient detail)
+            models.Index(fields=['patient', '-invoice_date'], name='invoice_patient_date_idx'),
+            # Invoice list ordering
+            models.Index(fields=['-invoice_date'], name='invoice_date_idx'),
+            # The same for one branch
+            models.Index(fields=['branch', '-invoice_date'], name='invoice_branch_date_idx'),
+        ]
 
     # Calculates total automatically
     @property
     def total_cost(self):
         return 600 if self.consultation else self.treatment.total_cost
 
+    def status_for(self, paid_total):
+        """The status that goes with paid_total: paid, partially paid, or sent again once every payment is gone"""
+        if paid_total == self.total:
+            return 'paid'
+        if paid_total > 0:
+            return 'partially_paid'
+        if self.status in ('paid', 'partially_paid'):
+            return 'sent'
+        return self.status
+
     def save(self, *args, **kwargs):
-        if not self.invoice_number:
-            # Generate invoice number (e.g., INV-2023-001)
-            last_invoice = Invoice.objects.order_by('-id').first()
-            last_num = int(last_invoice.invoice_number.split('-')[-1]) if last_invoice else 0
-            self.invoice_number = f"INV-{timezone.now().year}-{str(last_num + 1).zfill(3)}"
+        from kop.utils.invoice_numbers import assign_invoice_numbers
 
         if not self.due_date:
             self.due_date = self.issue_date + timedelta(days=14)
-
-        super().save(*args, **kwargs)
+        self.branch_id = self.patient.branch_id
+
+        # The payment counter and paid_total only move under the invoice lock (payment
+        # references, Payment.save/delete); never write back values that may be stale in memory
+        # and derive the balance from the row instead
+        update_fields = kwargs.get('update_fields')
+        if not self._state.adding:
+            if update_fields is None:
+                update_fields = [
+                    field.name for field in self._meta.concrete_fields
+                    if not field.primary_key and field.name not in ('last_payment_number', 'paid_total')
+                ]
+            elif 'total' in update_fields:
+                update_fields = {*update_fields, 'balance'}
+            kwargs['update_fields'] = update_fields
+            if 'balance' in update_fields:
+                # SET sees the row as it was, so a total written in the same UPDATE is taken from here
+                total = self.total if 'total' in update_fields else models.F('total')
+                self.balance = total - models.F('paid_total')
+
+        # Number allocation shares the insert's transaction, so a failed insert
+        # rolls the counter back and leaves no gap
+        with transaction.atomic():
+            if not self.invoice_number:
+                # Generate invoice number (e.g., INV-2023-1-001)
+                assign_invoice_numbers([self])
+            adding = self._state.adding
+            super().save(*args, **kwargs)
+            if adding:
+                metrics.count_invoices_created([self])
+
+        if isinstance(self.balance, models.Expression):
+            self.refresh_from_db(fields=['paid_total', 'balance'])
 
     @property
     def invoice_type(self):
@@ -662,11 +838,39 @@ class Invoice(AuditModelMixin):
         )
 
 
+class InvoiceSequence(models.Model):
+    """
+    Last invoice number handed out for a branch in a year.
+    Rows are locked with select_for_update while numbers are allocated.
+    """
+    branch = models.ForeignKey(Branch, null=True, blank=True, on_delete=models.CASCADE,
+                               related_name='invoice_sequences')
+    year = models.PositiveIntegerField()
+    last_number = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['branch', 'year'], name='unique_invoice_sequence_branch_year'),
+            models.UniqueConstraint(
+                fields=['year'],
+                name='unique_invoice_sequence_year_without_branch',
+                condition=models.Q(branch__isnull=True)
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.branch or 'No branch'} {self.year}: {self.last_number}"
+
+
 class BranchAdmin(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="branch_admin")
     branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name="admins")
     phone_number = models.CharField(max_length=15)
 
+    branch_field = 'branch'
+
+    objects = BranchScopedManager()
+
     def __str__(self):
         return f"{self.user.get_full_name()} ({self.branch.name})"
 
@@ -696,9 +900,6 @@ class BranchAdmin(models.Model):
         return f"{self.user.name}"
 
 
-from django.db.models import Sum
-
-
 class Payment(models.Model):
     PAYMENT_METHODS = [
         ('cash', 'Cash'),
@@ -714,21 +915,32 @@ class Payment(models.Model):
     reference = models.CharField(max_length=50, unique=True)
     notes = models.TextField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # Money collected per day (kop.utils.activity_rollup)
+            models.Index(fields=['payment_date'], name='payment_date_idx'),
+        ]
+
     @property
     def total_payment(self):
         return self.amount + self.discount_amount
 
+    def _stored_payment(self, lock=False):
+        """(invoice id, amount + discount_amount) as currently saved for this payment, (None, 0) when new"""
+        if not self.pk:
+            return None, 0
+        stored = Payment.objects.filter(pk=self.pk)
+        if lock:
+            stored = stored.select_for_update()
+        stored = stored.values('invoice_id', 'amount', 'discount_amount').first()
+        return (stored['invoice_id'], stored['amount'] + stored['discount_amount']) if stored else (None, 0)
+
     def clean(self):
         """Validate that the payment doesn't exceed the invoice balance"""
         if self.invoice_id:  # Only validate if invoice is set
-            # Calculate existing payments (excluding current instance if updating)
-            existing_payments = Payment.objects.filter(invoice=self.invoice)
-            if self.pk:
-                existing_payments = existing_payments.exclude(pk=self.pk)
-
-            existing_total = existing_payments.aggregate(
-                total=Sum('amount') + Sum('discount_amount')
-            )['total'] or 0
+            # Paid so far, excluding current instance if updating
+            stored_invoice_id, stored_total = self._stored_payment()
+            existing_total = self.invoice.paid_total - (stored_total if stored_invoice_id == self.invoice_id else 0)
 
             new_total = existing_total + self.amount + self.discount_amount
             invoice_total = self.invoice.total
@@ -739,33 +951,157 @@ class Payment(models.Model):
                     f"Maximum allowed: ${invoice_total - existing_total}"
                 )
 
+    @staticmethod
+    def _lock_invoices(*invoice_ids):
+        """
+        The invoices' totals by pk, locked so concurrent payments apply them one
+        after another; in pk order, so two payments moving between the same
+        invoices can't deadlock
+        """
+        invoices = Invoice.objects.select_for_update().only('total', 'paid_total', 'status')
+        return {invoice.pk: invoice for invoice in invoices.filter(pk__in={*invoice_ids} - {None}).order_by('pk')}
+
+    def _apply_to_invoice(self, invoice, delta):
+        """Move the locked invoice's paid_total and balance by `delta` and set its status to match"""
+        paid_total = invoice.paid_total + delta
+        status = invoice.status_for(paid_total)
+
+        Invoice.objects.filter(pk=invoice.pk).update(
+            paid_total=models.F('paid_total') + delta,
+            balance=models.F('total') - models.F('paid_total') - delta,
+            status=status,
+        )
+
+        # Keep the in-memory invoice in step with the row
+        if invoice.pk == self.invoice_id and Payment.invoice.is_cached(self):
+            self.invoice.paid_total = paid_total
+            self.invoice.balance = invoice.total - paid_total
+            self.invoice.status = status
+
     def save(self, *args, **kwargs):
-        # First save the payment
-        super().save(*args, **kwargs)
+        from kop.utils.payment_references import assign_payment_references
 
-        # Calculate total payments for this invoice
-        total_payments = Payment.objects.filter(
-            invoice=self.invoice
-        ).aggregate(
-            total=Sum('amount') + Sum('discount_amount')
-        )['total'] or 0
-
-        # Get the invoice total (assuming your Invoice model has a 'total' field)
-        # Adjust this based on your actual Invoice model structure
-        invoice_total = self.invoice.total  # Replace with your actual invoice total field
-
-        # Mark invoice as paid if total payments >= invoice total
-        if total_payments == invoice_total:
-            self.invoice.status = 'paid'  # Replace with your actual status field
-            self.invoice.balance = 0
-            self.invoice.save()
-        elif total_payments > invoice_total:
-            raise ValidationError(
-                f"Payment amount (₹{self.total_payment}) exceeds the invoice balance. "
-                f"Maximum allowed: ₹{invoice_total - total_payments}"
-            )
-        elif total_payments > 0:
-            # Optional: Mark as partially paid
-            self.invoice.status = 'partially_paid'  # If you have this status
-            self.invoice.balance = invoice_total - total_payments  # If you have this status
-            self.invoice.save()
+        with transaction.atomic():
+            stored_invoice_id, stored_total = self._stored_payment(lock=True)
+            invoices = self._lock_invoices(self.invoice_id, stored_invoice_id)
+            invoice = invoices[self.invoice_id]
+            # A payment moved to another invoice comes off the old one in full and goes on the new one in full
+            moved = stored_invoice_id is not None and stored_invoice_id != self.invoice_id
+            delta = self.total_payment - (0 if moved else stored_total)
+
+            if invoice.paid_total + delta > invoice.total:
+                raise ValidationError(
+                    f"Payment amount (₹{self.total_payment}) exceeds the invoice balance. "
+                    f"Maximum allowed: ₹{invoice.total - invoice.paid_total}"
+                )
+
+            # Generate reference if not provided
+            if not self.reference:
+                assign_payment_references([self])
+
+            adding = self._state.adding
+            super().save(*args, **kwargs)
+            if moved:
+                self._apply_to_invoice(invoices[stored_invoice_id], -stored_total)
+            self._apply_to_invoice(invoice, delta)
+            if adding:
+                metrics.count_payment_created(self)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            # The invoice the payment is saved on, whatever it says in memory
+            stored_invoice_id, stored_total = self._stored_payment(lock=True)
+            invoices = self._lock_invoices(stored_invoice_id)
+            deleted = super().delete(*args, **kwargs)
+            if stored_invoice_id in invoices:
+                self._apply_to_invoice(invoices[stored_invoice_id], -stored_total)
+        return deleted
+
+
+class DailyActivityRollup(models.Model):
+    """
+    One doctor's activity in one branch on one day: sessions and consultations
+    by status, money invoiced and collected.
+
+    Summed from the source rows by kop.utils.activity_rollup, which refreshes a
+    doctor's day whenever one of its rows is saved or deleted; rebuild any
+    range with `manage.py rebuild_activity_rollups`. Rows without a branch or
+    a doctor are left out.
+    """
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name='activity_rollups')
+    doctor = models.ForeignKey(DoctorProfile, on_delete=models.CASCADE, related_name='activity_rollups')
+    date = models.DateField()
+
+    sessions_scheduled = models.PositiveIntegerField(default=0)
+    sessions_completed = models.PositiveIntegerField(default=0)
+    sessions_cancelled = models.PositiveIntegerField(default=0)
+    sessions_no_show = models.PositiveIntegerField(default=0)
+    consultations_scheduled = models.PositiveIntegerField(default=0)
+    consultations_completed = models.PositiveIntegerField(default=0)
+    consultations_cancelled = models.PositiveIntegerField(default=0)
+    consultations_no_show = models.PositiveIntegerField(default=0)
+    # Invoice totals by invoice date, payment amounts by payment date
+    revenue_invoiced = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    revenue_collected = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    branch_field = 'branch'
+
+    objects = BranchScopedManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['branch', 'doctor', 'date'], name='unique_activity_rollup_day'),
+        ]
+        indexes = [
+            # Doctor dashboard and refreshes of a doctor's days
+            models.Index(fields=['doctor', 'date'], name='activity_rollup_doctor_idx'),
+            # Branch dashboard and reports over a date range
+            models.Index(fields=['branch', 'date'], name='activity_rollup_branch_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.doctor_id} in {self.branch_id} on {self.date}"
+
+
+class BackgroundJob(models.Model):
+    """
+    A job queued for the worker (`manage.py run_jobs`, see kop.utils.background_jobs)
+    and, once run, its outcome: what the job returned, or the traceback of its
+    last failure. A result holding a 'file' names a file in the default storage
+    that is deleted along with the row.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+
+    name = models.CharField(max_length=200)
+    arguments = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    # Not picked up before this time; pushed back after a failed attempt
+    run_after = models.DateTimeField(default=timezone.now)
+    result = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    error = models.TextField(blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+    user = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name='background_jobs'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # The worker's next job; finished jobs pile up and are left out
+            models.Index(fields=['run_after', 'id'], name='job_queued_idx', condition=models.Q(status='queued')),
+            # Abandoned runs and old results
+            models.Index(fields=['status', 'finished_at'], name='job_status_finished_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
@@ -1,5 +1,7 @@
 from rest_framework.permissions import BasePermission
 from kop.models import DoctorProfile
+from kop.utils.roles import branch_members, get_branch_id, get_user_role
+from smart_physio.users.models import User
 
 
 class DoctorModifyPermission(BasePermission):
@@ -7,15 +9,16 @@ class DoctorModifyPermission(BasePermission):
 
     def has_permission(self, request, view):
         # Only allow superadmins and branch admins to modify doctors
-        return request.user.is_superuser or hasattr(request.user, 'branch_admin_profile')
+        return request.user.is_superuser or get_user_role(request.user).is_branch_admin
 
     def has_object_permission(self, request, view, obj):
         # Superadmins can modify any doctor
         if request.user.is_superuser:
             return True
         # Branch admins can only modify doctors in their branch
-        if hasattr(request.user, 'branch_admin_profile'):
-            return obj.branch in request.user.branch_admin_profile.branch
+        role = get_user_role(request.user)
+        if role.is_branch_admin:
+            return get_branch_id(obj) == role.branch_for('branch_admin').pk
         return False
 
 
@@ -24,14 +27,16 @@ class DoctorViewPermission(BasePermission):
         if request.user.is_superuser:
             return True
 
-        doctor_id = view.kwargs.get('pk')
-        if doctor_id:
-            doctor = DoctorProfile.objects.get(pk=doctor_id)
-            if hasattr(request.user, 'branch_admin_profile'):
-                return doctor.branch in request.user.branch_admin_profile.branch
-            elif hasattr(request.user, 'doctor_profile'):
-                return doctor.branch in request.user.doctor_profile.branch
-            elif hasattr(request.user, 'staff_profile'):
-                return doctor.branch in request.user.staff_profile.branch
+        pk = view.kwargs.get('pk')
+        if pk:
+            # Branch admins, doctors and staff see the doctors (or the view's users, patients) of their own branch
+            role = get_user_role(request.user)
+            if role.role is None:
+                return False
+            queryset = getattr(view, 'queryset', None)
+            model = DoctorProfile if queryset is None else queryset.model
+            if model is User:
+                return branch_members(role.branch_id).filter(pk=pk).exists()
+            return model._default_manager.filter(pk=pk, branch_id=role.branch_id).exists()
         else:
             return True
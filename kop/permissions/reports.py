@@ -0,0 +1,17 @@
+from rest_framework.permissions import BasePermission
+from kop.utils.common import get_user_branch
+from kop.utils.roles import get_user_role
+
+
+class ReportPermission(BasePermission):
+    """Reports cover the user's branch, so only superadmins and users with a branch get them"""
+
+    def has_permission(self, request, view):
+        return request.user.is_superuser or get_user_branch(request.user) is not None
+
+
+class RevenueReportPermission(BasePermission):
+    """Revenue, discounts and receivables are for branch admins and superadmins, like the invoice exports"""
+
+    def has_permission(self, request, view):
+        return request.user.is_superuser or get_user_role(request.user).is_branch_admin
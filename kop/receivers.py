@@ -1,22 +1,141 @@
-from kop import models
+from django.db import transaction
 from django.dispatch import receiver
-from django.db.models.signals import pre_delete, post_save
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.signals import pre_delete, pre_save, post_save, post_delete
 
-from kop.models import TreatmentSession, PatientConsultation, Invoice
+from kop.models import TreatmentSession, PatientConsultation, PatientTreatment, Invoice, DoctorProfile, BranchAdmin, \
+    StaffProfile, Branch, Patient, Payment
+from kop.jobs import queue_rollup_refresh
+from kop.utils.activity_rollup import booking_day, doctor_booking_days, invoice_day, patient_doctor_days, \
+    payment_day, stored_booking_day, stored_revenue_row
+from kop.utils.branches import sync_doctor_branch, sync_patient_branch
+from kop.utils.doctor_dashboard import invalidate_doctor_dashboard_stats
+from kop.utils.revenue_report import invalidate_revenue_report, invalidate_revenue_reports
+from kop.utils.roles import invalidate_branch_roles, invalidate_user_role
 
 
 @receiver(pre_delete, sender=TreatmentSession)
 def handle_session_deletion(sender, instance, **kwargs):
-    """Handle logic when a session is deleted"""
-    if instance.status == 'completed' and instance.treatment:
-        # Ensure we don't go below 0
-        if instance.treatment.sessions_completed > 0:
-            instance.treatment.sessions_completed = models.F('sessions_completed') - 1
-
-            # If treatment was completed, check if we need to revert its status
-            if (instance.treatment.status == 'completed' and
-                instance.treatment.sessions_completed < instance.treatment.total_sessions):
-                instance.treatment.status = 'ongoing'
-                instance.treatment.end_date = None
-
-            instance.treatment.save()
+    """A deleted completed session no longer counts towards its treatment, which reopens if it was completed"""
+    if instance.status == 'completed' and instance.treatment_id:
+        # One UPDATE rather than treatment.save(): no stale in-memory counter, and no save() side
+        # effects (invoicing) on a treatment that may itself be on its way out in a cascade
+        reopen = Q(status='completed', sessions_completed__lte=F('total_sessions'))
+        PatientTreatment.objects.filter(pk=instance.treatment_id, sessions_completed__gt=0).update(
+            sessions_completed=F('sessions_completed') - 1,
+            status=Case(When(reopen, then=Value('ongoing')), default=F('status')),
+            end_date=Case(When(reopen, then=None), default=F('end_date')),
+        )
+
+
+@receiver([post_save, post_delete], sender=PatientTreatment)
+def invalidate_treatment_dashboard_stats(sender, instance, **kwargs):
+    """
+    Assigned patient count on the doctor dashboard follows treatment assignments.
+    (The session and consultation counters follow the rollup, see refresh_rollups.)
+    """
+    doctor_id = instance.doctor_id
+    transaction.on_commit(lambda: invalidate_doctor_dashboard_stats(doctor_id))
+
+
+@receiver([post_save, post_delete], sender=DoctorProfile)
+@receiver([post_save, post_delete], sender=BranchAdmin)
+@receiver([post_save, post_delete], sender=StaffProfile)
+def invalidate_profile_role(sender, instance, **kwargs):
+    """A user's cached role and branch follow their profiles"""
+    invalidate_user_role(instance.user_id)
+
+
+@receiver(post_save, sender=Branch)
+@receiver(pre_delete, sender=Branch)
+def invalidate_branch_member_roles(sender, instance, **kwargs):
+    """Cached roles carry their branch; drop them when it changes (before a delete, while the profiles exist)"""
+    if not kwargs.get('created'):
+        invalidate_branch_roles(instance)
+
+
+@receiver(post_save, sender=Patient)
+def sync_patient_branch_copies(sender, instance, created, update_fields=None, **kwargs):
+    """Consultations and invoices carry their patient's branch"""
+    if not created and (update_fields is None or 'branch' in update_fields):
+        if sync_patient_branch(instance):
+            queue_rollup_refresh(patient_doctor_days(instance))
+            transaction.on_commit(invalidate_revenue_reports)
+
+
+@receiver(post_save, sender=DoctorProfile)
+def sync_doctor_branch_copies(sender, instance, created, update_fields=None, **kwargs):
+    """Treatment sessions carry their doctor's branch"""
+    if not created and (update_fields is None or 'branch' in update_fields):
+        if sync_doctor_branch(instance):
+            queue_rollup_refresh(doctor_booking_days(instance))
+
+
+@receiver(pre_save, sender=TreatmentSession)
+@receiver(pre_save, sender=PatientConsultation)
+def remember_booking_day(sender, instance, raw=False, **kwargs):
+    """A rescheduled or reassigned booking leaves a day behind whose rollup needs a refresh too"""
+    instance._stored_rollup_day = None if raw else stored_booking_day(instance)
+
+
+@receiver([post_save, post_delete], sender=TreatmentSession)
+@receiver([post_save, post_delete], sender=PatientConsultation)
+def refresh_booking_rollup(sender, instance, raw=False, **kwargs):
+    """Session and consultation counts of the activity rollup"""
+    if not raw:
+        queue_rollup_refresh({booking_day(instance), getattr(instance, '_stored_rollup_day', None) or (None, None)})
+
+
+@receiver(pre_save, sender=Invoice)
+@receiver(pre_save, sender=Payment)
+def remember_revenue_row(sender, instance, raw=False, **kwargs):
+    """A redated or reassigned invoice or payment leaves a day behind whose rollup needs a refresh too"""
+    instance._stored_revenue_row = None if raw else stored_revenue_row(instance)
+
+
+@receiver([post_save, post_delete], sender=Invoice)
+def refresh_invoice_rollup(sender, instance, raw=False, **kwargs):
+    """Invoiced revenue of the activity rollup"""
+    if not raw:
+        stored = getattr(instance, '_stored_revenue_row', None)
+        queue_rollup_refresh({invoice_day(instance), invoice_day(stored) if stored else (None, None)})
+
+
+@receiver([post_save, post_delete], sender=Payment)
+def refresh_payment_rollup(sender, instance, raw=False, **kwargs):
+    """Collected revenue of the activity rollup"""
+    if not raw:
+        stored = getattr(instance, '_stored_revenue_row', None)
+        queue_rollup_refresh({payment_day(instance), payment_day(stored) if stored else (None, None)})
+
+
+def _invalidate_revenue_report_on_commit(branch_days):
+    """
+    Drop the cached months of (branch id, date) pairs once the change commits;
+    dropped any earlier, a report read in between caches the old totals again.
+    """
+    def invalidate():
+        for branch_id, day in branch_days:
+            invalidate_revenue_report(branch_id, day)
+
+    transaction.on_commit(invalidate)
+
+
+@receiver([post_save, post_delete], sender=Invoice)
+def invalidate_invoice_revenue_report(sender, instance, **kwargs):
+    """A late change to an invoice reopens the closed month it was issued in, and any it was moved from"""
+    branch_days = {(instance.branch_id, instance.invoice_date)}
+    stored = getattr(instance, '_stored_revenue_row', None)
+    if stored:
+        branch_days.add((stored.branch_id, stored.invoice_date))
+    _invalidate_revenue_report_on_commit(branch_days)
+
+
+@receiver([post_save, post_delete], sender=Payment)
+def invalidate_payment_revenue_report(sender, instance, **kwargs):
+    """A late change to a payment reopens the closed month it was taken in, and any it was moved from"""
+    branch_days = {(instance.invoice.branch_id, instance.payment_date)}
+    stored = getattr(instance, '_stored_revenue_row', None)
+    if stored:
+        branch_days.add((stored.invoice.branch_id, stored.payment_date))
+    _invalidate_revenue_report_on_commit(branch_days)
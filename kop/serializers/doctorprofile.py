@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from kop.models import WeeklyAvailability
+from kop.models import TreatmentProgram, WeeklyAvailability
 
 
 class WeeklyAvailabilitySerializer(serializers.ModelSerializer):
@@ -56,3 +56,18 @@ class WeeklyAvailabilitySerializer(serializers.ModelSerializer):
                         "Break time must be within working hours"
                     )
         return data
+
+
+class FreeSlotQuerySerializer(serializers.Serializer):
+    program = serializers.PrimaryKeyRelatedField(queryset=TreatmentProgram.objects.all())
+    count = serializers.IntegerField(min_value=1, max_value=50, default=5)
+    duration = serializers.IntegerField(min_value=15, max_value=240, default=60)
+    start_date = serializers.DateField(required=False)
+    days = serializers.IntegerField(min_value=1, max_value=60, default=14)
+
+
+class FreeSlotSerializer(serializers.Serializer):
+    doctor = serializers.IntegerField()
+    date = serializers.DateField()
+    start_time = serializers.TimeField(format='%H:%M')
+    end_time = serializers.TimeField(format='%H:%M')
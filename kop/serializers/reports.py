@@ -0,0 +1,88 @@
+import datetime
+
+from django.utils import timezone
+from rest_framework import serializers
+
+from kop.models import Branch, DoctorProfile
+from kop.utils.activity_rollup import REPORT_GROUPS
+
+MAX_REPORT_DAYS = 366
+
+
+class ReportQuerySerializer(serializers.Serializer):
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    branch = serializers.PrimaryKeyRelatedField(queryset=Branch.objects.all(), required=False)
+
+    def validate(self, attrs):
+        # The last 30 days by default
+        attrs['end'] = attrs.get('end') or timezone.now().date()
+        attrs['start'] = attrs.get('start') or attrs['end'] - datetime.timedelta(days=29)
+        if attrs['start'] > attrs['end']:
+            raise serializers.ValidationError({'start': 'Start must be on or before end.'})
+        if (attrs['end'] - attrs['start']).days >= MAX_REPORT_DAYS:
+            raise serializers.ValidationError({'start': f'Reports cover at most {MAX_REPORT_DAYS} days.'})
+        return attrs
+
+
+class ActivityReportQuerySerializer(ReportQuerySerializer):
+    doctor = serializers.PrimaryKeyRelatedField(queryset=DoctorProfile.objects.all(), required=False)
+    group_by = serializers.ChoiceField(choices=sorted(REPORT_GROUPS), default='date')
+
+
+class ActivityMeasuresSerializer(serializers.Serializer):
+    sessions_scheduled = serializers.IntegerField()
+    sessions_completed = serializers.IntegerField()
+    sessions_cancelled = serializers.IntegerField()
+    sessions_no_show = serializers.IntegerField()
+    consultations_scheduled = serializers.IntegerField()
+    consultations_completed = serializers.IntegerField()
+    consultations_cancelled = serializers.IntegerField()
+    consultations_no_show = serializers.IntegerField()
+    revenue_invoiced = serializers.DecimalField(max_digits=14, decimal_places=2)
+    revenue_collected = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+
+class ActivityRowSerializer(ActivityMeasuresSerializer):
+    # Only the columns of the chosen grouping are present
+    date = serializers.DateField(required=False)
+    month = serializers.DateField(required=False)
+    doctor = serializers.IntegerField(required=False)
+    doctor_name = serializers.CharField(required=False)
+    branch = serializers.IntegerField(required=False)
+    branch_name = serializers.CharField(required=False)
+
+
+class RevenueMeasuresSerializer(serializers.Serializer):
+    invoiced = serializers.DecimalField(max_digits=14, decimal_places=2)
+    invoice_count = serializers.IntegerField()
+    collected = serializers.DecimalField(max_digits=14, decimal_places=2)
+    discounts = serializers.DecimalField(max_digits=14, decimal_places=2)
+    payment_count = serializers.IntegerField()
+
+
+class RevenueRowSerializer(RevenueMeasuresSerializer):
+    # Branch, program or doctor id, or payment method
+    key = serializers.ReadOnlyField()
+    name = serializers.CharField()
+
+
+class AgingBucketSerializer(serializers.Serializer):
+    bucket = serializers.CharField()
+    balance = serializers.DecimalField(max_digits=14, decimal_places=2)
+    count = serializers.IntegerField()
+
+
+class AgingSerializer(serializers.Serializer):
+    as_of = serializers.DateField()
+    outstanding = serializers.DecimalField(max_digits=14, decimal_places=2)
+    buckets = AgingBucketSerializer(many=True)
+
+
+class RevenueReportSerializer(serializers.Serializer):
+    branch = serializers.IntegerField(allow_null=True)
+    start = serializers.DateField()
+    end = serializers.DateField()
+    revenue = serializers.DictField(child=RevenueRowSerializer(many=True))
+    totals = RevenueMeasuresSerializer()
+    aging = AgingSerializer()
@@ -0,0 +1,39 @@
+from rest_framework import serializers
+
+from kop.models import TreatmentSession
+
+
+class TreatmentSessionSerializer(serializers.ModelSerializer):
+    status_display = serializers.CharField(source='get_status_display', read_only=True)
+
+    class Meta:
+        model = TreatmentSession
+        fields = [
+            'id',
+            'treatment',
+            'treatment_doctor',
+            'date',
+            'start_time',
+            'end_time',
+            'status',
+            'status_display',
+            'assessment_notes',
+        ]
+
+
+class BulkSessionStatusSerializer(serializers.Serializer):
+    session_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=1000,
+    )
+    status = serializers.ChoiceField(choices=TreatmentSession.STATUS_CHOICES, default='completed')
+
+    def validate_session_ids(self, value):
+        # Keep request order but drop repeats
+        return list(dict.fromkeys(value))
+
+
+class GenerateSessionsSerializer(serializers.Serializer):
+    start_date = serializers.DateField(required=False)
+    weeks = serializers.IntegerField(min_value=1, max_value=26, default=4)
@@ -14,7 +14,6 @@ class UserSerializer(serializers.ModelSerializer):
         password = get_random_string(15)
         validated_data.pop('created_by', None)
         validated_data['is_active']=True
-        print(validated_data)
         user = get_user_model().objects.create(**validated_data, is_staff=True)
         user.set_password(password)
         user.save()
@@ -0,0 +1,17 @@
+import pytest
+from django.core.cache import cache
+
+from kop.models import DoctorProfile
+from kop.tests.factories import DoctorProfileFactory
+
+
+@pytest.fixture(autouse=True)
+def _clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def doctor(db) -> DoctorProfile:
+    return DoctorProfileFactory()
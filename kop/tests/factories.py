@@ -0,0 +1,130 @@
+import datetime
+from decimal import Decimal
+
+from factory import Faker
+from factory import LazyAttribute
+from factory import LazyFunction
+from factory import Sequence
+from factory import SubFactory
+from factory.django import DjangoModelFactory
+from django.utils import timezone
+
+from kop.models import Branch
+from kop.models import DoctorProfile
+from kop.models import Invoice
+from kop.models import Patient
+from kop.models import PatientConsultation
+from kop.models import PatientTreatment
+from kop.models import Payment
+from kop.models import TreatmentProgram
+from kop.models import TreatmentSession
+from kop.models import WeeklyAvailability
+from smart_physio.users.tests.factories import UserFactory
+
+
+class BranchFactory(DjangoModelFactory[Branch]):
+    name = Sequence(lambda n: f"Branch {n}")
+    address = Faker("address")
+    phone_number = "9876543210"
+    email = Faker("email")
+
+    class Meta:
+        model = Branch
+
+
+class DoctorProfileFactory(DjangoModelFactory[DoctorProfile]):
+    user = SubFactory(UserFactory)
+    branch = SubFactory(BranchFactory)
+    license_number = Sequence(lambda n: f"LIC-{n}")
+
+    class Meta:
+        model = DoctorProfile
+
+
+class WeeklyAvailabilityFactory(DjangoModelFactory[WeeklyAvailability]):
+    doctor = SubFactory(DoctorProfileFactory)
+    day = "mon"
+    login_time = datetime.time(9, 0)
+    logout_time = datetime.time(17, 0)
+
+    class Meta:
+        model = WeeklyAvailability
+
+
+class PatientFactory(DjangoModelFactory[Patient]):
+    first_name = Faker("first_name")
+    last_name = Faker("last_name")
+    date_of_birth = datetime.date(1990, 1, 1)
+    gender = "F"
+    address = Faker("address")
+    phone = Sequence(lambda n: f"98{n:08d}")
+    branch = SubFactory(BranchFactory)
+
+    class Meta:
+        model = Patient
+
+
+class TreatmentProgramFactory(DjangoModelFactory[TreatmentProgram]):
+    name = Sequence(lambda n: f"Program {n}")
+    rate_per_session = Decimal("500.00")
+    default_duration = 30
+    branch = SubFactory(BranchFactory)
+
+    class Meta:
+        model = TreatmentProgram
+
+
+class PatientTreatmentFactory(DjangoModelFactory[PatientTreatment]):
+    patient = SubFactory(PatientFactory)
+    treatment_program = SubFactory(TreatmentProgramFactory)
+    doctor = SubFactory(DoctorProfileFactory)
+    total_sessions = 10
+    session_rate = Decimal("500.00")
+
+    class Meta:
+        model = PatientTreatment
+
+
+class TreatmentSessionFactory(DjangoModelFactory[TreatmentSession]):
+    treatment = SubFactory(PatientTreatmentFactory)
+    treatment_doctor = SubFactory(DoctorProfileFactory)
+    date = LazyFunction(lambda: timezone.now().date())
+    # back-to-back hourly slots so one doctor's sessions on one day don't overlap
+    start_time = Sequence(lambda n: datetime.time(n % 23, 0))
+    end_time = LazyAttribute(lambda o: datetime.time(o.start_time.hour + 1, o.start_time.minute))
+
+    class Meta:
+        model = TreatmentSession
+
+
+class PatientConsultationFactory(DjangoModelFactory[PatientConsultation]):
+    patient = SubFactory(PatientFactory)
+    doctor = SubFactory(DoctorProfileFactory)
+    consultation_type = "initial"
+    date = LazyFunction(lambda: timezone.now().date())
+    start_time = datetime.time(11, 0)
+    end_time = datetime.time(11, 30)
+
+    class Meta:
+        model = PatientConsultation
+
+
+class InvoiceFactory(DjangoModelFactory[Invoice]):
+    patient = SubFactory(PatientFactory)
+    due_date = LazyFunction(lambda: timezone.now().date() + datetime.timedelta(days=14))
+    status = "sent"
+    total = Decimal("600.00")
+    balance = Decimal("600.00")
+
+    class Meta:
+        model = Invoice
+
+
+class PaymentFactory(DjangoModelFactory[Payment]):
+    invoice = SubFactory(InvoiceFactory)
+    amount = Decimal("100.00")
+    method = "cash"
+    reference = Sequence(lambda n: f"TEST-PAY-{n}")
+
+    class Meta:
+        model = Payment
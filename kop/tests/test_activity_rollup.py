@@ -0,0 +1,196 @@
+import datetime
+from decimal import Decimal
+from importlib import import_module
+from io import StringIO
+
+import pytest
+from django.apps import apps
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+
+from kop.models import DailyActivityRollup
+from kop.models import PatientWeeklySchedule
+from kop.tests.factories import BranchFactory
+from kop.tests.factories import DoctorProfileFactory
+from kop.tests.factories import InvoiceFactory
+from kop.tests.factories import PatientConsultationFactory
+from kop.tests.factories import PatientFactory
+from kop.tests.factories import PatientTreatmentFactory
+from kop.tests.factories import PaymentFactory
+from kop.tests.factories import TreatmentSessionFactory
+from kop.utils.activity_rollup import MEASURES
+from kop.utils.activity_rollup import compute_rollups
+from kop.utils.session_generator import generate_sessions
+from kop.utils.treatment_sessions import set_sessions_status
+from smart_physio.users.tests.factories import UserFactory
+
+pytestmark = pytest.mark.django_db
+
+
+def _rollup(doctor, day=None):
+    return DailyActivityRollup.objects.get(doctor=doctor, date=day or timezone.now().date())
+
+
+def _stored():
+    return {
+        (row.branch_id, row.doctor_id, row.date): {name: getattr(row, name) for name in MEASURES}
+        for row in DailyActivityRollup.objects.all()
+    }
+
+
+def test_saves_keep_the_day_current(doctor):
+    session = TreatmentSessionFactory(treatment_doctor=doctor, status="scheduled")
+    patient = PatientFactory(branch=doctor.branch)
+    consultation = PatientConsultationFactory(doctor=doctor, patient=patient)
+    invoice = InvoiceFactory(patient=patient, consultation=consultation, total=Decimal("600.00"))
+    payment = PaymentFactory(invoice=invoice, amount=Decimal("250.00"))
+    cancelled = PatientConsultationFactory(doctor=doctor, patient=patient, status="cancelled")
+
+    rollup = _rollup(doctor)
+    assert rollup.branch == doctor.branch
+    assert (rollup.sessions_scheduled, rollup.consultations_scheduled, rollup.consultations_cancelled) == (1, 1, 1)
+    assert (rollup.revenue_invoiced, rollup.revenue_collected) == (Decimal("600.00"), Decimal("250.00"))
+
+    session.status = "completed"
+    session.save()
+    cancelled.delete()
+    payment.delete()
+
+    rollup.refresh_from_db()
+    assert (rollup.sessions_scheduled, rollup.sessions_completed) == (0, 1)
+    assert rollup.consultations_cancelled == 0
+    assert rollup.revenue_collected == 0
+
+
+def test_rescheduling_moves_the_count(doctor):
+    today = timezone.now().date()
+    session = TreatmentSessionFactory(treatment_doctor=doctor, status="scheduled")
+    other = DoctorProfileFactory()
+
+    session.date = today + datetime.timedelta(days=3)
+    session.treatment_doctor = other
+    session.save()
+
+    assert not DailyActivityRollup.objects.filter(doctor=doctor, date=today).exists()
+    assert _rollup(other, session.date).sessions_scheduled == 1
+    assert _rollup(other, session.date).branch == other.branch
+
+
+def test_redating_revenue_moves_the_amounts(doctor):
+    today = timezone.now().date()
+    earlier = today - datetime.timedelta(days=40)
+    patient = PatientFactory(branch=doctor.branch)
+    invoice = InvoiceFactory(
+        patient=patient, consultation=PatientConsultationFactory(doctor=doctor, patient=patient),
+        total=Decimal("600.00"),
+    )
+    payment = PaymentFactory(invoice=invoice, amount=Decimal("250.00"))
+
+    invoice.refresh_from_db()
+    invoice.invoice_date = earlier
+    invoice.save()
+    payment.payment_date = earlier
+    payment.save()
+
+    assert (_rollup(doctor).revenue_invoiced, _rollup(doctor).revenue_collected) == (0, 0)
+    assert _rollup(doctor, earlier).revenue_invoiced == Decimal("600.00")
+    assert _rollup(doctor, earlier).revenue_collected == Decimal("250.00")
+
+
+def test_moving_a_doctor_moves_their_rollup(doctor):
+    TreatmentSessionFactory(treatment_doctor=doctor, status="scheduled")
+    doctor.branch = BranchFactory()
+    doctor.save()
+
+    assert list(DailyActivityRollup.objects.filter(doctor=doctor).values_list("branch", flat=True)) == [
+        doctor.branch_id
+    ]
+
+
+def test_bulk_paths_refresh_the_rollup(doctor):
+    treatment = PatientTreatmentFactory(doctor=doctor, total_sessions=5)
+    PatientWeeklySchedule.objects.create(
+        patient_treatment=treatment, day_of_week="monday",
+        start_time=datetime.time(9, 0), end_time=datetime.time(10, 0),
+    )
+    generate_sessions(datetime.date(2030, 1, 7), weeks=2)
+    assert _rollup(doctor, datetime.date(2030, 1, 14)).sessions_scheduled == 1
+
+    past = TreatmentSessionFactory(treatment=treatment, treatment_doctor=doctor, status="scheduled")
+    set_sessions_status([past.pk], status="cancelled")
+    assert _rollup(doctor).sessions_cancelled == 1
+
+
+def test_rebuild_command_matches_the_incremental_rollup(doctor):
+    yesterday = timezone.now().date() - datetime.timedelta(days=1)
+    for day in (yesterday, yesterday - datetime.timedelta(days=40)):
+        TreatmentSessionFactory(treatment_doctor=doctor, date=day, status="completed")
+        PatientConsultationFactory(doctor=doctor, date=day, status="cancelled")
+    PaymentFactory(invoice=InvoiceFactory(consultation=PatientConsultationFactory(doctor=doctor)))
+    incremental = _stored()
+    DailyActivityRollup.objects.all().delete()
+    out = StringIO()
+
+    call_command("rebuild_activity_rollups", chunk_days=7, verbosity=2, stdout=out)
+
+    assert _stored() == incremental
+    assert f"Rebuilt {len(incremental)} rollup rows" in out.getvalue()
+
+
+def test_migration_fills_the_rollup_from_existing_rows(doctor):
+    TreatmentSessionFactory(treatment_doctor=doctor, status="scheduled")
+    PaymentFactory(invoice=InvoiceFactory(patient=PatientFactory(branch=doctor.branch)), amount=Decimal("100.00"))
+    expected = _stored()
+    DailyActivityRollup.objects.all().delete()
+
+    import_module("kop.migrations.0033_fill_activity_rollups").fill_activity_rollups(apps, None)
+
+    assert _stored() == expected
+
+
+def test_compute_rollups_skips_days_outside_the_pairs(doctor):
+    today = timezone.now().date()
+    TreatmentSessionFactory(treatment_doctor=doctor, date=today)
+    TreatmentSessionFactory(treatment_doctor=DoctorProfileFactory(), date=today - datetime.timedelta(days=1))
+
+    totals = compute_rollups(doctor_days={(doctor.pk, today)})
+
+    assert list(totals) == [(doctor.branch_id, doctor.pk, today)]
+
+
+def test_activity_report_groups_and_scopes(client, doctor):
+    today = timezone.now().date()
+    colleague = DoctorProfileFactory(branch=doctor.branch)
+    TreatmentSessionFactory(treatment_doctor=doctor, status="scheduled")
+    TreatmentSessionFactory(treatment_doctor=colleague, status="scheduled")
+    TreatmentSessionFactory(treatment_doctor=DoctorProfileFactory(), status="scheduled")
+    client.force_login(doctor.user)
+    url = reverse("reports-activity")
+
+    response = client.get(url, {"group_by": "doctor"})
+
+    assert response.status_code == 200
+    data = response.json()
+    assert [row["doctor"] for row in data["results"]] == sorted([doctor.pk, colleague.pk])
+    assert data["totals"]["sessions_scheduled"] == 2
+    assert data["start"] == str(today - datetime.timedelta(days=29))
+
+    response = client.get(url, {"doctor": colleague.pk, "group_by": "date"})
+    assert response.json()["results"] == [
+        {"date": str(today), **response.json()["totals"]},
+    ]
+
+
+def test_activity_report_validates_the_range(client):
+    client.force_login(UserFactory(is_superuser=True))
+
+    response = client.get(reverse("reports-activity"), {"start": "2030-02-01", "end": "2030-01-01"})
+
+    assert response.status_code == 400
+
+
+def test_activity_report_needs_a_branch(client):
+    client.force_login(UserFactory())
+
+    assert client.get(reverse("reports-activity")).status_code == 403
@@ -0,0 +1,132 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from kop.models import Patient
+from kop.tests.factories import DoctorProfileFactory
+from kop.tests.factories import PatientFactory
+from kop.tests.factories import PatientTreatmentFactory
+from kop.utils.patient_search import match_rank
+from kop.utils.patient_search import search_filters
+from smart_physio.users.tests.factories import UserFactory
+
+pytestmark = pytest.mark.django_db
+
+
+def _search(client, term, **params):
+    with CaptureQueriesContext(connection) as captured:
+        response = client.get(reverse("patient-autocomplete"), {"q": term, **params})
+    patient_queries = [query for query in captured if "kop_patient" in query["sql"]]
+    return response.json(), patient_queries
+
+
+def test_longer_terms_are_narrowed_in_memory(client, doctor):
+    for first_name in ("Smita", "Smith", "Asmi", "Ravi"):
+        PatientFactory(branch=doctor.branch, first_name=first_name, last_name="Rao")
+    client.force_login(doctor.user)
+
+    data, queries = _search(client, "sm")
+    assert len(queries) == 1
+    assert len(data["results"]) == 3
+
+    data, queries = _search(client, "  SMIT ")
+    assert queries == []
+    assert [result["text"].split(" (")[0] for result in data["results"]] == ["Smita Rao", "Smith Rao"]
+
+    # The same term again comes straight from the cache
+    assert _search(client, "smit") == (data, [])
+
+
+def test_candidates_are_cached_per_branch(client, doctor):
+    PatientFactory(branch=doctor.branch, first_name="Smita")
+    other = DoctorProfileFactory()
+    PatientFactory(branch=other.branch, first_name="Smriti")
+    client.force_login(doctor.user)
+    assert [result["text"].split()[0] for result in _search(client, "sm")[0]["results"]] == ["Smita"]
+
+    client.force_login(other.user)
+    data, queries = _search(client, "sm")
+
+    assert len(queries) == 1
+    assert [result["text"].split()[0] for result in data["results"]] == ["Smriti"]
+
+
+def test_cut_candidate_sets_are_not_narrowed(client, doctor, settings):
+    settings.AUTOCOMPLETE_CANDIDATE_LIMIT = 1
+    PatientFactory(branch=doctor.branch, first_name="Smita")
+    PatientFactory(branch=doctor.branch, first_name="Smith")
+    client.force_login(doctor.user)
+
+    data, _ = _search(client, "sm")
+    assert len(data["results"]) == 1
+
+    data, queries = _search(client, "smith")
+    assert len(queries) == 1
+    assert [result["text"].split()[0] for result in data["results"]] == ["Smith"]
+
+
+def test_phone_terms_are_not_narrowed_from_names(client, doctor):
+    match = PatientFactory(branch=doctor.branch, phone="+91 98765 43210")
+    client.force_login(doctor.user)
+    _search(client, "98")  # a name search: too few digits for a phone number
+
+    data, queries = _search(client, "987")
+
+    assert len(queries) == 1
+    assert [result["id"] for result in data["results"]] == [str(match.pk)]
+
+
+def test_results_are_paged(client, doctor):
+    for number in range(12):
+        PatientFactory(branch=doctor.branch, first_name=f"Anu{number}")
+    client.force_login(doctor.user)
+
+    first, _ = _search(client, "anu")
+    second, queries = _search(client, "anu", page=2)
+
+    assert (len(first["results"]), first["pagination"]["more"]) == (10, True)
+    assert (len(second["results"]), second["pagination"]["more"]) == (2, False)
+    assert queries == []
+
+
+def test_treatment_autocomplete_is_for_doctors_and_staff(client, doctor):
+    PatientTreatmentFactory(patient__first_name="Ravi", patient__branch=doctor.branch, doctor=doctor)
+    client.force_login(UserFactory())
+
+    response = client.get(reverse("treatment-program-autocomplete"), {"q": "ravi"})
+
+    assert response.json() == {"results": [], "pagination": {"more": False}}
+
+
+@pytest.mark.parametrize("term", ["an", "ann", "ann k", "nair", "kum", "987", "43210"])
+def test_match_rank_agrees_with_the_database(term):
+    for first_name, last_name, phone in [
+        ("Ann", "Kumar", "9876543210"), ("Anna", "Nair", "9876500000"), ("Joanne", "Kannan", "4321098765"),
+        ("Kumari", "Ann", "1112223333"), ("Priya", "Nair", "9988776655"),
+    ]:
+        PatientFactory(first_name=first_name, last_name=last_name, phone=phone)
+
+    filters, rank = search_filters(term)
+    from_database = list(
+        Patient.objects.filter(filters).annotate(rank=rank).order_by("-rank", "pk").values_list("pk", "rank")
+    )
+    ranks = {
+        patient.pk: match_rank(term, patient.first_name, patient.last_name, patient.phone_digits)
+        for patient in Patient.objects.all()
+    }
+    in_memory = sorted(((pk, rank) for pk, rank in ranks.items() if rank is not None), key=lambda row: (-row[1], row[0]))
+
+    assert in_memory == from_database
+
+
+@pytest.mark.parametrize("name", ["patient-autocomplete", "treatment-program-autocomplete"])
+def test_autocompletes_run_with_atomic_requests(client, doctor, monkeypatch, name):
+    monkeypatch.setitem(connection.settings_dict, "ATOMIC_REQUESTS", True)
+    PatientTreatmentFactory(doctor=doctor, patient=PatientFactory(branch=doctor.branch, first_name="Smita"))
+    client.force_login(doctor.user)
+
+    response = client.get(reverse(name), {"q": "smi"})
+
+    assert response.status_code == 200
+    assert len(response.json()["results"]) == 1
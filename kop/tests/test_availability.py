@@ -0,0 +1,134 @@
+import datetime
+
+import pytest
+from django.urls import reverse
+
+from kop.tests.factories import BranchFactory
+from kop.tests.factories import DoctorProfileFactory
+from kop.tests.factories import PatientConsultationFactory
+from kop.tests.factories import TreatmentProgramFactory
+from kop.tests.factories import TreatmentSessionFactory
+from kop.tests.factories import WeeklyAvailabilityFactory
+from kop.utils.availability import AvailabilityIndex
+from kop.utils.availability import find_free_slots_for_program
+
+pytestmark = pytest.mark.django_db
+
+MONDAY = datetime.date(2030, 1, 7)
+
+
+def _t(hour, minute=0):
+    return datetime.time(hour, minute)
+
+
+def test_weekly_availability_is_one_query(doctor, django_assert_num_queries):
+    WeeklyAvailabilityFactory(doctor=doctor, day="mon")
+    WeeklyAvailabilityFactory(doctor=doctor, day="wed", is_available=False)
+
+    with django_assert_num_queries(1):
+        availability = doctor.get_weekly_availability()
+
+    assert availability["mon"]["login_time"] == "09:00"
+    assert availability["wed"]["is_available"] is False
+    assert availability["tue"] == {
+        "is_available": False,
+        "login_time": None,
+        "logout_time": None,
+        "break_start_time": None,
+        "break_end_time": None,
+    }
+
+
+def test_free_intervals_drop_break_and_bookings(doctor):
+    WeeklyAvailabilityFactory(doctor=doctor, break_start_time=_t(13), break_end_time=_t(14))
+    TreatmentSessionFactory(treatment_doctor=doctor, date=MONDAY, start_time=_t(10), end_time=_t(11))
+    PatientConsultationFactory(doctor=doctor, date=MONDAY, start_time=_t(15, 30), end_time=_t(16))
+    TreatmentSessionFactory(
+        treatment_doctor=doctor, date=MONDAY, start_time=_t(16), end_time=_t(17), status="cancelled",
+    )
+
+    index = AvailabilityIndex(doctor.branch, MONDAY, MONDAY)
+
+    assert index.free_intervals(doctor.pk, MONDAY) == [
+        (9 * 60, 10 * 60), (11 * 60, 13 * 60), (14 * 60, 15 * 60 + 30), (16 * 60, 17 * 60),
+    ]
+    assert index.free_intervals(doctor.pk, MONDAY + datetime.timedelta(days=1)) == []
+    assert index.is_free(doctor.pk, MONDAY, _t(11), _t(12))
+    assert not index.is_free(doctor.pk, MONDAY, _t(12, 30), _t(13, 30))
+
+
+def test_index_loads_in_fixed_queries(django_assert_num_queries):
+    branch = BranchFactory()
+    for _ in range(3):
+        doctor = DoctorProfileFactory(branch=branch)
+        WeeklyAvailabilityFactory(doctor=doctor)
+        TreatmentSessionFactory(treatment_doctor=doctor, date=MONDAY, start_time=_t(9), end_time=_t(10))
+        PatientConsultationFactory(doctor=doctor, date=MONDAY)
+
+    # doctors, weekly availability, sessions, consultations
+    with django_assert_num_queries(4):
+        index = AvailabilityIndex(branch, MONDAY, MONDAY + datetime.timedelta(days=13))
+    with django_assert_num_queries(0):
+        slots = index.next_free_slots(10)
+
+    assert len(slots) == 10
+
+
+def test_program_slots_are_earliest_across_its_doctors():
+    branch = BranchFactory()
+    early = DoctorProfileFactory(branch=branch)
+    late = DoctorProfileFactory(branch=branch)
+    other = DoctorProfileFactory(branch=branch)
+    WeeklyAvailabilityFactory(doctor=early, login_time=_t(9), logout_time=_t(11))
+    WeeklyAvailabilityFactory(doctor=late, login_time=_t(10), logout_time=_t(12))
+    WeeklyAvailabilityFactory(doctor=other, login_time=_t(6), logout_time=_t(8))
+    TreatmentSessionFactory(treatment_doctor=early, date=MONDAY, start_time=_t(9), end_time=_t(10))
+    program = TreatmentProgramFactory(branch=branch)
+    program.doctors.add(early, late)
+
+    slots = find_free_slots_for_program(program, count=3, start_date=MONDAY, days=7)
+
+    assert [(slot["doctor"], slot["date"], slot["start_time"]) for slot in slots] == [
+        (early.pk, MONDAY, _t(10)),
+        (late.pk, MONDAY, _t(10)),
+        (late.pk, MONDAY, _t(11)),
+    ]
+
+
+def test_slots_skip_time_already_passed(doctor):
+    WeeklyAvailabilityFactory(doctor=doctor)
+    program = TreatmentProgramFactory(branch=doctor.branch)
+    program.doctors.add(doctor)
+
+    slots = find_free_slots_for_program(
+        program, count=1, duration=30, after=datetime.datetime.combine(MONDAY, _t(16, 15)),
+    )
+
+    assert (slots[0]["date"], slots[0]["start_time"], slots[0]["end_time"]) == (MONDAY, _t(16, 15), _t(16, 45))
+
+
+def test_free_slots_endpoint(client, doctor):
+    WeeklyAvailabilityFactory(doctor=doctor, day="tue")
+    program = TreatmentProgramFactory(branch=doctor.branch)
+    program.doctors.add(doctor)
+    client.force_login(doctor.user)
+
+    response = client.get(
+        reverse("availability-free-slots"),
+        {"program": program.pk, "count": 2, "start_date": "2030-01-07"},
+    )
+
+    assert response.status_code == 200
+    assert response.json() == [
+        {"doctor": doctor.pk, "date": "2030-01-08", "start_time": "09:00", "end_time": "10:00"},
+        {"doctor": doctor.pk, "date": "2030-01-08", "start_time": "10:00", "end_time": "11:00"},
+    ]
+
+
+def test_free_slots_endpoint_rejects_other_branch(client, doctor):
+    program = TreatmentProgramFactory()
+    client.force_login(doctor.user)
+
+    response = client.get(reverse("availability-free-slots"), {"program": program.pk})
+
+    assert response.status_code == 403
@@ -0,0 +1,183 @@
+import datetime
+from io import StringIO
+
+import pytest
+from django.contrib.auth.models import Group
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+
+from kop.jobs import create_treatment_invoice
+from kop.models import BackgroundJob
+from kop.models import BranchAdmin
+from kop.models import DailyActivityRollup
+from kop.models import Invoice
+from kop.models import StaffProfile
+from kop.tests.factories import BranchFactory
+from kop.tests.factories import DoctorProfileFactory
+from kop.tests.factories import PatientFactory
+from kop.tests.factories import PatientTreatmentFactory
+from kop.tests.factories import TreatmentSessionFactory
+from kop.utils.background_jobs import background_job
+from kop.utils.background_jobs import claim_job
+from kop.utils.background_jobs import enqueue
+from kop.utils.background_jobs import prune_jobs
+from kop.utils.background_jobs import requeue_abandoned_jobs
+from kop.utils.background_jobs import run_job
+from smart_physio.users.tests.factories import UserFactory
+
+pytestmark = pytest.mark.django_db
+
+
+@background_job(max_attempts=2)
+def fail(message):
+    raise RuntimeError(message)
+
+
+@pytest.fixture
+def queued(settings, tmp_path):
+    """Jobs are stored for the worker instead of running inline"""
+    settings.BACKGROUND_JOBS_IMMEDIATE = False
+    settings.MEDIA_ROOT = str(tmp_path / "media")
+
+
+def test_worker_runs_queued_jobs(queued, doctor):
+    TreatmentSessionFactory(treatment_doctor=doctor, status="scheduled")
+    assert not DailyActivityRollup.objects.exists()
+    assert BackgroundJob.objects.filter(status="queued").exists()
+    out = StringIO()
+
+    call_command("run_jobs", once=True, stdout=out)
+
+    assert DailyActivityRollup.objects.get(doctor=doctor).sessions_scheduled == 1
+    assert not BackgroundJob.objects.exclude(status="succeeded").exists()
+    assert f"Ran {BackgroundJob.objects.count()} jobs" in out.getvalue()
+
+
+def test_failed_jobs_are_retried_then_fail(queued, settings):
+    settings.BACKGROUND_JOB_RETRY_DELAY = 60
+    job = enqueue(fail, message="Boom")
+
+    run_job(claim_job("test"))
+    job.refresh_from_db()
+    assert (job.status, job.attempts) == ("queued", 1)
+    assert "RuntimeError: Boom" in job.error
+    assert job.run_after > timezone.now() + datetime.timedelta(seconds=50)
+    assert claim_job("test") is None  # not due yet
+
+    BackgroundJob.objects.update(run_after=timezone.now())
+    run_job(claim_job("test"))
+    job.refresh_from_db()
+    assert (job.status, job.attempts) == ("failed", 2)
+
+
+def test_abandoned_jobs_are_queued_again(queued, settings):
+    long_ago = timezone.now() - datetime.timedelta(seconds=settings.BACKGROUND_JOB_TIMEOUT + 1)
+    retry = enqueue(fail, message="Boom")
+    given_up = enqueue(fail, message="Boom")
+    BackgroundJob.objects.update(status="running", started_at=long_ago, attempts=1)
+    BackgroundJob.objects.filter(pk=given_up.pk).update(attempts=2)
+
+    assert requeue_abandoned_jobs() == (1, 1)
+    assert BackgroundJob.objects.get(pk=retry.pk).status == "queued"
+    assert BackgroundJob.objects.get(pk=given_up.pk).status == "failed"
+
+
+def test_old_results_are_pruned_with_their_files(queued, settings):
+    path = default_storage.save("exports/old.csv", ContentFile(b"a,b\n"))
+    finished = timezone.now() - datetime.timedelta(days=settings.BACKGROUND_JOB_RESULT_DAYS + 1)
+    BackgroundJob.objects.create(name="old", status="succeeded", finished_at=finished, result={"file": path})
+    recent = BackgroundJob.objects.create(name="recent", status="succeeded", finished_at=timezone.now())
+
+    assert prune_jobs() == 1
+    assert list(BackgroundJob.objects.all()) == [recent]
+    assert not default_storage.exists(path)
+
+
+def test_profile_groups_are_created_by_a_job(queued):
+    doctor = DoctorProfileFactory()
+    assert not Group.objects.filter(name="doctors").exists()
+
+    call_command("run_jobs", once=True, stdout=StringIO())
+
+    assert Group.objects.filter(name__in=["doctors", f"doctors-{doctor.branch}"]).count() == 2
+
+
+def test_staff_join_their_groups_in_the_saving_request(queued):
+    staff = StaffProfile.objects.create(
+        user=UserFactory(), branch=BranchFactory(), position="Receptionist", joining_date=datetime.date(2030, 1, 1)
+    )
+
+    assert set(staff.user.groups.values_list("name", flat=True)) == {"staff", f"staff-{staff.branch}"}
+
+
+def test_treatment_invoice_is_created_once(doctor):
+    treatment = PatientTreatmentFactory(doctor=doctor, status="prescribed")
+    assert not Invoice.objects.filter(treatment=treatment).exists()
+
+    treatment.status = "ongoing"
+    treatment.save()
+    treatment.save()
+    create_treatment_invoice(treatment.pk)
+
+    invoice = Invoice.objects.get(treatment=treatment)
+    assert invoice.total == treatment.total_cost
+    assert invoice.status == "sent"
+
+
+def test_treatment_invoice_is_created_in_the_saving_request(queued, doctor):
+    treatment = PatientTreatmentFactory(doctor=doctor, status="prescribed")
+    treatment.status = "ongoing"
+    treatment.save()
+
+    assert Invoice.objects.filter(treatment=treatment).exists()
+    assert not BackgroundJob.objects.filter(name="kop.jobs.create_treatment_invoice").exists()
+
+
+def test_treatment_invoice_can_be_left_to_the_worker(queued, settings, doctor):
+    settings.TREATMENT_INVOICES_IN_BACKGROUND = True
+    treatment = PatientTreatmentFactory(doctor=doctor, status="prescribed")
+    treatment.status = "ongoing"
+    treatment.save()
+    assert not Invoice.objects.filter(treatment=treatment).exists()
+
+    call_command("run_jobs", once=True, stdout=StringIO())
+
+    assert Invoice.objects.filter(treatment=treatment).exists()
+
+
+def test_background_export_is_downloaded_from_its_job(queued, client):
+    admin = BranchAdmin.objects.create(user=UserFactory(), branch=BranchFactory(), phone_number="9876543210")
+    PatientFactory(branch=admin.branch, first_name="Ravi")
+    PatientFactory(branch=admin.branch, first_name="Meera")
+    client.force_login(admin.user)
+
+    response = client.get(reverse("patient-export"), {"name": "ravi", "background": "1"})
+
+    job = BackgroundJob.objects.get(name="kop.jobs.write_export")
+    assert response.url == reverse("background-job", kwargs={"pk": job.pk})
+    assert client.get(reverse("background-job-download", kwargs={"pk": job.pk})).status_code == 404
+
+    call_command("run_jobs", once=True, stdout=StringIO())
+
+    assert reverse("background-job-download", kwargs={"pk": job.pk}) in client.get(response.url).content.decode()
+    download = client.get(reverse("background-job-download", kwargs={"pk": job.pk}))
+    assert download["Content-Disposition"].startswith('attachment; filename="patients-')
+    assert b"".join(download.streaming_content).decode().splitlines()[1].startswith("Ravi,")
+
+    client.force_login(UserFactory())
+    assert client.get(response.url).status_code == 404
+
+
+def test_inline_background_export_is_downloaded_at_once(client, settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path / "media")
+    admin = BranchAdmin.objects.create(user=UserFactory(), branch=BranchFactory(), phone_number="9876543210")
+    PatientFactory(branch=admin.branch, first_name="Ravi")
+    client.force_login(admin.user)
+
+    response = client.get(reverse("patient-export"), {"background": "1", "compress": "gzip"})
+
+    assert response["Content-Disposition"].endswith('.csv.gz"')
+    assert not BackgroundJob.objects.exists()
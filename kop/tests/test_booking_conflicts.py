@@ -0,0 +1,84 @@
+import datetime
+from io import StringIO
+
+import pytest
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+
+from kop.models import PatientConsultation
+from kop.models import TreatmentSession
+from kop.tests.factories import PatientConsultationFactory
+from kop.tests.factories import PatientFactory
+from kop.tests.factories import TreatmentSessionFactory
+from kop.utils.booking_conflicts import find_doctor_conflict
+from kop.utils.booking_conflicts import find_overlaps
+
+pytestmark = pytest.mark.django_db
+
+MONDAY = datetime.date(2030, 1, 7)
+
+
+def _t(hour, minute=0):
+    return datetime.time(hour, minute)
+
+
+def test_find_overlaps_sweeps_per_doctor_and_day():
+    bookings = [
+        (1, MONDAY, _t(9), _t(11), "a"),
+        (1, MONDAY, _t(11), _t(12), "b"),
+        (1, MONDAY, _t(10), _t(10, 30), "c"),
+        (2, MONDAY, _t(9), _t(10), "d"),
+        (1, MONDAY + datetime.timedelta(days=1), _t(9), _t(12), "e"),
+    ]
+
+    pairs = [(earlier[4], later[4]) for earlier, later in find_overlaps(bookings)]
+
+    assert pairs == [("a", "c")]
+
+
+def test_conflict_lookup_is_one_query(doctor, django_assert_num_queries):
+    PatientConsultationFactory(doctor=doctor, date=MONDAY, start_time=_t(10, 30), end_time=_t(11))
+    TreatmentSessionFactory(treatment_doctor=doctor, date=MONDAY, start_time=_t(8), end_time=_t(9))
+
+    with django_assert_num_queries(1):
+        conflict = find_doctor_conflict(doctor.pk, MONDAY, _t(10), _t(11))
+
+    assert conflict[0] == "consultation"
+    assert find_doctor_conflict(doctor.pk, MONDAY, _t(9), _t(10)) is None
+
+
+def test_session_clean_rejects_double_booking(doctor):
+    booked = TreatmentSessionFactory(treatment_doctor=doctor, date=MONDAY, start_time=_t(10), end_time=_t(11))
+    TreatmentSessionFactory(
+        treatment_doctor=doctor, date=MONDAY, start_time=_t(12), end_time=_t(13), status="cancelled",
+    )
+    session = TreatmentSession(treatment_doctor=doctor, date=MONDAY, start_time=_t(10, 30), end_time=_t(11, 30))
+
+    with pytest.raises(ValidationError, match="already has a session from 10:00 to 11:00"):
+        session.clean()
+
+    # A cancelled booking frees the slot, and a session doesn't clash with itself
+    TreatmentSession(treatment_doctor=doctor, date=MONDAY, start_time=_t(12), end_time=_t(13)).clean()
+    booked.clean()
+
+
+def test_consultation_clean_rejects_double_booking(doctor):
+    TreatmentSessionFactory(treatment_doctor=doctor, date=MONDAY, start_time=_t(10), end_time=_t(11))
+    consultation = PatientConsultation(
+        patient=PatientFactory(), doctor=doctor, consultation_type="initial",
+        date=MONDAY, start_time=_t(10, 45), end_time=_t(11, 15),
+    )
+
+    with pytest.raises(ValidationError, match="already has a session"):
+        consultation.clean()
+
+
+def test_command_lists_overlaps(doctor):
+    TreatmentSessionFactory(treatment_doctor=doctor, date=MONDAY, start_time=_t(10), end_time=_t(11))
+    consultation = PatientConsultationFactory(doctor=doctor, date=MONDAY, start_time=_t(10, 30), end_time=_t(11))
+
+    out = StringIO()
+    call_command("check_booking_conflicts", stdout=out)
+
+    assert f"overlaps consultation {consultation.pk}" in out.getvalue()
+    assert "1 overlapping bookings found" in out.getvalue()
@@ -0,0 +1,81 @@
+import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from kop.models import BranchAdmin
+from kop.tests.factories import BranchFactory
+from kop.tests.factories import DoctorProfileFactory
+from kop.tests.factories import PatientConsultationFactory
+from kop.tests.factories import PatientFactory
+from kop.tests.factories import PatientTreatmentFactory
+from kop.tests.factories import TreatmentSessionFactory
+from kop.utils.branch_admin import get_dashboard_stats
+from kop.utils.branch_admin import get_expiring_treatments
+from kop.utils.branch_admin import get_today_counts
+from smart_physio.users.tests.factories import UserFactory
+
+pytestmark = pytest.mark.django_db
+
+
+def _create_treatments(branch, count, sessions_completed):
+    for _ in range(count):
+        PatientTreatmentFactory(
+            patient=PatientFactory(branch=branch),
+            total_sessions=10,
+            sessions_completed=sessions_completed,
+        )
+
+
+def test_expiring_treatments_filters_in_database():
+    branch = BranchFactory()
+    _create_treatments(branch, 2, sessions_completed=5)
+    _create_treatments(branch, 3, sessions_completed=1)
+
+    expiring = list(get_expiring_treatments(branch))
+
+    assert len(expiring) == 2
+    assert all(t.remaining_sessions == t.pending_sessions == 5 for t in expiring)
+
+
+def test_dashboard_stats_memoized_on_request(rf, django_assert_num_queries):
+    branch = BranchFactory()
+    _create_treatments(branch, 2, sessions_completed=5)
+    request = rf.get("/fake-url/")
+
+    stats = get_dashboard_stats(branch, request)
+
+    with django_assert_num_queries(0):
+        assert get_dashboard_stats(branch, request) is stats
+    assert stats["expiring_treatments_count"] == 2
+
+
+def test_branch_admin_dashboard_constant_query_count(client):
+    branch = BranchFactory()
+    admin = BranchAdmin.objects.create(user=UserFactory(), branch=branch, phone_number="9876543210")
+    client.force_login(admin.user)
+    url = reverse("branch_admin_dashboard")
+
+    # Both requests start cold, so the cached role doesn't make the second one cheaper
+    _create_treatments(branch, 2, sessions_completed=5)
+    cache.clear()
+    with CaptureQueriesContext(connection) as small:
+        assert client.get(url).status_code == 200
+
+    _create_treatments(branch, 10, sessions_completed=5)
+    cache.clear()
+    with CaptureQueriesContext(connection) as large:
+        response = client.get(url)
+
+    assert response.context["expiring_treatments_count"] == 12
+    assert len(large.captured_queries) == len(small.captured_queries)
+
+
+def test_today_counts_do_not_wait_for_the_rollup(settings):
+    settings.BACKGROUND_JOBS_IMMEDIATE = False
+    doctor = DoctorProfileFactory()
+    TreatmentSessionFactory(treatment_doctor=doctor)
+    PatientConsultationFactory(doctor=doctor, patient=PatientFactory(branch=doctor.branch))
+
+    assert get_today_counts(doctor.branch) == {"appointments": 1, "treatments": 1}
@@ -0,0 +1,150 @@
+import datetime
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+
+from kop.models import Invoice
+from kop.models import Patient
+from kop.models import PatientConsultation
+from kop.models import PatientTreatment
+from kop.models import PatientWeeklySchedule
+from kop.models import TreatmentSession
+from kop.tests.factories import BranchFactory
+from kop.tests.factories import DoctorProfileFactory
+from kop.tests.factories import InvoiceFactory
+from kop.tests.factories import PatientConsultationFactory
+from kop.tests.factories import PatientFactory
+from kop.tests.factories import PatientTreatmentFactory
+from kop.tests.factories import TreatmentProgramFactory
+from kop.tests.factories import TreatmentSessionFactory
+from kop.utils.invoice_numbers import bulk_create_invoices
+from kop.utils.session_generator import generate_sessions
+from smart_physio.users.tests.factories import UserFactory
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def branch_rows(doctor):
+    """One patient, treatment, session, consultation and invoice in `doctor`'s branch and one elsewhere"""
+    rows = {}
+    for branch, treating in ((doctor.branch, doctor), (BranchFactory(), DoctorProfileFactory())):
+        patient = PatientFactory(branch=branch)
+        treatment = PatientTreatmentFactory(
+            patient=patient, doctor=treating, treatment_program=TreatmentProgramFactory(branch=branch)
+        )
+        consultation = PatientConsultationFactory(patient=patient, doctor=treating)
+        rows[branch] = {
+            Patient: patient,
+            PatientTreatment: treatment,
+            TreatmentSession: TreatmentSessionFactory(treatment=treatment, treatment_doctor=treating),
+            PatientConsultation: consultation,
+            Invoice: InvoiceFactory(patient=patient, consultation=consultation),
+        }
+    return rows
+
+
+def test_for_branch_scopes_every_model(doctor, branch_rows):
+    for model, row in branch_rows[doctor.branch].items():
+        assert list(model.objects.for_branch(doctor.branch)) == [row]
+        assert list(model.objects.for_branch(doctor.branch_id)) == [row]
+        assert model.objects.for_branch(None).count() == 2
+
+
+def test_for_user_applies_the_callers_branch(doctor, branch_rows):
+    superuser = UserFactory(is_superuser=True)
+
+    for model, row in branch_rows[doctor.branch].items():
+        assert list(model.objects.for_user(doctor.user)) == [row]
+        assert model.objects.for_user(superuser).count() == 2
+
+
+def test_branch_filter_uses_the_copied_column(doctor):
+    for model in (TreatmentSession, PatientConsultation, Invoice):
+        sql = str(model.objects.for_branch(doctor.branch_id).query)
+        assert f'"{model._meta.db_table}"."branch_id" =' in sql
+        assert " JOIN " not in sql and " OR " not in sql
+
+
+def test_saves_copy_the_branch(doctor):
+    patient = PatientFactory(branch=doctor.branch)
+    consultation = PatientConsultationFactory(patient=patient)
+    session = TreatmentSessionFactory(treatment_doctor=doctor)
+    invoice = InvoiceFactory(patient=patient, consultation=consultation)
+
+    assert consultation.branch == session.branch == invoice.branch == doctor.branch
+
+    session.treatment_doctor = DoctorProfileFactory()
+    session.save(update_fields=["treatment_doctor"])
+    session.refresh_from_db()
+    assert session.branch_id == session.treatment_doctor.branch_id
+
+
+def test_moving_a_patient_or_doctor_moves_their_rows(doctor, branch_rows):
+    patient = branch_rows[doctor.branch][Patient]
+    moved_to = BranchFactory()
+
+    patient.branch = moved_to
+    patient.save()
+    doctor.branch = moved_to
+    doctor.save()
+
+    assert PatientConsultation.objects.get(patient=patient).branch == moved_to
+    assert Invoice.objects.get(patient=patient).branch == moved_to
+    assert TreatmentSession.objects.get(treatment_doctor=doctor).branch == moved_to
+
+
+def test_bulk_paths_copy_the_branch(doctor):
+    treatment = PatientTreatmentFactory(doctor=doctor, total_sessions=5)
+    PatientWeeklySchedule.objects.create(
+        patient_treatment=treatment, day_of_week="monday",
+        start_time=datetime.time(9, 0), end_time=datetime.time(10, 0),
+    )
+    generate_sessions(datetime.date(2030, 1, 7), weeks=2)
+    invoice, = bulk_create_invoices([InvoiceFactory.build(patient=treatment.patient, treatment=treatment)])
+
+    assert set(TreatmentSession.objects.values_list("branch", flat=True)) == {doctor.branch_id}
+    assert Invoice.objects.get(pk=invoice.pk).branch_id == treatment.patient.branch_id
+
+
+def test_backfill_command_fills_the_branch_in_chunks(doctor, branch_rows):
+    for model in (TreatmentSession, PatientConsultation, Invoice):
+        model.objects.update(branch=None)
+    out = StringIO()
+
+    call_command("backfill_branches", chunk_size=1, verbosity=2, stdout=out)
+
+    assert "treatmentsession: updated 2 rows" in out.getvalue()
+    for model, row in branch_rows[doctor.branch].items():
+        assert list(model.objects.for_branch(doctor.branch)) == [row]
+
+
+def test_lists_are_scoped_to_the_doctors_branch(client, doctor, branch_rows):
+    other = next(branch for branch in branch_rows if branch != doctor.branch)
+    own = branch_rows[doctor.branch]
+    client.force_login(doctor.user)
+
+    response = client.get(reverse("consultation-list"))
+    assert list(response.context["consultations"]) == [own[PatientConsultation]]
+
+    response = client.get(reverse("treatment-session-list"), {"branch": other.pk})
+    assert list(response.context["treatment_sessions"]) == []
+
+    response = client.get(reverse("invoice-list"), {"branch": doctor.branch_id})
+    assert list(response.context["invoices"]) == [own[Invoice]]
+
+    response = client.get(reverse("patient-list"))
+    assert list(response.context["page_obj"]) == [own[Patient]]
+
+
+def test_superadmin_filters_lists_by_branch(client, doctor, branch_rows):
+    other = next(branch for branch in branch_rows if branch != doctor.branch)
+    client.force_login(UserFactory(is_superuser=True))
+
+    response = client.get(reverse("consultation-list"), {"branch": other.pk})
+    assert list(response.context["consultations"]) == [branch_rows[other][PatientConsultation]]
+
+    response = client.get(reverse("invoice-list"), {"branch": other.pk})
+    assert list(response.context["invoices"]) == [branch_rows[other][Invoice]]
@@ -0,0 +1,91 @@
+import datetime
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+
+from kop.models import DoctorProfile
+from kop.tests.factories import PatientConsultationFactory
+from kop.tests.factories import PatientTreatmentFactory
+from kop.tests.factories import TreatmentSessionFactory
+from kop.utils.doctor_dashboard import compute_doctor_dashboard_stats
+from kop.utils.doctor_dashboard import get_doctor_dashboard_stats
+
+pytestmark = pytest.mark.django_db
+
+
+def test_compute_stats_counts(doctor: DoctorProfile):
+    today = timezone.now().date()
+    treatment = PatientTreatmentFactory(doctor=doctor)
+    TreatmentSessionFactory(treatment=treatment, treatment_doctor=doctor, status="scheduled")
+    TreatmentSessionFactory(treatment=treatment, treatment_doctor=doctor, status="cancelled")
+    TreatmentSessionFactory(
+        treatment=treatment, treatment_doctor=doctor, date=today - datetime.timedelta(days=400),
+    )
+    PatientConsultationFactory(doctor=doctor, status="scheduled")
+    PatientConsultationFactory(doctor=doctor, status="completed")
+
+    stats = compute_doctor_dashboard_stats(doctor)
+
+    assert stats["total_sessions"] == 3
+    assert stats["scheduled_today"] == 1
+    assert stats["total_consultations"] == 2
+    assert stats["monthly_consultations"] == 1
+    assert stats["todays_completed_consultations"] == 1
+    assert stats["scheduled_consultations_today"] == 1
+    assert stats["assigned_patients"] == 1
+
+
+def test_compute_stats_query_count(doctor: DoctorProfile, django_assert_num_queries):
+    TreatmentSessionFactory.create_batch(5, treatment_doctor=doctor)
+    PatientConsultationFactory.create_batch(5, doctor=doctor)
+
+    # one aggregate over the daily rollup plus the distinct patient count
+    with django_assert_num_queries(2):
+        compute_doctor_dashboard_stats(doctor)
+
+
+def test_stats_are_cached_until_the_rollup_commits(
+    doctor: DoctorProfile, django_assert_num_queries, django_capture_on_commit_callbacks
+):
+    assert get_doctor_dashboard_stats(doctor)["total_consultations"] == 0
+
+    with django_assert_num_queries(0):
+        get_doctor_dashboard_stats(doctor)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        PatientConsultationFactory(doctor=doctor)
+
+    assert get_doctor_dashboard_stats(doctor)["total_consultations"] == 1
+
+
+def test_stats_follow_the_worker_refresh(client, doctor: DoctorProfile, settings, django_capture_on_commit_callbacks):
+    settings.BACKGROUND_JOBS_IMMEDIATE = False
+    session = TreatmentSessionFactory(treatment_doctor=doctor, status="scheduled")
+    call_command("run_jobs", once=True, stdout=StringIO())
+    client.force_login(doctor.user)
+    assert client.get(reverse("doctor_dashboard")).context["stats"]["scheduled_today"] == 1
+
+    with django_capture_on_commit_callbacks(execute=True):
+        session.status = "completed"
+        session.save()
+    # Until the worker has refreshed the rollup, the cached counters stand
+    assert client.get(reverse("doctor_dashboard")).context["stats"]["todays_completed"] == 0
+
+    with django_capture_on_commit_callbacks(execute=True):
+        call_command("run_jobs", once=True, stdout=StringIO())
+
+    stats = client.get(reverse("doctor_dashboard")).context["stats"]
+    assert (stats["scheduled_today"], stats["todays_completed"]) == (0, 1)
+
+
+def test_dashboard_view(client, doctor: DoctorProfile):
+    TreatmentSessionFactory(treatment_doctor=doctor)
+    client.force_login(doctor.user)
+
+    response = client.get(reverse("doctor_dashboard"))
+
+    assert response.status_code == 200
+    assert response.context["stats"]["total_sessions"] == 1
@@ -0,0 +1,124 @@
+import csv
+import gzip
+import io
+import re
+import zipfile
+from decimal import Decimal
+
+import pytest
+from django.urls import reverse
+
+from kop.models import BranchAdmin
+from kop.tests.factories import BranchFactory
+from kop.tests.factories import DoctorProfileFactory
+from kop.tests.factories import InvoiceFactory
+from kop.tests.factories import PatientConsultationFactory
+from kop.tests.factories import PatientFactory
+from kop.tests.factories import PatientTreatmentFactory
+from kop.tests.factories import PaymentFactory
+from kop.tests.factories import TreatmentSessionFactory
+from kop.utils.exports import csv_chunks
+from smart_physio.users.tests.factories import UserFactory
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def branch_admin(client):
+    admin = BranchAdmin.objects.create(user=UserFactory(), branch=BranchFactory(), phone_number="9876543210")
+    client.force_login(admin.user)
+    return admin
+
+
+def _csv(response):
+    assert response.streaming
+    return list(csv.reader(io.StringIO(b"".join(response.streaming_content).decode())))
+
+
+def test_invoice_export_honours_the_list_filters(client, branch_admin):
+    patient = PatientFactory(branch=branch_admin.branch, last_name="Menon")
+    consultation_invoice = InvoiceFactory(patient=patient, consultation=PatientConsultationFactory(patient=patient))
+    InvoiceFactory(patient=patient, treatment=PatientTreatmentFactory(patient=patient))
+    InvoiceFactory(patient=PatientFactory(last_name="Menon"))  # another branch
+
+    response = client.get(reverse("invoice-export"), {"invoice_type": "consultation", "patient": "men"})
+
+    assert response["Content-Type"] == "text/csv; charset=utf-8"
+    assert re.fullmatch(r'attachment; filename="invoices-[\d-]+\.csv"', response["Content-Disposition"])
+    header, *rows = _csv(response)
+    assert header[:2] == ["Invoice number", "Invoice date"]
+    assert [row[0] for row in rows] == [consultation_invoice.invoice_number]
+
+
+def test_payment_export_follows_the_invoice_filters(client, branch_admin):
+    patient = PatientFactory(branch=branch_admin.branch)
+    treatment_invoice = InvoiceFactory(patient=patient, treatment=PatientTreatmentFactory(patient=patient))
+    payment = PaymentFactory(invoice=treatment_invoice, amount=Decimal("250.00"), method="card")
+    PaymentFactory(invoice=InvoiceFactory(patient=patient, consultation=PatientConsultationFactory(patient=patient)))
+
+    header, *rows = _csv(client.get(reverse("payment-export"), {"invoice_type": "treatment"}))
+
+    assert [(row[0], row[6], row[7]) for row in rows] == [(payment.reference, "card", "250.00")]
+
+
+def test_session_export_honours_the_list_filters(client, branch_admin):
+    doctor = DoctorProfileFactory(branch=branch_admin.branch)
+    wanted = TreatmentSessionFactory(
+        treatment_doctor=doctor, treatment=PatientTreatmentFactory(patient=PatientFactory(first_name="Asha")),
+    )
+    TreatmentSessionFactory(treatment_doctor=doctor)
+    TreatmentSessionFactory(treatment=wanted.treatment)  # another branch's doctor
+
+    header, *rows = _csv(client.get(reverse("treatment-session-export"), {"patient": "ash"}))
+
+    assert [(row[0], row[3]) for row in rows] == [(str(wanted.date), "Asha")]
+
+
+def test_patient_export_honours_the_search(client, branch_admin):
+    PatientFactory(branch=branch_admin.branch, first_name="Ravi")
+    PatientFactory(branch=branch_admin.branch, first_name="Meera")
+
+    header, *rows = _csv(client.get(reverse("patient-export"), {"name": "ravi"}))
+
+    assert [row[0] for row in rows] == ["Ravi"]
+
+
+def test_xlsx_export_is_a_workbook(client, branch_admin):
+    PatientFactory(branch=branch_admin.branch, first_name="Ravi & Sons")
+
+    response = client.get(reverse("patient-export"), {"format": "xlsx"})
+
+    assert response["Content-Disposition"].endswith('.xlsx"')
+    workbook = zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content)))
+    assert workbook.testzip() is None
+    sheet = workbook.read("xl/worksheets/sheet1.xml").decode()
+    assert sheet.count("<row>") == 2
+    assert "Ravi &amp; Sons" in sheet
+    assert '<c s="1"><v>' in sheet  # date of birth as a date cell
+
+
+def test_gzip_export_decompresses_to_the_csv(client, branch_admin):
+    PatientFactory(branch=branch_admin.branch, first_name="Ravi")
+    plain = b"".join(client.get(reverse("patient-export")).streaming_content)
+
+    response = client.get(reverse("patient-export"), {"compress": "gzip"})
+
+    assert response["Content-Type"] == "application/gzip"
+    assert response["Content-Disposition"].endswith('.csv.gz"')
+    assert gzip.decompress(b"".join(response.streaming_content)) == plain
+
+
+def test_csv_cells_never_start_a_formula():
+    text = "".join(csv_chunks(["Name"], [("=HYPERLINK(1)",), ("-5",), ("Asha",)]))
+
+    assert text.splitlines() == ["Name", "'=HYPERLINK(1)", "'-5", "Asha"]
+
+
+def test_exports_are_for_admins(client, doctor):
+    client.force_login(doctor.user)
+
+    assert client.get(reverse("invoice-export")).status_code == 403
+
+
+def test_unknown_format_is_rejected(client, branch_admin):
+    assert client.get(reverse("invoice-export"), {"format": "pdf"}).status_code == 400
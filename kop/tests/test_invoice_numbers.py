@@ -0,0 +1,87 @@
+import threading
+
+import pytest
+from django.db import connection
+from django.db import connections
+from django.utils import timezone
+
+from kop.models import Invoice
+from kop.models import InvoiceSequence
+from kop.tests.factories import BranchFactory
+from kop.tests.factories import InvoiceFactory
+from kop.tests.factories import PatientFactory
+from kop.utils.invoice_numbers import allocate_invoice_numbers
+from kop.utils.invoice_numbers import bulk_create_invoices
+
+pytestmark = pytest.mark.django_db
+
+
+def test_invoice_save_numbers_per_branch_and_year():
+    year = timezone.now().year
+    branch, other_branch = BranchFactory(), BranchFactory()
+
+    first = InvoiceFactory(patient=PatientFactory(branch=branch))
+    second = InvoiceFactory(patient=PatientFactory(branch=branch))
+    other = InvoiceFactory(patient=PatientFactory(branch=other_branch))
+
+    assert first.invoice_number == f"INV-{year}-{branch.pk}-001"
+    assert second.invoice_number == f"INV-{year}-{branch.pk}-002"
+    assert other.invoice_number == f"INV-{year}-{other_branch.pk}-001"
+
+
+def test_numbers_reset_each_year():
+    branch = BranchFactory()
+    InvoiceSequence.objects.create(branch=branch, year=2024, last_number=41)
+
+    assert list(allocate_invoice_numbers(branch.pk, 2024, 2)) == [42, 43]
+    assert list(allocate_invoice_numbers(branch.pk, 2025, 1)) == [1]
+
+
+def test_bulk_create_allocates_one_block(django_assert_max_num_queries):
+    branch = BranchFactory()
+    patients = PatientFactory.create_batch(3, branch=branch)
+    invoices = [
+        Invoice(patient=patient, due_date=timezone.now().date(), total=600, balance=600)
+        for patient in patients * 10
+    ]
+
+    # savepoints, counter lock, counter update and a single INSERT - not one per invoice
+    with django_assert_max_num_queries(10):
+        bulk_create_invoices(invoices)
+
+    numbers = [invoice.invoice_number for invoice in invoices]
+    assert len(set(numbers)) == 30
+    assert InvoiceSequence.objects.get(branch=branch).last_number == 30
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.skipif(
+    not connection.features.has_select_for_update,
+    reason="row locking is needed for parallel writers",
+)
+def test_parallel_writers_never_share_a_number():
+    branch = BranchFactory()
+    writers, blocks_per_writer = 8, 25
+    allocated = []
+    errors = []
+    lock = threading.Lock()
+
+    def writer():
+        try:
+            for _ in range(blocks_per_writer):
+                numbers = allocate_invoice_numbers(branch.pk, 2030, 2)
+                with lock:
+                    allocated.extend(numbers)
+        except Exception as exc:  # noqa: BLE001
+            errors.append(exc)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=writer) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert sorted(allocated) == list(range(1, writers * blocks_per_writer * 2 + 1))
@@ -0,0 +1,133 @@
+from decimal import Decimal
+from io import StringIO
+
+import pytest
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+
+from kop.models import Invoice
+from kop.models import Payment
+from kop.tests.factories import InvoiceFactory
+from kop.tests.factories import PaymentFactory
+
+pytestmark = pytest.mark.django_db
+
+
+def test_payment_updates_running_totals():
+    invoice = InvoiceFactory(total=Decimal("600.00"), balance=Decimal("600.00"))
+
+    PaymentFactory(invoice=invoice, amount=Decimal("200.00"), discount_amount=Decimal("50.00"))
+
+    invoice.refresh_from_db()
+    assert invoice.paid_total == Decimal("250.00")
+    assert invoice.balance == Decimal("350.00")
+    assert invoice.status == "partially_paid"
+
+    PaymentFactory(invoice=invoice, amount=Decimal("350.00"))
+
+    invoice.refresh_from_db()
+    assert invoice.paid_total == Decimal("600.00")
+    assert invoice.balance == Decimal("0.00")
+    assert invoice.status == "paid"
+
+
+def test_editing_payment_applies_only_the_difference():
+    invoice = InvoiceFactory(total=Decimal("600.00"), balance=Decimal("600.00"))
+    payment = PaymentFactory(invoice=invoice, amount=Decimal("100.00"))
+
+    payment.amount = Decimal("150.00")
+    payment.save()
+
+    invoice.refresh_from_db()
+    assert invoice.paid_total == Decimal("150.00")
+    assert invoice.balance == Decimal("450.00")
+
+
+def test_deleting_payments_takes_them_off_the_invoice():
+    invoice = InvoiceFactory(total=Decimal("600.00"), balance=Decimal("600.00"), status="sent")
+    first = PaymentFactory(invoice=invoice, amount=Decimal("600.00"))
+    Payment.objects.get(pk=first.pk).delete()
+
+    invoice.refresh_from_db()
+    assert (invoice.paid_total, invoice.balance, invoice.status) == (Decimal("0.00"), Decimal("600.00"), "sent")
+
+    PaymentFactory(invoice=invoice, amount=Decimal("100.00"))
+    PaymentFactory(invoice=invoice, amount=Decimal("200.00")).delete()
+
+    invoice.refresh_from_db()
+    assert (invoice.paid_total, invoice.balance, invoice.status) == (Decimal("100.00"), Decimal("500.00"), "partially_paid")
+
+
+def test_moving_a_payment_moves_it_in_full():
+    first = InvoiceFactory(total=Decimal("600.00"), balance=Decimal("600.00"), status="sent")
+    second = InvoiceFactory(total=Decimal("600.00"), balance=Decimal("600.00"), status="sent")
+    payment = PaymentFactory(invoice=first, amount=Decimal("200.00"), discount_amount=Decimal("50.00"))
+
+    payment = Payment.objects.get(pk=payment.pk)
+    payment.invoice = second
+    payment.amount = Decimal("300.00")
+    payment.full_clean()
+    payment.save()
+
+    first.refresh_from_db()
+    second.refresh_from_db()
+    assert (first.paid_total, first.balance, first.status) == (Decimal("0.00"), Decimal("600.00"), "sent")
+    assert (second.paid_total, second.balance, second.status) == (
+        Decimal("350.00"), Decimal("250.00"), "partially_paid"
+    )
+
+
+def test_saving_a_stale_invoice_keeps_the_running_totals():
+    invoice = InvoiceFactory(total=Decimal("600.00"), balance=Decimal("600.00"))
+    stale = Invoice.objects.get(pk=invoice.pk)
+    PaymentFactory(invoice=invoice, amount=Decimal("100.00"))
+
+    stale.notes = "Called the patient"
+    stale.save()
+
+    assert (stale.paid_total, stale.balance) == (Decimal("100.00"), Decimal("500.00"))
+    stale.total = Decimal("700.00")
+    stale.save(update_fields=["total"])
+    invoice.refresh_from_db()
+    assert (invoice.notes, invoice.paid_total, invoice.balance) == ("Called the patient", Decimal("100.00"), Decimal("600.00"))
+
+
+def test_overpayment_is_rejected():
+    invoice = InvoiceFactory(total=Decimal("600.00"), balance=Decimal("600.00"))
+    PaymentFactory(invoice=invoice, amount=Decimal("500.00"))
+
+    with pytest.raises(ValidationError):
+        PaymentFactory(invoice=invoice, amount=Decimal("200.00"))
+
+    invoice.refresh_from_db()
+    assert invoice.paid_total == Decimal("500.00")
+    assert invoice.payments.count() == 1
+
+
+def test_recording_a_payment_is_constant_cost(django_assert_max_num_queries):
+    invoice = InvoiceFactory(total=Decimal("10000.00"), balance=Decimal("10000.00"))
+    PaymentFactory.create_batch(20, invoice=invoice, amount=Decimal("10.00"))
+
+    # savepoint, invoice lock, insert, running total update, release
+    with django_assert_max_num_queries(5):
+        PaymentFactory(invoice=invoice, amount=Decimal("10.00"))
+
+
+def test_reconcile_command_reports_and_fixes():
+    invoice = InvoiceFactory(total=Decimal("600.00"), balance=Decimal("600.00"))
+    PaymentFactory(invoice=invoice, amount=Decimal("100.00"))
+    Invoice.objects.filter(pk=invoice.pk).update(paid_total=600, balance=0, status="paid")
+
+    out = StringIO()
+    call_command("reconcile_invoice_totals", stdout=out)
+    assert "1 invoices out of step" in out.getvalue()
+
+    call_command("reconcile_invoice_totals", "--fix", stdout=StringIO())
+
+    invoice.refresh_from_db()
+    assert invoice.paid_total == Decimal("100.00")
+    assert invoice.balance == Decimal("500.00")
+    assert invoice.status == "partially_paid"
+    out = StringIO()
+    call_command("reconcile_invoice_totals", stdout=out)
+    assert "All invoice totals match" in out.getvalue()
@@ -0,0 +1,135 @@
+import os
+import subprocess
+import sys
+from decimal import Decimal
+
+import pytest
+from django.db.models.signals import pre_save
+from django.urls import reverse
+from prometheus_client import REGISTRY
+
+from kop.tests.factories import InvoiceFactory
+from kop.tests.factories import PatientConsultationFactory
+from kop.tests.factories import PatientTreatmentFactory
+from kop.tests.factories import PaymentFactory
+from kop.tests.factories import TreatmentSessionFactory
+from kop.utils.treatment_sessions import set_sessions_status
+from smart_physio.users.tests.factories import UserFactory
+
+pytestmark = pytest.mark.django_db
+
+
+def _value(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_saves_count_completed_sessions_invoices_and_payments(django_capture_on_commit_callbacks):
+    sessions = _value("kop_treatment_sessions_completed_total")
+    invoices = _value("kop_invoices_created_total", type="consultation")
+    payments = _value("kop_payments_created_total", method="card")
+    amount = _value("kop_payment_amount_total", method="card")
+
+    with django_capture_on_commit_callbacks(execute=True):
+        treatment = PatientTreatmentFactory(total_sessions=5)
+        session = TreatmentSessionFactory(treatment=treatment)
+        session.status = "completed"
+        session.save()
+        session.save()
+        set_sessions_status([TreatmentSessionFactory(treatment=treatment).pk])
+
+        invoice = InvoiceFactory(consultation=PatientConsultationFactory())
+        invoice.save()
+        payment = PaymentFactory(invoice=invoice, amount=Decimal("150.50"), method="card")
+        payment.save()
+
+    assert _value("kop_treatment_sessions_completed_total") == sessions + 2
+    assert _value("kop_invoices_created_total", type="consultation") == invoices + 1
+    assert _value("kop_payments_created_total", method="card") == payments + 1
+    assert _value("kop_payment_amount_total", method="card") == amount + 150.5
+
+
+def test_rolled_back_saves_are_not_counted(django_capture_on_commit_callbacks):
+    before = _value("kop_treatment_sessions_completed_total")
+
+    with django_capture_on_commit_callbacks() as callbacks:
+        TreatmentSessionFactory(status="completed")
+
+    assert callbacks
+    assert _value("kop_treatment_sessions_completed_total") == before
+
+
+def test_failed_saves_are_not_counted(django_capture_on_commit_callbacks):
+    before = [
+        _value("kop_treatment_sessions_completed_total"),
+        _value("kop_invoices_created_total", type="consultation"),
+        _value("kop_payments_created_total", method="card"),
+    ]
+    treatment = PatientTreatmentFactory()
+    session = TreatmentSessionFactory.build(treatment=treatment, treatment_doctor=treatment.doctor, status="completed")
+    consultation = PatientConsultationFactory()
+    invoice = InvoiceFactory.build(patient=consultation.patient, consultation=consultation)
+    payment = PaymentFactory.build(invoice=InvoiceFactory(), method="card")
+
+    def refuse(sender, **kwargs):
+        raise ValueError("refused")
+
+    # The caller's transaction carries on after each failure, and commits
+    with django_capture_on_commit_callbacks(execute=True):
+        for instance in (session, invoice, payment):
+            pre_save.connect(refuse, sender=type(instance))
+            try:
+                with pytest.raises(ValueError, match="refused"):
+                    instance.save()
+            finally:
+                pre_save.disconnect(refuse, sender=type(instance))
+
+    assert [
+        _value("kop_treatment_sessions_completed_total"),
+        _value("kop_invoices_created_total", type="consultation"),
+        _value("kop_payments_created_total", method="card"),
+    ] == before
+
+
+def test_requests_are_observed_per_url_name(client, doctor):
+    client.force_login(doctor.user)
+    labels = {"view": "patient-list", "method": "GET", "status": "200"}
+    requests = _value("kop_request_duration_seconds_count", **labels)
+
+    client.get(reverse("patient-list"))
+    client.get("/kop/no-such-page/")
+
+    assert _value("kop_request_duration_seconds_count", **labels) == requests + 1
+    assert _value("kop_request_db_queries_count", view="patient-list") >= 1
+    assert _value("kop_db_query_duration_seconds_count", view="patient-list") >= 1
+    assert _value("kop_request_duration_seconds_count", view="unmatched", method="GET", status="404") >= 1
+
+
+def test_endpoint_needs_superadmin_or_token(client, doctor, settings):
+    assert client.get(reverse("metrics")).status_code == 403
+
+    settings.METRICS_TOKEN = "s3cret"
+    response = client.get(reverse("metrics"), headers={"Authorization": "Bearer s3cret"})
+    assert response.status_code == 200
+    assert response["Content-Type"].startswith("text/plain")
+    assert b"# TYPE kop_request_duration_seconds histogram" in response.content
+    assert client.get(reverse("metrics"), headers={"Authorization": "Bearer nope"}).status_code == 403
+
+    client.force_login(UserFactory(is_superuser=True))
+    assert client.get(reverse("metrics")).status_code == 200
+
+
+def test_workers_are_added_up_from_the_shared_directory(client, tmp_path, monkeypatch):
+    env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(tmp_path)}
+    worker = (
+        "import django; django.setup(); "
+        "from kop.utils import metrics; "
+        "metrics.PAYMENTS_CREATED.labels('cash').inc(3)"
+    )
+    for _ in range(2):
+        subprocess.run([sys.executable, "-c", worker], env=env, check=True)
+
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+    client.force_login(UserFactory(is_superuser=True))
+    response = client.get(reverse("metrics"))
+
+    assert b'kop_payments_created_total{method="cash"} 6.0' in response.content
@@ -0,0 +1,124 @@
+import base64
+import datetime
+import json
+
+import pytest
+from django.core.paginator import InvalidPage
+from django.urls import reverse
+from django.utils import timezone
+
+from kop.models import Patient
+from kop.tests.factories import PatientConsultationFactory
+from kop.tests.factories import PatientFactory
+from kop.tests.factories import TreatmentSessionFactory
+from kop.utils.pagination import KeysetPaginator
+from kop.utils.pagination import approximate_count
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def patients():
+    PatientFactory.create_batch(7)
+    # Ties on created_at have to be broken by id
+    Patient.objects.update(created_at=timezone.now())
+    return list(Patient.objects.order_by("-created_at", "-id"))
+
+
+def _walk(paginator, cursor=None, backwards=False):
+    pages = []
+    while True:
+        page = paginator.page(cursor)
+        pages.append([patient.pk for patient in page])
+        cursor = page.previous_cursor if backwards else page.next_cursor
+        if cursor is None:
+            return pages
+
+
+def test_keyset_pages_forward_and_back(patients):
+    paginator = KeysetPaginator(Patient.objects.all(), ("-created_at", "-id"), 3)
+    expected = [patient.pk for patient in patients]
+
+    forward = _walk(paginator)
+    assert forward == [expected[0:3], expected[3:6], expected[6:7]]
+
+    last = paginator.page(paginator.page(paginator.page().next_cursor).next_cursor)
+    assert not last.has_next() and last.has_previous()
+    assert _walk(paginator, last.previous_cursor, backwards=True) == [expected[3:6], expected[0:3]]
+    assert not paginator.page().has_previous()
+
+
+def test_deep_page_is_a_single_query(patients, django_assert_num_queries):
+    paginator = KeysetPaginator(Patient.objects.all(), ("-created_at", "-id"), 2)
+    cursor = paginator.page(paginator.page().next_cursor).next_cursor
+
+    with django_assert_num_queries(1):
+        page = paginator.page(cursor)
+
+    assert [patient.pk for patient in page] == [patient.pk for patient in patients[4:6]]
+
+
+@pytest.mark.parametrize("payload", [None, [], {"k": ["2030-01-07"]}, {"k": ["not a date", 1]}, {"k": 5}])
+def test_invalid_cursor(payload):
+    paginator = KeysetPaginator(Patient.objects.all(), ("-created_at", "-id"), 2)
+    cursor = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode() if payload is not None else "not-a-cursor"
+
+    with pytest.raises(InvalidPage):
+        paginator.page(cursor)
+
+
+def test_approximate_count_is_cached(patients, django_assert_num_queries):
+    assert approximate_count(Patient.objects.all()) == 7
+
+    PatientFactory()
+    with django_assert_num_queries(0):
+        assert approximate_count(Patient.objects.order_by("first_name")) == 7
+
+
+def test_patient_list_pages_by_cursor(client, doctor):
+    PatientFactory.create_batch(12, branch=doctor.branch)
+    client.force_login(doctor.user)
+
+    first = client.get(reverse("patient-list"))
+    second = client.get(reverse("patient-list"), {"cursor": first.context["page_obj"].next_cursor})
+
+    assert len(first.context["page_obj"]) == 10
+    assert len(second.context["page_obj"]) == 2
+    assert b"About 12 results" in first.content
+    assert client.get(reverse("patient-list"), {"cursor": "bogus"}).status_code == 404
+
+
+def test_consultation_list_keeps_filters_in_cursor_links(client, doctor):
+    day = datetime.date(2030, 1, 7)
+    PatientConsultationFactory.create_batch(11, doctor=doctor, date=day, patient__branch=doctor.branch)
+    client.force_login(doctor.user)
+
+    response = client.get(reverse("consultation-list"), {"date": day.isoformat()})
+
+    page = response.context["page_obj"]
+    assert page.is_keyset and page.has_next()
+    assert f"?date=2030-01-07&amp;cursor={page.next_cursor}" in response.content.decode()
+
+
+def test_old_page_links_still_work(client, doctor):
+    TreatmentSessionFactory.create_batch(11, treatment_doctor=doctor)
+    client.force_login(doctor.user)
+
+    response = client.get(reverse("treatment-session-list"), {"page": 2})
+
+    assert response.context["page_obj"].number == 2
+    assert len(response.context["page_obj"]) == 1
+
+
+def test_api_sessions_use_keyset_pagination(client, doctor):
+    sessions = TreatmentSessionFactory.create_batch(12, treatment_doctor=doctor)
+    client.force_login(doctor.user)
+
+    first = client.get("/api/treatment-sessions/").json()
+    second = client.get(first["next"]).json()
+
+    assert first["count"] == 12
+    assert first["previous"] is None
+    assert {row["id"] for row in first["results"] + second["results"]} == {session.pk for session in sessions}
+    assert second["next"] is None
+    assert client.get(second["previous"]).json()["results"] == first["results"]
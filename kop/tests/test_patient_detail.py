@@ -0,0 +1,80 @@
+import datetime
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from kop.tests.factories import InvoiceFactory
+from kop.tests.factories import PatientConsultationFactory
+from kop.tests.factories import PatientFactory
+from kop.tests.factories import PatientTreatmentFactory
+from kop.tests.factories import PaymentFactory
+from kop.tests.factories import TreatmentSessionFactory
+from kop.utils.patient_detail import load_patient_detail
+
+pytestmark = pytest.mark.django_db
+
+TODAY = timezone.now().date()
+
+
+def _patient_with_history(branch, size):
+    patient = PatientFactory(branch=branch)
+    for _ in range(size):
+        treatment = PatientTreatmentFactory(patient=patient, total_sessions=5)
+        TreatmentSessionFactory(treatment=treatment, date=TODAY - datetime.timedelta(days=7), status="cancelled")
+        TreatmentSessionFactory(treatment=treatment, date=TODAY - datetime.timedelta(days=1), status="no_show")
+        TreatmentSessionFactory(treatment=treatment, date=TODAY + datetime.timedelta(days=1))
+        PatientConsultationFactory(patient=patient)
+        invoice = InvoiceFactory(patient=patient, treatment=treatment)
+        PaymentFactory.create_batch(2, invoice=invoice)
+    return patient
+
+
+def _detail_queries(client, patient):
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(reverse("patient-detail", args=[patient.pk]))
+    assert response.status_code == 200
+    return len(queries)
+
+
+def test_loader_runs_a_fixed_number_of_queries(doctor, django_assert_num_queries):
+    patient = _patient_with_history(doctor.branch, 3)
+
+    # patient, treatments, sessions, consultations, invoices, payments, attachments
+    with django_assert_num_queries(7):
+        context = load_patient_detail(patient.pk)
+        treatments = list(context["treatments"])
+        # The latest past session, not the upcoming one
+        assert all(
+            [(session.date, session.status) for session in treatment.last_sessions]
+            == [(TODAY - datetime.timedelta(days=1), "no_show")]
+            for treatment in treatments
+        )
+        assert {treatment.doctor.full_name for treatment in treatments}
+        assert len(context["consultations"]) == 3
+        assert len(context["payments"]) == 6
+        assert list(context["attachments"]) == []
+
+    dates = [(payment.payment_date, payment.pk) for payment in context["payments"]]
+    assert dates == sorted(dates, reverse=True)
+
+
+def test_detail_page_query_count_does_not_grow_with_history(client, doctor):
+    client.force_login(doctor.user)
+
+    small = _detail_queries(client, _patient_with_history(doctor.branch, 1))
+    large = _detail_queries(client, _patient_with_history(doctor.branch, 8))
+
+    assert small == large
+
+
+def test_detail_page_shows_consultation_times(client, doctor):
+    patient = PatientFactory(branch=doctor.branch)
+    PatientConsultationFactory(patient=patient, start_time=datetime.time(9, 30), end_time=datetime.time(10, 0))
+    client.force_login(doctor.user)
+
+    response = client.get(reverse("patient-detail", args=[patient.pk]))
+
+    assert "09:30 - 10:00" in response.content.decode()
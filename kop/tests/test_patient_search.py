@@ -0,0 +1,78 @@
+import pytest
+from django.urls import reverse
+
+from kop.models import Patient
+from kop.tests.factories import PatientFactory
+from kop.tests.factories import PatientTreatmentFactory
+from kop.utils.patient_search import search_patients
+
+pytestmark = pytest.mark.django_db
+
+
+def test_phone_digits_follow_phone():
+    patient = PatientFactory(phone="+91 98765-43210")
+    assert patient.phone_digits == "919876543210"
+
+    patient.phone = "(080) 2222 3333"
+    patient.save(update_fields=["phone"])
+
+    patient.refresh_from_db()
+    assert patient.phone_digits == "08022223333"
+
+
+def test_every_word_must_match_a_name():
+    anna = PatientFactory(first_name="Anna", last_name="Karenina")
+    PatientFactory(first_name="Anna", last_name="Smith")
+    PatientFactory(first_name="Leo", last_name="Tolstoy")
+
+    assert list(search_patients(Patient.objects.all(), "ann karen")) == [anna]
+
+
+def test_best_matches_come_first():
+    contains = PatientFactory(first_name="Joanna", last_name="Roy")
+    surname = PatientFactory(first_name="Mira", last_name="Annand")
+    exact = PatientFactory(first_name="Anna", last_name="Das")
+
+    results = list(search_patients(Patient.objects.all(), "anna"))
+
+    assert results[0] == exact
+    assert set(results) == {exact, surname, contains}
+
+
+def test_digits_search_the_normalized_phone():
+    patient = PatientFactory(phone="+91 98765 43210")
+    PatientFactory(phone="9123456789")
+
+    assert list(search_patients(Patient.objects.all(), "98765-432")) == [patient]
+    assert list(search_patients(Patient.objects.all(), phone="(987) 65")) == [patient]
+
+
+def test_patient_list_searches_name_and_phone(client, doctor):
+    match = PatientFactory(first_name="Anna", phone="9876500001", branch=doctor.branch)
+    PatientFactory(first_name="Anna", phone="9111100002", branch=doctor.branch)
+    PatientFactory(first_name="Anna", phone="9876500003")
+    client.force_login(doctor.user)
+
+    response = client.get(reverse("patient-list"), {"name": "ann", "phone": "98765"})
+
+    assert list(response.context["page_obj"]) == [match]
+
+
+def test_patient_autocomplete(client, doctor):
+    match = PatientFactory(first_name="Priya", last_name="Nair", branch=doctor.branch)
+    PatientFactory(first_name="Priya", last_name="Nair")
+    client.force_login(doctor.user)
+
+    response = client.get(reverse("patient-autocomplete"), {"q": "nair"})
+
+    assert [result["id"] for result in response.json()["results"]] == [str(match.pk)]
+
+
+def test_treatment_autocomplete_searches_patients(client, doctor):
+    match = PatientTreatmentFactory(patient__first_name="Ravi", patient__branch=doctor.branch, doctor=doctor)
+    PatientTreatmentFactory(patient__first_name="Kiran", patient__branch=doctor.branch, doctor=doctor)
+    client.force_login(doctor.user)
+
+    response = client.get(reverse("treatment-program-autocomplete"), {"q": "ravi"})
+
+    assert [result["id"] for result in response.json()["results"]] == [str(match.pk)]
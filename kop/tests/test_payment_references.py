@@ -0,0 +1,63 @@
+import pytest
+from django.urls import reverse
+
+from kop.models import Invoice
+from kop.models import Payment
+from kop.tests.factories import InvoiceFactory
+from kop.tests.factories import PatientConsultationFactory
+from kop.tests.factories import PaymentFactory
+from kop.utils.payment_references import allocate_payment_numbers
+from kop.utils.payment_references import assign_payment_references
+from smart_physio.users.tests.factories import UserFactory
+
+pytestmark = pytest.mark.django_db
+
+
+def test_payment_save_generates_reference():
+    invoice = InvoiceFactory()
+
+    first = PaymentFactory(invoice=invoice, reference="")
+    second = PaymentFactory(invoice=invoice, reference="")
+
+    assert first.reference == f"PAY-{invoice.pk}-1"
+    assert second.reference == f"PAY-{invoice.pk}-2"
+
+
+def test_manual_reference_is_kept():
+    payment = PaymentFactory(reference="CHEQUE-123")
+
+    assert payment.reference == "CHEQUE-123"
+
+
+def test_batch_allocation_is_one_query(django_assert_num_queries):
+    invoice, other = InvoiceFactory(), InvoiceFactory()
+    payments = [Payment(invoice=invoice, amount=10, method="cash") for _ in range(3)]
+    payments.append(Payment(invoice=other, amount=10, method="cash"))
+
+    with django_assert_num_queries(1):
+        assign_payment_references(payments)
+
+    assert [p.reference for p in payments] == [
+        f"PAY-{invoice.pk}-1",
+        f"PAY-{invoice.pk}-2",
+        f"PAY-{invoice.pk}-3",
+        f"PAY-{other.pk}-1",
+    ]
+
+
+def test_allocation_for_missing_invoice_fails():
+    with pytest.raises(Invoice.DoesNotExist):
+        allocate_payment_numbers({0: 1})
+
+
+def test_create_payment_view_without_reference(client):
+    invoice = InvoiceFactory(consultation=PatientConsultationFactory())
+    client.force_login(UserFactory(is_superuser=True))
+
+    response = client.post(
+        reverse("create_payment", kwargs={"invoice_id": invoice.pk}),
+        {"amount": "100.00", "discount_amount": "0", "method": "cash", "reference": ""},
+    )
+
+    assert response.status_code == 302
+    assert invoice.payments.get().reference == f"PAY-{invoice.pk}-1"
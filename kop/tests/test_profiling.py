@@ -0,0 +1,106 @@
+import json
+import logging
+
+import pytest
+from django.db import connection
+from django.urls import reverse
+
+from kop.models import Patient
+from kop.tests.factories import PatientFactory
+from kop.utils.profiling import RequestProfile
+from kop.utils.profiling import clear_profiles
+from kop.utils.profiling import fingerprint
+from kop.utils.profiling import recent_profiles
+from smart_physio.users.tests.factories import UserFactory
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def _empty_buffer():
+    clear_profiles()
+    yield
+    clear_profiles()
+
+
+@pytest.fixture
+def superadmin(client):
+    user = UserFactory(is_superuser=True, is_staff=True)
+    client.force_login(user)
+    return user
+
+
+def test_fingerprint_drops_values():
+    assert fingerprint("SELECT * FROM t WHERE id = %s") == fingerprint("SELECT *  FROM t\nWHERE id = %s")
+    assert fingerprint("SELECT 1 FROM t WHERE name = 'a' AND id IN (%s, %s)") == \
+        fingerprint("SELECT 2 FROM t WHERE name = 'b' AND id IN (%s, %s, %s)") == \
+        "SELECT ? FROM t WHERE name = ? AND id IN (...)"
+
+
+def test_off_unless_enabled(client, superadmin):
+    response = client.get(reverse("patient-list"))
+
+    assert "Server-Timing" not in response
+    assert recent_profiles() == []
+
+
+def test_header_profiles_superadmin_requests(client, superadmin, caplog):
+    PatientFactory.create_batch(3)
+
+    with caplog.at_level(logging.INFO, logger="kop.profiling"):
+        response = client.get(reverse("patient-list"), headers={"X-Profile": "1"})
+
+    assert "sql;dur=" in response["Server-Timing"]
+    [profile] = recent_profiles()
+    assert profile["view"] == "patient-list"
+    assert profile["status"] == 200
+    assert profile["sql_count"] > 0
+    assert profile["template_ms"] > 0
+    assert json.loads(caplog.records[-1].getMessage())["id"] == profile["id"]
+
+
+def test_header_is_ignored_for_other_users(client, doctor):
+    client.force_login(doctor.user)
+
+    client.get(reverse("patient-list"), headers={"X-Profile": "1"})
+
+    assert recent_profiles() == []
+
+
+def test_setting_profiles_every_request(client, settings):
+    settings.REQUEST_PROFILING = True
+    client.force_login(UserFactory())
+
+    client.get(reverse("patients-list"))
+
+    [profile] = recent_profiles()
+    assert profile["view"] == "patients-list"
+
+
+def test_repeated_queries_are_grouped():
+    patients = PatientFactory.create_batch(3)
+    profile = RequestProfile()
+
+    with connection.execute_wrapper(profile):
+        for patient in [*patients, patients[0]]:
+            Patient.objects.get(pk=patient.pk)
+        Patient.objects.count()
+
+    [duplicate] = profile.duplicates()
+    assert duplicate["count"] == 4
+    assert duplicate["identical"] == 1
+    assert "WHERE" in duplicate["fingerprint"]
+
+
+def test_page_is_for_superadmins_only(client, doctor, superadmin):
+    client.get(reverse("patient-list"), headers={"X-Profile": "1"})
+
+    response = client.get(reverse("request-profiling"))
+    assert response.status_code == 200
+    assert b"patient-list" in response.content
+
+    client.post(reverse("request-profiling"))
+    assert recent_profiles() == []
+
+    client.force_login(doctor.user)
+    assert client.get(reverse("request-profiling")).status_code == 403
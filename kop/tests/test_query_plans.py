@@ -0,0 +1,163 @@
+"""
+Check that the hot list/filter queries can be served by the indexes in
+kop.models Meta.indexes. PostgreSQL only: sequential scans and sorts are
+switched off for the test transaction, and the tables are seeded with a
+spread of doctors, patients and dates and analyzed, so the planner weighs the
+indexes on real statistics and the plan must name the expected one.
+"""
+import datetime
+
+import pytest
+from django.db import connection
+from django.db.models import F
+
+from kop.models import Invoice
+from kop.models import Patient
+from kop.models import PatientConsultation
+from kop.models import PatientTreatment
+from kop.models import TreatmentSession
+from kop.tests.factories import BranchFactory
+from kop.tests.factories import DoctorProfileFactory
+from kop.tests.factories import PatientFactory
+from kop.tests.factories import PatientTreatmentFactory
+from kop.utils.patient_search import search_patients
+from kop.utils.patient_search import trigram_enabled
+
+pytestmark = [
+    pytest.mark.django_db,
+    pytest.mark.skipif(connection.vendor != "postgresql", reason="query plans are PostgreSQL specific"),
+]
+
+TODAY = datetime.date(2030, 1, 7)
+
+
+@pytest.fixture(autouse=True)
+def _no_seqscan():
+    with connection.cursor() as cursor:
+        cursor.execute("SET LOCAL enable_seqscan = off")
+        # Once the tables are analyzed at a few rows, an index scan plus a sort costs the same as an ordered index
+        cursor.execute("SET LOCAL enable_sort = off")
+
+
+@pytest.fixture(autouse=True)
+def spread_doctors():
+    """
+    A few weeks of bookings over several doctors and patients. Left with the
+    handful of rows a test creates and whatever statistics autovacuum last
+    saw, a composite index and a single-column one can cost the same and the
+    plan flips between them from run to run. Returns the seeded doctors: one
+    with no rows at all is cheapest to look up by its foreign key alone.
+    """
+    doctors = DoctorProfileFactory.create_batch(5)
+    patients = [PatientFactory(branch=doctor.branch) for doctor in doctors]
+    for doctor, patient in zip(doctors, patients):
+        PatientTreatmentFactory.create_batch(3, doctor=doctor, patient=patient)
+    dates = [TODAY + datetime.timedelta(days=offset) for offset in range(-20, 20)]
+    TreatmentSession.objects.bulk_create(
+        TreatmentSession(
+            treatment_doctor=doctor, date=date, start_time=datetime.time(9, 0), end_time=datetime.time(10, 0),
+            status="completed" if date < TODAY else "scheduled",
+        )
+        for doctor in doctors for date in dates
+    )
+    PatientConsultation.objects.bulk_create(
+        PatientConsultation(
+            patient=patient, doctor=doctor, consultation_type="initial", date=date,
+            start_time=datetime.time(11, 0), end_time=datetime.time(11, 30),
+            status="completed" if date < TODAY else "scheduled",
+        )
+        for doctor, patient in zip(doctors, patients) for date in dates
+    )
+    Invoice.objects.bulk_create(
+        Invoice(
+            invoice_number=f"SPREAD-{patient.pk}-{number}", patient=patient, due_date=TODAY,
+            total=100, balance=100,
+        )
+        for patient in patients for number in range(20)
+    )
+    with connection.cursor() as cursor:
+        for model in (TreatmentSession, PatientConsultation, Invoice, Patient, PatientTreatment):
+            cursor.execute(f"ANALYZE {model._meta.db_table}")
+    return doctors
+
+
+def _assert_uses(queryset, index):
+    plan = queryset.explain()
+    assert index in plan, plan
+
+
+def _assert_count_uses(queryset, index):
+    with connection.cursor() as cursor:
+        sql, params = queryset.values("pk").order_by().query.sql_with_params()
+        cursor.execute(f"EXPLAIN SELECT COUNT(*) FROM ({sql}) counted", params)
+        plan = "\n".join(row[0] for row in cursor.fetchall())
+    assert index in plan, plan
+
+
+def test_doctor_dashboard_counters(spread_doctors):
+    doctor = spread_doctors[0]
+    _assert_count_uses(
+        TreatmentSession.objects.filter(treatment_doctor=doctor, date__gte=TODAY, status="scheduled"),
+        "session_doctor_status_idx",
+    )
+    _assert_count_uses(
+        PatientConsultation.objects.filter(doctor=doctor, date__gte=TODAY, status="completed"),
+        "consultation_doctor_status_idx",
+    )
+
+
+def test_doctor_day_schedule(spread_doctors):
+    doctor = spread_doctors[0]
+    _assert_uses(
+        TreatmentSession.objects.filter(treatment_doctor=doctor, date=TODAY).order_by("start_time"),
+        "session_doctor_slot_idx",
+    )
+
+
+def test_session_and_consultation_lists():
+    _assert_uses(TreatmentSession.objects.order_by("-date", "-start_time")[:20], "session_date_idx")
+    _assert_uses(PatientConsultation.objects.order_by("-date", "-start_time")[:20], "consultation_date_idx")
+
+
+def test_branch_appointments_for_a_day():
+    _assert_uses(
+        PatientConsultation.objects.filter(date=TODAY, patient__branch=BranchFactory()),
+        "consultation_date_idx",
+    )
+
+
+def test_patient_list():
+    _assert_uses(
+        Patient.objects.filter(branch=BranchFactory()).order_by("-created_at")[:10],
+        "patient_branch_created_idx",
+    )
+
+
+def test_patient_invoices():
+    _assert_uses(
+        Invoice.objects.filter(patient=PatientFactory()).order_by("-invoice_date"),
+        "invoice_patient_date_idx",
+    )
+    _assert_uses(Invoice.objects.order_by("-invoice_date")[:20], "invoice_date_idx")
+
+
+def test_ongoing_treatments(spread_doctors):
+    doctor = spread_doctors[0]
+    _assert_uses(
+        PatientTreatment.objects.filter(doctor=doctor, status="ongoing", is_active=True),
+        "treatment_ongoing_doctor_idx",
+    )
+    _assert_uses(
+        PatientTreatment.objects.filter(
+            patient__branch=BranchFactory(), status="ongoing", is_active=True,
+        ).annotate(remaining=F("total_sessions") - F("sessions_completed")),
+        "treatment_ongoing_patient_idx",
+    )
+
+
+def test_patient_search():
+    if not trigram_enabled():
+        pytest.skip("pg_trgm is not installed")
+    _assert_uses(search_patients(Patient.objects.all(), "ann"), "patient_first_name_upper_trgm")
+    _assert_uses(search_patients(Patient.objects.all(), "ann"), "patient_last_name_upper_trgm")
+    _assert_uses(search_patients(Patient.objects.all(), "98765"), "patient_phone_digits_trgm")
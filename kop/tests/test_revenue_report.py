@@ -0,0 +1,186 @@
+import datetime
+from decimal import Decimal
+
+import pytest
+from django.urls import reverse
+from django.utils import timezone
+
+from kop.models import BranchAdmin
+from kop.models import Invoice
+from kop.models import Payment
+from kop.tests.factories import BranchFactory
+from kop.tests.factories import InvoiceFactory
+from kop.tests.factories import PatientConsultationFactory
+from kop.tests.factories import PatientFactory
+from kop.tests.factories import PatientTreatmentFactory
+from kop.tests.factories import PaymentFactory
+from kop.utils.revenue_report import aging_buckets
+from kop.utils.revenue_report import month_partitions
+from kop.utils.revenue_report import revenue_report
+from kop.utils.revenue_report import revenue_sums
+from smart_physio.users.tests.factories import UserFactory
+
+pytestmark = pytest.mark.django_db
+
+TODAY = datetime.date(2030, 3, 15)
+
+
+def _backdate(invoice, day, *payments):
+    """invoice_date and payment_date are auto_now_add, so move them with update()"""
+    Invoice.objects.filter(pk=invoice.pk).update(invoice_date=day)
+    Payment.objects.filter(pk__in=[payment.pk for payment in payments]).update(payment_date=day)
+
+
+@pytest.fixture
+def invoices(doctor):
+    """A treatment invoice paid by card with a discount and an unpaid consultation invoice, on 2030-02-10"""
+    patient = PatientFactory(branch=doctor.branch)
+    treatment = PatientTreatmentFactory(patient=patient, doctor=doctor)
+    treatment_invoice = InvoiceFactory(patient=patient, treatment=treatment, total=Decimal("1000.00"))
+    payment = PaymentFactory(
+        invoice=treatment_invoice, amount=Decimal("400.00"), discount_amount=Decimal("50.00"), method="card"
+    )
+    consultation_invoice = InvoiceFactory(
+        patient=patient, consultation=PatientConsultationFactory(patient=patient, doctor=doctor),
+    )
+    _backdate(treatment_invoice, datetime.date(2030, 2, 10), payment)
+    _backdate(consultation_invoice, datetime.date(2030, 2, 10))
+    return {"treatment": treatment, "payment": payment}
+
+
+def test_month_partitions_split_at_month_ends():
+    assert list(month_partitions(datetime.date(2030, 1, 20), datetime.date(2030, 3, 5))) == [
+        (datetime.date(2030, 1, 1), datetime.date(2030, 1, 20), datetime.date(2030, 1, 31), datetime.date(2030, 1, 31)),
+        (datetime.date(2030, 2, 1), datetime.date(2030, 2, 1), datetime.date(2030, 2, 28), datetime.date(2030, 2, 28)),
+        (datetime.date(2030, 3, 1), datetime.date(2030, 3, 1), datetime.date(2030, 3, 5), datetime.date(2030, 3, 31)),
+    ]
+
+
+def test_revenue_is_grouped_by_every_dimension(doctor, invoices):
+    report = revenue_report(doctor.branch_id, datetime.date(2030, 1, 1), TODAY, today=TODAY)
+
+    assert report["totals"] == {
+        "invoiced": Decimal("1600.00"), "invoice_count": 2,
+        "collected": Decimal("400.00"), "discounts": Decimal("50.00"), "payment_count": 1,
+    }
+    program, consultations = report["revenue"]["program"]
+    assert (program["key"], program["invoiced"], program["collected"]) == (
+        invoices["treatment"].treatment_program_id, Decimal("1000.00"), Decimal("400.00")
+    )
+    assert (consultations["name"], consultations["invoiced"]) == ("Consultations", Decimal("600.00"))
+    assert [(row["key"], row["invoiced"]) for row in report["revenue"]["doctor"]] == [
+        (doctor.pk, Decimal("1600.00"))
+    ]
+    assert [(row["name"], row["collected"], row["discounts"]) for row in report["revenue"]["method"]] == [
+        ("Card", Decimal("400.00"), Decimal("50.00"))
+    ]
+
+
+def test_aging_buckets_by_days_overdue(doctor):
+    patient = PatientFactory(branch=doctor.branch)
+    for days_overdue in (-3, 0, 10, 45, 200):
+        InvoiceFactory(patient=patient, due_date=TODAY - datetime.timedelta(days=days_overdue))
+    InvoiceFactory(patient=patient, due_date=TODAY - datetime.timedelta(days=10), balance=0, status="paid")
+    InvoiceFactory(patient=patient, due_date=TODAY, status="draft")
+
+    buckets = {row["bucket"]: (row["balance"], row["count"]) for row in aging_buckets(doctor.branch_id, TODAY)}
+
+    assert buckets == {
+        "current": (Decimal("1200.00"), 2),
+        "1-30": (Decimal("600.00"), 1),
+        "31-60": (Decimal("600.00"), 1),
+        "61-90": (Decimal("0"), 0),
+        "90+": (Decimal("600.00"), 1),
+    }
+
+
+def test_closed_months_are_cached_until_a_late_change(
+    doctor, invoices, django_assert_num_queries, django_capture_on_commit_callbacks
+):
+    february = (datetime.date(2030, 2, 1), datetime.date(2030, 2, 28))
+    assert revenue_sums(doctor.branch_id, *february, today=TODAY)["branch"][doctor.branch_id]["invoiced"] == 1600
+
+    # Rows written without save() don't reach the cached month
+    late = InvoiceFactory(patient=PatientFactory(branch=doctor.branch))
+    _backdate(late, datetime.date(2030, 2, 20))
+    with django_assert_num_queries(0):
+        assert revenue_sums(doctor.branch_id, *february, today=TODAY)["branch"][doctor.branch_id]["invoiced"] == 1600
+
+    # A save does once it commits, and so does the all-branches report
+    late.refresh_from_db()
+    late.notes = "Late"
+    with django_capture_on_commit_callbacks(execute=True):
+        late.save()
+    assert revenue_sums(doctor.branch_id, *february, today=TODAY)["branch"][doctor.branch_id]["invoiced"] == 2200
+    assert revenue_sums(None, *february, today=TODAY)["branch"][doctor.branch_id]["invoiced"] == 2200
+
+
+def test_moved_payments_reopen_both_months(doctor, invoices, django_capture_on_commit_callbacks):
+    february = (datetime.date(2030, 2, 1), datetime.date(2030, 2, 28))
+    march = (datetime.date(2030, 3, 1), datetime.date(2030, 3, 31))
+    today = datetime.date(2030, 4, 15)
+    assert revenue_sums(doctor.branch_id, *february, today=today)["branch"][doctor.branch_id]["collected"] == 400
+    assert doctor.branch_id not in revenue_sums(doctor.branch_id, *march, today=today)["branch"]
+
+    payment = Payment.objects.get()
+    payment.payment_date = datetime.date(2030, 3, 5)
+    with django_capture_on_commit_callbacks(execute=True):
+        payment.save()
+
+    assert revenue_sums(doctor.branch_id, *february, today=today)["branch"][doctor.branch_id]["collected"] == 0
+    assert revenue_sums(doctor.branch_id, *march, today=today)["branch"][doctor.branch_id]["collected"] == 400
+
+
+def test_cached_months_are_kept_until_the_change_commits(doctor, invoices, django_capture_on_commit_callbacks):
+    february = (datetime.date(2030, 2, 1), datetime.date(2030, 2, 28))
+    revenue_sums(doctor.branch_id, *february, today=TODAY)
+
+    invoice = Invoice.objects.get(total=Decimal("1000.00"))
+    with django_capture_on_commit_callbacks() as callbacks:
+        invoice.total = Decimal("1200.00")
+        invoice.save()
+        assert revenue_sums(doctor.branch_id, *february, today=TODAY)["branch"][doctor.branch_id]["invoiced"] == 1600
+
+    for callback in callbacks:
+        callback()
+    assert revenue_sums(doctor.branch_id, *february, today=TODAY)["branch"][doctor.branch_id]["invoiced"] == 1800
+
+
+def test_open_month_is_not_cached(doctor):
+    today = timezone.now().date()
+    patient = PatientFactory(branch=doctor.branch)
+    InvoiceFactory(patient=patient)
+    first = revenue_sums(doctor.branch_id, today.replace(day=1), today)
+
+    Invoice.objects.update(total=Decimal("700.00"))
+
+    assert first["branch"][doctor.branch_id]["invoiced"] == 600
+    assert revenue_sums(doctor.branch_id, today.replace(day=1), today)["branch"][doctor.branch_id]["invoiced"] == 700
+
+
+def test_revenue_endpoint_is_scoped_to_the_users_branch(client, doctor):
+    admin = BranchAdmin.objects.create(user=UserFactory(), branch=doctor.branch, phone_number="9876543210")
+    invoice = InvoiceFactory(patient=PatientFactory(branch=doctor.branch))
+    PaymentFactory(invoice=invoice, discount_amount=Decimal("50.00"))
+    InvoiceFactory(patient=PatientFactory(branch=BranchFactory()))
+    client.force_login(admin.user)
+
+    response = client.get(reverse("reports-revenue"), {"branch": BranchFactory().pk})
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["branch"] == doctor.branch_id
+    assert [row["key"] for row in data["revenue"]["branch"]] == [doctor.branch_id]
+    assert data["totals"]["discounts"] == "50.00"
+    assert [bucket["bucket"] for bucket in data["aging"]["buckets"]] == ["current", "1-30", "31-60", "61-90", "90+"]
+
+
+def test_revenue_endpoint_is_for_branch_admins_and_superadmins(client, doctor):
+    client.force_login(UserFactory())
+    assert client.get(reverse("reports-revenue")).status_code == 403
+
+    client.force_login(doctor.user)
+    assert client.get(reverse("reports-revenue")).status_code == 403
+
+    client.force_login(UserFactory(is_superuser=True))
+    assert client.get(reverse("reports-revenue")).status_code == 200
@@ -0,0 +1,127 @@
+from types import SimpleNamespace
+
+import pytest
+from django.contrib.auth.models import AnonymousUser
+from django.urls import reverse
+
+from kop.models import BranchAdmin
+from kop.permissions.doctorprofile import DoctorModifyPermission
+from kop.permissions.doctorprofile import DoctorViewPermission
+from kop.tests.factories import BranchFactory
+from kop.tests.factories import DoctorProfileFactory
+from kop.utils.common import get_user_branch
+from kop.utils.roles import get_user_role
+from smart_physio.users.models import User
+from smart_physio.users.tests.factories import UserFactory
+
+pytestmark = pytest.mark.django_db
+
+
+def test_role_is_loaded_in_one_query_and_primes_the_profiles(doctor, django_assert_num_queries):
+    user = User.objects.get(pk=doctor.user.pk)
+
+    with django_assert_num_queries(1):
+        role = get_user_role(user)
+        assert not hasattr(user, "branch_admin")
+        assert user.doctor_profile.branch.name == doctor.branch.name
+
+    assert (role.role, role.profile_id, role.branch_id) == ("doctor", doctor.pk, doctor.branch_id)
+    assert get_user_branch(user) == doctor.branch
+
+
+def test_role_is_cached_across_requests(doctor, django_assert_num_queries):
+    get_user_role(User.objects.get(pk=doctor.user.pk))
+    user = User.objects.get(pk=doctor.user.pk)
+
+    with django_assert_num_queries(0):
+        assert get_user_role(user).is_doctor
+        assert get_user_role(user) is get_user_role(user)
+
+
+def test_profile_changes_invalidate_the_cached_role():
+    user = UserFactory()
+    assert get_user_role(User.objects.get(pk=user.pk)).role is None
+
+    admin = BranchAdmin.objects.create(user=user, branch=BranchFactory(), phone_number="9876543210")
+    assert get_user_role(User.objects.get(pk=user.pk)).is_branch_admin
+
+    moved_to = BranchFactory()
+    admin.branch = moved_to
+    admin.save()
+    assert get_user_role(User.objects.get(pk=user.pk)).branch_id == moved_to.pk
+
+    moved_to.name = "Renamed"
+    moved_to.save()
+    assert get_user_role(User.objects.get(pk=user.pk)).branch.name == "Renamed"
+
+    BranchAdmin.objects.filter(pk=admin.pk).delete()
+    assert get_user_role(User.objects.get(pk=user.pk)).role is None
+
+
+def test_doctor_wins_over_branch_admin_and_anonymous_has_no_role():
+    doctor = DoctorProfileFactory()
+    admin = BranchAdmin.objects.create(user=doctor.user, branch=BranchFactory(), phone_number="9876543210")
+
+    role = get_user_role(User.objects.get(pk=doctor.user.pk))
+    assert (role.role, role.branch_id) == ("doctor", doctor.branch_id)
+    assert role.is_branch_admin
+    assert role.branch_for("branch_admin") == admin.branch
+    assert get_user_role(AnonymousUser()).role is None
+    assert get_user_branch(AnonymousUser()) is None
+
+
+def test_login_redirect_and_decorators_use_the_role(client, doctor):
+    client.force_login(doctor.user)
+
+    assert client.get(reverse("login")).url == reverse("doctor_dashboard")
+    assert client.get(reverse("doctor_dashboard")).status_code == 200
+    assert client.get(reverse("branch_admin_dashboard")).status_code == 403
+
+
+def test_permissions_limit_branch_admins_to_their_branch(rf):
+    admin = BranchAdmin.objects.create(user=UserFactory(), branch=BranchFactory(), phone_number="9876543210")
+    own = DoctorProfileFactory(branch=admin.branch)
+    other = DoctorProfileFactory()
+    request = rf.get("/")
+    request.user = User.objects.get(pk=admin.user.pk)
+
+    assert DoctorModifyPermission().has_permission(request, None)
+    assert DoctorModifyPermission().has_object_permission(request, None, own)
+    assert not DoctorModifyPermission().has_object_permission(request, None, other)
+    assert DoctorViewPermission().has_permission(request, SimpleNamespace(kwargs={"pk": own.pk}))
+    assert not DoctorViewPermission().has_permission(request, SimpleNamespace(kwargs={"pk": other.pk}))
+    assert DoctorModifyPermission().has_object_permission(request, None, own.user)
+    assert not DoctorModifyPermission().has_object_permission(request, None, other.user)
+
+    request.user = User.objects.get(pk=own.user.pk)
+    assert not DoctorModifyPermission().has_permission(request, None)
+
+
+def test_users_api_is_limited_to_the_branch_admins_branch(client):
+    admin = BranchAdmin.objects.create(user=UserFactory(), branch=BranchFactory(), phone_number="9876543210")
+    own = DoctorProfileFactory(branch=admin.branch)
+    other = DoctorProfileFactory()
+    client.force_login(admin.user)
+
+    listed = {row["id"] for row in client.get("/api/users/").json()["results"]}
+    assert own.user.pk in listed
+    assert admin.user.pk in listed
+    assert other.user.pk not in listed
+
+    assert client.get(f"/api/users/{own.user.pk}/").status_code == 200
+    assert client.get(f"/api/users/{other.user.pk}/").status_code in (403, 404)
+
+    payload = {"email": own.user.email, "name": "Renamed"}
+    for method in (client.put, client.patch):
+        response = method(f"/api/users/{own.user.pk}/", payload, content_type="application/json")
+        assert response.status_code == 200
+    own.user.refresh_from_db()
+    assert own.user.name == "Renamed"
+
+    response = client.patch(f"/api/users/{other.user.pk}/", payload, content_type="application/json")
+    assert response.status_code in (403, 404)
+    assert client.delete(f"/api/users/{other.user.pk}/").status_code in (403, 404)
+    assert User.objects.filter(pk=other.user.pk).exists()
+
+    assert client.delete(f"/api/users/{own.user.pk}/").status_code == 204
+    assert not User.objects.filter(pk=own.user.pk).exists()
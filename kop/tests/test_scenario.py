@@ -0,0 +1,64 @@
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import Count, Q
+
+from kop.models import Invoice
+from kop.models import Patient
+from kop.models import PatientConsultation
+from kop.models import PatientTreatment
+from kop.models import TreatmentSession
+from kop.utils.booking_conflicts import find_overlaps
+from kop.utils.common import phone_digits
+from kop.utils.scenario import build_scenario
+
+pytestmark = pytest.mark.django_db
+
+
+def test_command_builds_a_consistent_scenario():
+    out = StringIO()
+
+    call_command("create_test_patients", branches=2, count=12, doctors=3, sessions=4, stdout=out)
+
+    assert "Created 2 branches, 6 doctors, 24 patients, 24 treatments, 96 sessions" in out.getvalue()
+    assert all(patient.phone_digits == phone_digits(patient.phone) for patient in Patient.objects.all())
+    assert Invoice.objects.count() == Invoice.objects.values("invoice_number").distinct().count() == 48
+
+    bookings = [
+        *TreatmentSession.objects.values_list("treatment_doctor", "date", "start_time", "end_time"),
+        *PatientConsultation.objects.values_list("doctor", "date", "start_time", "end_time"),
+    ]
+    assert find_overlaps(bookings) == []
+
+    completed = PatientTreatment.objects.annotate(
+        done=Count("treatmentsession", filter=Q(treatmentsession__status="completed"))
+    )
+    assert all(treatment.sessions_completed == treatment.done for treatment in completed)
+
+    totals = StringIO()
+    call_command("reconcile_invoice_totals", stdout=totals)
+    assert "All invoice totals match their payments" in totals.getvalue()
+
+
+def test_same_seed_gives_the_same_data():
+    build_scenario(patients=5, doctors=2, sessions=2, seed=7, label="First")
+    build_scenario(patients=5, doctors=2, sessions=2, seed=7, label="Second")
+
+    def names(label):
+        return list(
+            Patient.objects.filter(branch__name__startswith=label)
+            .order_by("pk").values_list("first_name", "last_name", "phone")
+        )
+
+    assert names("First") == names("Second")
+    assert build_scenario(patients=5, doctors=2, sessions=2, label="First")["branches"] == 1
+    assert Patient.objects.filter(branch__name="First Branch 2").count() == 5
+
+
+@pytest.mark.skipif(connection.vendor != "sqlite", reason="SQLite only")
+def test_workers_need_postgresql():
+    with pytest.raises(CommandError):
+        call_command("create_test_patients", workers=2)
@@ -0,0 +1,190 @@
+import datetime
+from importlib import import_module
+from io import StringIO
+
+import pytest
+from django.apps import apps
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from kop.models import DoctorProfile
+from kop.models import PatientTreatment
+from kop.models import PatientWeeklySchedule
+from kop.models import TreatmentSession
+from kop.tests.factories import PatientConsultationFactory
+from kop.tests.factories import PatientFactory
+from kop.tests.factories import PatientTreatmentFactory
+from kop.tests.factories import TreatmentSessionFactory
+from kop.utils import session_generator
+from kop.utils.session_generator import generate_sessions
+
+pytestmark = pytest.mark.django_db
+
+MONDAY = datetime.date(2030, 1, 7)
+
+
+def _schedule(treatment, day, hour=9):
+    return PatientWeeklySchedule.objects.create(
+        patient_treatment=treatment,
+        day_of_week=day,
+        start_time=datetime.time(hour, 0),
+        end_time=datetime.time(hour + 1, 0),
+    )
+
+
+def test_generates_sessions_for_each_scheduled_weekday():
+    treatment = PatientTreatmentFactory(total_sessions=30)
+    _schedule(treatment, "monday")
+    _schedule(treatment, "thursday", hour=15)
+
+    summary = generate_sessions(MONDAY, weeks=2)
+
+    assert summary["created"] == 4
+    dates = sorted(TreatmentSession.objects.filter(treatment=treatment).values_list("date", flat=True))
+    assert dates == [
+        MONDAY,
+        MONDAY + datetime.timedelta(days=3),
+        MONDAY + datetime.timedelta(days=7),
+        MONDAY + datetime.timedelta(days=10),
+    ]
+    assert set(TreatmentSession.objects.values_list("treatment_doctor", flat=True)) == {treatment.doctor_id}
+
+
+def test_rerun_skips_existing_sessions():
+    treatment = PatientTreatmentFactory(total_sessions=30)
+    _schedule(treatment, "monday")
+    generate_sessions(MONDAY, weeks=2)
+
+    summary = generate_sessions(MONDAY, weeks=3)
+
+    assert (summary["created"], summary["skipped"]) == (1, 2)
+    assert TreatmentSession.objects.filter(treatment=treatment).count() == 3
+
+
+def test_never_schedules_more_than_pending_sessions():
+    treatment = PatientTreatmentFactory(total_sessions=5, sessions_completed=2)
+    _schedule(treatment, "monday")
+    _schedule(treatment, "wednesday")
+
+    generate_sessions(MONDAY, weeks=12)
+
+    assert TreatmentSession.objects.filter(treatment=treatment).count() == 3
+
+
+def test_inactive_treatments_are_ignored():
+    _schedule(PatientTreatmentFactory(status="completed"), "monday")
+
+    assert generate_sessions(MONDAY, weeks=4)["created"] == 0
+
+
+def test_sessions_lost_to_a_concurrent_writer_are_not_counted(monkeypatch):
+    treatment = PatientTreatmentFactory(total_sessions=30)
+    _schedule(treatment, "monday")
+    doctor_bookings = session_generator.DoctorBookings
+
+    def other_writer_first(*args):
+        # Another run books the first Monday after the existing slots were looked up
+        TreatmentSessionFactory(treatment=treatment, date=MONDAY, start_time=datetime.time(9, 0))
+        return doctor_bookings(*args)
+
+    monkeypatch.setattr(session_generator, "DoctorBookings", other_writer_first)
+    summary = generate_sessions(MONDAY, weeks=2)
+
+    assert (summary["created"], summary["skipped"]) == (1, 1)
+    assert TreatmentSession.objects.filter(treatment=treatment).count() == 2
+
+
+@pytest.mark.skipif(connection.vendor != "postgresql", reason="drops the unique index inside the test transaction")
+def test_duplicate_sessions_stop_the_migration_until_merged():
+    with connection.cursor() as cursor:
+        cursor.execute("DROP INDEX unique_treatment_session_slot")
+    treatment = PatientTreatmentFactory(total_sessions=30)
+    slot = {"treatment": treatment, "date": MONDAY, "start_time": datetime.time(9, 0)}
+    kept = TreatmentSessionFactory(**slot, status="completed", assessment_notes="Knee flexion 90")
+    TreatmentSessionFactory(**slot, status="completed", assessment_notes="Swelling down")
+    TreatmentSessionFactory(**slot, status="scheduled")
+    assert PatientTreatment.objects.get(pk=treatment.pk).sessions_completed == 2
+
+    migration = import_module("kop.migrations.0024_treatmentsession_unique_treatment_session_slot")
+    with pytest.raises(RuntimeError, match=f"treatment {treatment.pk} on 2030-01-07 at 09:00:00: 3 sessions"):
+        migration.check_duplicate_sessions(apps, None)
+
+    out = StringIO()
+    call_command("dedupe_treatment_sessions", stdout=out)
+    assert "1 slots booked twice" in out.getvalue()
+    assert TreatmentSession.objects.filter(treatment=treatment).count() == 3
+
+    call_command("dedupe_treatment_sessions", "--fix", stdout=StringIO())
+
+    session = TreatmentSession.objects.get(treatment=treatment)
+    assert session.pk == kept.pk
+    assert "Knee flexion 90" in session.assessment_notes
+    assert "Swelling down" in session.assessment_notes
+    assert PatientTreatment.objects.get(pk=treatment.pk).sessions_completed == 1
+    migration.check_duplicate_sessions(apps, None)
+
+
+def test_lookups_do_not_grow_with_schedules():
+    for treatment in PatientTreatmentFactory.create_batch(20, total_sessions=50):
+        _schedule(treatment, "monday")
+        _schedule(treatment, "friday")
+
+    with CaptureQueriesContext(connection) as queries:
+        summary = generate_sessions(MONDAY, weeks=12)
+
+    # schedules, existing slots, scheduled counts and the doctors' bookings, the row count before and
+    # after the insert, then the activity rollup refresh (doctor lock, one aggregate per source table,
+    # stored rows); everything else is batched
+    lookups = [q for q in queries.captured_queries if q["sql"].lstrip("(").startswith("SELECT")]
+    assert len(lookups) == 4 + 2 + 6
+    assert summary["created"] == 20 * 2 * 12
+
+
+def test_doctor_double_bookings_are_skipped():
+    first = PatientTreatmentFactory(total_sessions=30)
+    second = PatientTreatmentFactory(total_sessions=30, doctor=first.doctor)
+    _schedule(first, "monday")
+    _schedule(second, "monday")
+    _schedule(second, "tuesday")
+    PatientConsultationFactory(
+        doctor=first.doctor, date=MONDAY + datetime.timedelta(days=1),
+        start_time=datetime.time(9, 30), end_time=datetime.time(10, 0),
+    )
+
+    summary = generate_sessions(MONDAY, weeks=1)
+
+    assert summary["created"] == 1
+    assert summary["conflicts"] == 2
+    assert TreatmentSession.objects.get().treatment == first
+
+
+def test_command_limits_to_branch():
+    treatment = PatientTreatmentFactory(total_sessions=30)
+    _schedule(treatment, "monday")
+    _schedule(PatientTreatmentFactory(total_sessions=30), "monday")
+
+    out = StringIO()
+    call_command(
+        "generate_sessions", "--weeks", "1", "--start", MONDAY.isoformat(),
+        "--branch", str(treatment.patient.branch_id), stdout=out,
+    )
+
+    assert "1 sessions created" in out.getvalue()
+
+
+def test_generate_endpoint_uses_the_doctor_branch(client, doctor: DoctorProfile):
+    treatment = PatientTreatmentFactory(patient=PatientFactory(branch=doctor.branch), total_sessions=30)
+    _schedule(treatment, "monday")
+    _schedule(PatientTreatmentFactory(total_sessions=30), "monday")
+    client.force_login(doctor.user)
+
+    response = client.post(
+        reverse("treatment_sessions-generate"),
+        {"start_date": MONDAY.isoformat(), "weeks": 1},
+        content_type="application/json",
+    )
+
+    assert response.status_code == 201
+    assert response.json()["created"] == 1
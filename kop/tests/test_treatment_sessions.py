@@ -0,0 +1,140 @@
+import datetime
+
+import pytest
+from django.urls import reverse
+from django.utils import timezone
+
+from kop.models import DoctorProfile
+from kop.models import PatientTreatment
+from kop.models import TreatmentSession
+from kop.tests.factories import PatientTreatmentFactory
+from kop.tests.factories import TreatmentSessionFactory
+from kop.utils.treatment_sessions import set_sessions_status
+
+pytestmark = pytest.mark.django_db
+
+
+def test_single_save_counts_completion_once():
+    treatment = PatientTreatmentFactory(total_sessions=3)
+    session = TreatmentSessionFactory(treatment=treatment)
+
+    session.status = "completed"
+    session.save()
+    session.save()
+
+    treatment.refresh_from_db()
+    assert treatment.sessions_completed == 1
+
+
+def test_bulk_complete_updates_counters_and_finishes_treatment():
+    treatment = PatientTreatmentFactory(total_sessions=2)
+    other = PatientTreatmentFactory(total_sessions=5)
+    sessions = TreatmentSessionFactory.create_batch(2, treatment=treatment)
+    other_session = TreatmentSessionFactory(treatment=other)
+
+    results = set_sessions_status([s.pk for s in [*sessions, other_session]])
+
+    assert [r["status"] for r in results] == ["updated"] * 3
+    treatment.refresh_from_db()
+    other.refresh_from_db()
+    assert (treatment.sessions_completed, treatment.status) == (2, "completed")
+    assert treatment.end_date == timezone.now().date()
+    assert (other.sessions_completed, other.status) == (1, "ongoing")
+
+
+def test_bulk_complete_reports_per_item_errors():
+    treatment = PatientTreatmentFactory(total_sessions=1)
+    first, second = TreatmentSessionFactory.create_batch(2, treatment=treatment)
+    future = TreatmentSessionFactory(
+        treatment=PatientTreatmentFactory(), date=timezone.now().date() + datetime.timedelta(days=1),
+    )
+
+    results = set_sessions_status([first.pk, second.pk, future.pk, 0])
+
+    assert [r["status"] for r in results] == ["updated", "error", "error", "not_found"]
+    assert TreatmentSession.objects.get(pk=second.pk).status == "scheduled"
+
+
+def test_reviving_cancelled_sessions_checks_the_doctor_is_free(doctor):
+    def session(hour, minute=0, status="cancelled"):
+        return TreatmentSessionFactory(
+            treatment_doctor=doctor, status=status,
+            start_time=datetime.time(hour, minute), end_time=datetime.time(hour + 1, minute),
+        )
+
+    clashing = session(9)
+    session(9, 30, status="scheduled")
+    first, overlapping = session(14), session(14, 30)
+    free = session(17)
+
+    results = set_sessions_status([clashing.pk, first.pk, overlapping.pk, free.pk], status="scheduled")
+
+    assert [r["status"] for r in results] == ["error", "updated", "error", "updated"]
+    assert results[0]["error"] == "The doctor already has a booking at this time"
+    assert set(TreatmentSession.objects.filter(status="cancelled").values_list("pk", flat=True)) == {
+        clashing.pk, overlapping.pk
+    }
+
+
+def test_bulk_uncomplete_reopens_treatment():
+    treatment = PatientTreatmentFactory(total_sessions=2)
+    sessions = TreatmentSessionFactory.create_batch(2, treatment=treatment)
+    set_sessions_status([s.pk for s in sessions])
+
+    results = set_sessions_status([sessions[0].pk], status="no_show")
+
+    assert results == [{"id": sessions[0].pk, "status": "updated"}]
+    treatment.refresh_from_db()
+    assert (treatment.sessions_completed, treatment.status, treatment.end_date) == (1, "ongoing", None)
+
+
+def test_deleting_a_completed_session_reopens_its_treatment():
+    treatment = PatientTreatmentFactory(total_sessions=2)
+    sessions = TreatmentSessionFactory.create_batch(2, treatment=treatment)
+    set_sessions_status([s.pk for s in sessions])
+
+    TreatmentSession.objects.get(pk=sessions[0].pk).delete()
+    treatment.refresh_from_db()
+
+    assert (treatment.sessions_completed, treatment.status, treatment.end_date) == (1, "ongoing", None)
+
+
+def test_deleting_a_treatment_with_completed_sessions():
+    treatment = PatientTreatmentFactory(total_sessions=2)
+    set_sessions_status([TreatmentSessionFactory(treatment=treatment).pk])
+
+    treatment.delete()
+
+    assert not PatientTreatment.objects.filter(pk=treatment.pk).exists()
+    assert not TreatmentSession.objects.filter(treatment_id=treatment.pk).exists()
+
+
+def test_bulk_cost_does_not_grow_with_sessions(django_assert_max_num_queries):
+    treatments = PatientTreatmentFactory.create_batch(5, total_sessions=20)
+    sessions = [TreatmentSessionFactory(treatment=t) for t in treatments for _ in range(6)]
+
+    # savepoint, two locking selects, two UPDATEs, release, plus the activity rollup refresh
+    # (savepoint, doctor lock, one aggregate per source table, stored rows, upsert, release)
+    with django_assert_max_num_queries(6 + 9):
+        set_sessions_status([s.pk for s in sessions])
+
+    completed = PatientTreatment.objects.filter(pk__in=[t.pk for t in treatments])
+    assert set(completed.values_list("sessions_completed", flat=True)) == {6}
+
+
+def test_bulk_status_endpoint_is_scoped_to_branch(client, doctor: DoctorProfile):
+    own = TreatmentSessionFactory(treatment_doctor=doctor)
+    foreign = TreatmentSessionFactory()
+    client.force_login(doctor.user)
+
+    response = client.post(
+        reverse("treatment_sessions-bulk-status"),
+        {"session_ids": [own.pk, foreign.pk], "status": "completed"},
+        content_type="application/json",
+    )
+
+    assert response.status_code == 200
+    assert response.json()["results"] == [
+        {"id": own.pk, "status": "updated"},
+        {"id": foreign.pk, "status": "not_found"},
+    ]
@@ -0,0 +1,89 @@
+"""
+Query-count budgets for every kop URL (see kop.utils.view_budgets).
+
+The budgets are recorded by `manage.py check_view_budgets --update` at the
+production-like scale 1.0 (2000 patients and 24000 sessions per branch). The
+suite seeds VIEW_BUDGETS_TEST_SCALE, 0.02 by default, so it stays fast: a view
+whose query count grows with the data still shows up, because most views stay
+flat and the budgets come from the large run. Set VIEW_BUDGETS_TEST_SCALE=1
+(and VIEW_BUDGETS_TEST_LATENCY=1 on hardware like the one the budgets were
+recorded on) to check at full size, wall time included.
+"""
+import json
+
+import pytest
+from django.conf import settings
+from django.core.management import call_command
+
+from kop.models import Patient
+from kop.utils.view_budgets import ViewBudgetRun
+from kop.utils.view_budgets import check_budgets
+from kop.utils.view_budgets import iter_view_routes
+from kop.utils.view_budgets import load_budgets
+from kop.utils.view_budgets import seed_budget_data
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def _media(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path / "media")
+
+
+def test_routes_cover_kop_urls_and_the_api_router():
+    keys = [route.key for route in iter_view_routes()]
+
+    assert len(keys) == len(set(keys))
+    assert {"patients/<int:pk>/", "api/patients/<pk>/", "api/availability/free-slots/"} <= set(keys)
+    assert not any(key.startswith("accounts/") or "<format>" in key for key in keys)
+
+
+def test_views_stay_within_their_query_budgets():
+    results = ViewBudgetRun(*seed_budget_data(scale=settings.VIEW_BUDGETS_TEST_SCALE)).run()
+
+    failures = check_budgets(
+        results, load_budgets(settings.VIEW_BUDGETS_FILE), latency=settings.VIEW_BUDGETS_TEST_LATENCY,
+    )
+
+    assert not failures, "\n".join(failures)
+
+
+def test_check_budgets_flags_regressions():
+    budgets = {"patients/": {"doctor": {"status": 200, "queries": 5, "ms": 100}}}
+
+    def result(**values):
+        return {"route": "patients/", "role": "doctor", "url": "/kop/patients/", "status": 200,
+                "queries": 5, "ms": 20, **values}
+
+    assert check_budgets([result()], budgets) == []
+    assert check_budgets([result(status=302, queries=4)], budgets) == []
+    assert len(check_budgets([result(queries=6)], budgets)) == 1
+    assert len(check_budgets([result(status=500)], budgets)) == 1
+    assert len(check_budgets([result(ms=150)], budgets)) == 1
+    assert check_budgets([result(ms=150)], budgets, latency=False) == []
+    assert check_budgets([result(role="superadmin")], budgets) == ["superadmin GET /kop/patients/ (patients/): no budget"]
+
+
+def test_check_budgets_fails_every_server_error_but_the_known_broken():
+    budgets = {"patients/": {"doctor": {"status": 500, "queries": 5, "ms": 100}}}
+    result = {"route": "patients/", "role": "doctor", "url": "/kop/patients/", "status": 500, "queries": 5, "ms": 20}
+    known_broken = {("patients/", "doctor"): "KeyError"}
+
+    # A 500 recorded as the budget is no excuse
+    assert len(check_budgets([result], budgets)) == 1
+    assert check_budgets([result], budgets, known_broken=known_broken) == []
+    # Once the view is fixed, its entry has to go
+    fixed = check_budgets([{**result, "status": 200}], budgets, known_broken=known_broken)
+    assert fixed == ["doctor GET /kop/patients/ (patients/): status 200, remove it from KNOWN_BROKEN"]
+
+
+def test_command_exports_json_and_rolls_back(tmp_path):
+    budgets, report = tmp_path / "budgets.json", tmp_path / "report.json"
+
+    call_command("check_view_budgets", scale=0.01, repeat=1, budgets=str(budgets), output=str(report), update=True)
+    call_command("check_view_budgets", scale=0.01, repeat=1, budgets=str(budgets), no_latency=True)
+
+    exported = json.loads(report.read_text())
+    assert exported["failures"] == []
+    assert {result["route"] for result in exported["results"]} == set(json.loads(budgets.read_text()))
+    assert not Patient.objects.exists()
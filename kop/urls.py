@@ -3,15 +3,17 @@ from django.contrib.auth import views as auth_views
 from rest_framework.routers import DefaultRouter
 
 from . import views
-from .forms.treatment_session import PatientTreatmentAutocomplete
 from .serializers.references import BranchSerializer
-from .views.attendance import doctor_dashboard, mark_attendance, PatientAutocomplete, complete_consultation
+from .views.attendance import doctor_dashboard, mark_attendance, complete_consultation
+from .views.autocomplete import patient_autocomplete, treatment_autocomplete
 from .views.branch_admin import BranchAdminListView, BranchAdminDetailView, BranchAdminCreateView, \
     BranchAdminUpdateView, BranchAdminDeleteView, branch_admin_dashboard
 from .views.consultation import PatientConsultationListView, PatientConsultationCreateView, \
     PatientConsultationDetailView, PatientConsultationUpdateView, PatientConsultationDeleteView
 from .views.doctorprofile import doctor_schedule, WeeklyAvailabilityViewSet, DoctorCreateView, \
     DoctorListView, DoctorUpdateView, DoctorDetailView
+from .views.exports import export_invoices, export_patients, export_payments, export_treatment_sessions
+from .views.jobs import background_job_detail, background_job_download
 from .views.invoice import InvoiceListView, InvoiceDetailView
 from .views.login import login_redirect
 from .views.patient_attachment import create_patient_attachment, PatientAttachmentUpdateView, download_attachment, \
@@ -21,16 +23,19 @@ from .views.patient_treatment import PatientTreatmentCreateView, PatientTreatmen
 from .views.patient_weekly_schedule import PatientWeeklyScheduleListView, PatientWeeklyScheduleCreateView, \
     PatientWeeklyScheduleUpdateView, PatientWeeklyScheduleDeleteView
 from .views.patients import PatientViewSet, patient_detail, patient_update, patient_delete
+from .views.metrics import metrics_view
 from .views.payments import CreatePaymentView
+from .views.profiling import profiling_dashboard
 from .views.references import LeadSourceListView, LeadSourceCreateView, LeadSourceDetailView, LeadSourceUpdateView, \
     LeadSourceDeleteView, BranchListView, BranchCreateView, BranchDetailView, BranchUpdateView, BranchDeleteView, \
     DoctorSpecializationListView, DoctorSpecializationCreateView, DoctorSpecializationDetailView, \
     DoctorSpecializationUpdateView, DoctorSpecializationDeleteView
+from .views.reports import ReportViewSet
 from .views.test import test_view
 from .views.treatment_program import TreatmentProgramViewSet, TreatmentProgramListView, TreatmentProgramCreateView, \
     TreatmentProgramUpdateView, TreatmentProgramDeleteView
 from .views.treatment_session import TreatmentSessionListView, TreatmentSessionCreateView, SessionDetailView, \
-    SessionUpdateView, TreatmentSessionDeleteView
+    SessionUpdateView, TreatmentSessionDeleteView, TreatmentSessionViewSet
 from .views.users import UserProfileViewSet
 from kop.views.patients import patient_list, add_patient
 from django.views.generic import RedirectView
@@ -42,6 +47,8 @@ router.register(r'users', UserProfileViewSet, basename='users')
 router.register(r'patients', PatientViewSet, basename='patients')
 router.register(r'availability', WeeklyAvailabilityViewSet, basename='availability')
 router.register(r'treatment-programs', TreatmentProgramViewSet, basename='treatment_programs')
+router.register(r'treatment-sessions', TreatmentSessionViewSet, basename='treatment_sessions')
+router.register(r'reports', ReportViewSet, basename='reports')
 
 urlpatterns = [
     # API
@@ -62,11 +69,12 @@ urlpatterns = [
 
     # Patients
     path('patients/', patient_list, name='patient-list'),
+    path('patients/export/', export_patients, name='patient-export'),
     path('patients/add', add_patient, name='patient-add'),
     path('patients/<int:pk>/', patient_detail, name='patient-detail'),
     path('patients/<int:pk>/update/', patient_update, name='patient-update'),
     path('patients/<int:pk>/delete', patient_delete, name='patient-delete'),
-    path('patient-autocomplete/', PatientAutocomplete.as_view(), name='patient-autocomplete'),
+    path('patient-autocomplete/', patient_autocomplete, name='patient-autocomplete'),
     path('patients/<int:patient_id>/consultations/create/',
          PatientConsultationCreateView.as_view(),
          name='consultation-create'),
@@ -91,8 +99,7 @@ urlpatterns = [
     path('treatment-programs/create/', TreatmentProgramCreateView.as_view(), name='treatment-program-create'),
     path('treatment-programs/<int:pk>/edit/', TreatmentProgramUpdateView.as_view(), name='treatment-program-edit'),
     path('treatment-programs/<int:pk>/delete/', TreatmentProgramDeleteView.as_view(), name='treatment-program-delete'),
-    path('treatment-programs/auto-complete/', PatientTreatmentAutocomplete.as_view(),
-         name='treatment-program-autocomplete'),
+    path('treatment-programs/auto-complete/', treatment_autocomplete, name='treatment-program-autocomplete'),
 
     # Patient Treatments
     path('patient-treatment/', PatientTreatmentListView.as_view(), name='patient-treatment-list'),
@@ -104,6 +111,7 @@ urlpatterns = [
 
     # Treatment Sessions
     path('treatment_sessions/', TreatmentSessionListView.as_view(), name='treatment-session-list'),
+    path('treatment_sessions/export/', export_treatment_sessions, name='treatment-session-export'),
     path('treatment_sessions/create/', TreatmentSessionCreateView.as_view(), name='treatment-session-create'),
     path('patients/<int:patient_id>/treatment_sessions/create/', TreatmentSessionCreateView.as_view(),
          name='treatment-session-create-for-patient'),
@@ -128,6 +136,8 @@ urlpatterns = [
 
     # Invoices
     path('invoices/', InvoiceListView.as_view(), name='invoice-list'),
+    path('invoices/export/', export_invoices, name='invoice-export'),
+    path('invoices/payments/export/', export_payments, name='payment-export'),
     path('invoices/<int:pk>/', InvoiceDetailView.as_view(), name='invoice-detail'),
     path('invoice/<int:invoice_id>/payment/create/', CreatePaymentView.as_view(), name='create_payment'),
 
@@ -164,6 +174,14 @@ urlpatterns = [
     path('branch-admins/<int:pk>/delete/', BranchAdminDeleteView.as_view(), name='branch_admin_delete'),
     path('branch-admins/dashboard/', branch_admin_dashboard, name='branch_admin_dashboard'),
 
+    # Request profiling
+    path('profiling/', profiling_dashboard, name='request-profiling'),
+    path('metrics/', metrics_view, name='metrics'),
+
+    # Background jobs
+    path('jobs/<int:pk>/', background_job_detail, name='background-job'),
+    path('jobs/<int:pk>/download/', background_job_download, name='background-job-download'),
+
     path('accounts/', include('allauth.urls')),
 
 
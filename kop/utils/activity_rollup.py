@@ -0,0 +1,256 @@
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Q, Sum
+from django.db.models.functions import Coalesce, TruncMonth
+
+from kop.models import DailyActivityRollup, DoctorProfile, Invoice, Payment, PatientConsultation, TreatmentSession
+
+STATUSES = [status for status, _ in TreatmentSession.STATUS_CHOICES]
+
+COUNT_FIELDS = [
+    *(f'sessions_{status}' for status in STATUSES),
+    *(f'consultations_{status}' for status in STATUSES),
+]
+MONEY_FIELDS = ['revenue_invoiced', 'revenue_collected']
+MEASURES = COUNT_FIELDS + MONEY_FIELDS
+
+
+def status_total(prefix):
+    """Expression adding up the per-status counters of 'sessions' or 'consultations' on a rollup row"""
+    return sum((F(f'{prefix}_{status}') for status in STATUSES[1:]), F(f'{prefix}_{STATUSES[0]}'))
+
+# Invoices belong to the doctor of their consultation or treatment
+INVOICE_DOCTOR = Coalesce(F('consultation__doctor_id'), F('treatment__doctor_id'))
+PAYMENT_DOCTOR = Coalesce(F('invoice__consultation__doctor_id'), F('invoice__treatment__doctor_id'))
+
+# Rows of patients without a branch are counted in their doctor's branch
+CONSULTATION_BRANCH = Coalesce(F('branch_id'), F('doctor__branch_id'))
+INVOICE_BRANCH = Coalesce(F('branch_id'), F('consultation__doctor__branch_id'), F('treatment__doctor__branch_id'))
+PAYMENT_BRANCH = Coalesce(
+    F('invoice__branch_id'), F('invoice__consultation__doctor__branch_id'), F('invoice__treatment__doctor__branch_id')
+)
+
+
+def _sources():
+    """(rows, branch, doctor, date field, aggregates) of every table the rollup sums"""
+    def by_status(prefix):
+        return {f'{prefix}_{status}': Count('id', filter=Q(status=status)) for status in STATUSES}
+
+    return [
+        (TreatmentSession.objects.all(), F('branch_id'), F('treatment_doctor_id'), 'date', by_status('sessions')),
+        (PatientConsultation.objects.all(), CONSULTATION_BRANCH, F('doctor_id'), 'date', by_status('consultations')),
+        (Invoice.objects.all(), INVOICE_BRANCH, INVOICE_DOCTOR, 'invoice_date', {'revenue_invoiced': Sum('total')}),
+        (Payment.objects.all(), PAYMENT_BRANCH, PAYMENT_DOCTOR, 'payment_date',
+         {'revenue_collected': Sum('amount')}),
+    ]
+
+
+def compute_rollups(start=None, end=None, doctor_days=None):
+    """
+    {(branch id, doctor id, date): {measure: value}} summed from the source rows,
+    either for the dates start..end or for the given (doctor id, date) pairs.
+    One grouped query per source table.
+    """
+    totals = defaultdict(lambda: dict.fromkeys(COUNT_FIELDS, 0) | dict.fromkeys(MONEY_FIELDS, Decimal('0')))
+    for rows, branch, doctor, date_field, aggregates in _sources():
+        rows = rows.annotate(key_branch=branch, key_doctor=doctor, key_date=F(date_field))
+        if doctor_days is not None:
+            rows = rows.filter(
+                key_doctor__in={doctor_id for doctor_id, _ in doctor_days},
+                **{f'{date_field}__in': {day for _, day in doctor_days}},
+            )
+        else:
+            rows = rows.filter(**{f'{date_field}__range': (start, end)})
+        rows = rows.filter(key_branch__isnull=False, key_doctor__isnull=False).order_by().values(
+            'key_branch', 'key_doctor', 'key_date'
+        ).annotate(**aggregates)
+
+        for row in rows:
+            if doctor_days is not None and (row['key_doctor'], row['key_date']) not in doctor_days:
+                continue
+            key = (row['key_branch'], row['key_doctor'], row['key_date'])
+            totals[key].update({name: row[name] or 0 for name in aggregates})
+    return totals
+
+
+def _store(totals):
+    DailyActivityRollup.objects.bulk_create(
+        [
+            DailyActivityRollup(branch_id=branch_id, doctor_id=doctor_id, date=day, **measures)
+            for (branch_id, doctor_id, day), measures in totals.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['branch', 'doctor', 'date'],
+        update_fields=MEASURES,
+    )
+
+
+def _invalidate_dashboards(doctor_ids):
+    """The doctor dashboards count from the rollup; drop their cached counters once the new rows commit"""
+    from kop.utils.doctor_dashboard import invalidate_doctor_dashboard_stats
+
+    def invalidate():
+        for doctor_id in doctor_ids:
+            invalidate_doctor_dashboard_stats(doctor_id)
+
+    transaction.on_commit(invalidate)
+
+
+def refresh_rollups(doctor_days):
+    """
+    Recompute the rollup rows of the given (doctor id, date) pairs, in every
+    branch, from the source rows. Called from the save paths with the days a
+    change touched, so a reschedule refreshes both the old and the new day.
+
+    The doctors are locked first: a concurrent refresh of the same day waits
+    for this transaction and then sums rows including ours.
+    """
+    doctor_days = {(doctor_id, day) for doctor_id, day in doctor_days if doctor_id and day}
+    if not doctor_days:
+        return
+
+    with transaction.atomic():
+        list(
+            DoctorProfile.objects.select_for_update()
+            .filter(pk__in={doctor_id for doctor_id, _ in doctor_days})
+            .order_by('pk').values_list('pk', flat=True)
+        )
+        totals = compute_rollups(doctor_days=doctor_days)
+
+        # Days that no longer have rows in a branch (moved or deleted) drop out
+        stored = DailyActivityRollup.objects.filter(
+            doctor_id__in={doctor_id for doctor_id, _ in doctor_days},
+            date__in={day for _, day in doctor_days},
+        ).values_list('pk', 'branch_id', 'doctor_id', 'date')
+        gone = [
+            pk for pk, branch_id, doctor_id, day in stored
+            if (doctor_id, day) in doctor_days and (branch_id, doctor_id, day) not in totals
+        ]
+        if gone:
+            DailyActivityRollup.objects.filter(pk__in=gone).delete()
+        _store(totals)
+        _invalidate_dashboards({doctor_id for doctor_id, _ in doctor_days})
+
+
+def rebuild_rollups(start, end, chunk_days=31):
+    """
+    Replace the rollup rows of start..end with sums of the source rows,
+    `chunk_days` days per transaction. Yields (first day, last day, rows stored)
+    after every chunk.
+    """
+    day = start
+    while day <= end:
+        last = min(day + datetime.timedelta(days=chunk_days - 1), end)
+        with transaction.atomic():
+            replaced = DailyActivityRollup.objects.filter(date__range=(day, last))
+            doctor_ids = set(replaced.order_by().values_list('doctor_id', flat=True).distinct())
+            replaced.delete()
+            totals = compute_rollups(day, last)
+            _store(totals)
+            _invalidate_dashboards(doctor_ids | {doctor_id for _, doctor_id, _ in totals})
+        yield day, last, len(totals)
+        day = last + datetime.timedelta(days=1)
+
+
+def source_date_range():
+    """First and last date of any row the rollup sums, (None, None) without any"""
+    days = []
+    for rows, _, _, date_field, _ in _sources():
+        bounds = rows.order_by().aggregate(first=Min(date_field), last=Max(date_field))
+        days.extend(day for day in bounds.values() if day)
+    return (min(days), max(days)) if days else (None, None)
+
+
+def invoice_doctor_days(invoice_ids):
+    """(doctor id, date) pairs of some invoices and of their payments"""
+    invoices = Invoice.objects.filter(pk__in=invoice_ids)
+    return {
+        *invoices.annotate(doctor=INVOICE_DOCTOR).values_list('doctor', 'invoice_date'),
+        *Payment.objects.filter(invoice__in=invoices).annotate(doctor=PAYMENT_DOCTOR).values_list(
+            'doctor', 'payment_date'
+        ),
+    }
+
+
+def patient_doctor_days(patient):
+    """(doctor id, date) pairs of everything a patient's branch is copied onto"""
+    return {
+        *PatientConsultation.objects.filter(patient=patient).values_list('doctor_id', 'date'),
+        *invoice_doctor_days(Invoice.objects.filter(patient=patient).values('pk')),
+    }
+
+
+def doctor_booking_days(doctor):
+    """(doctor id, date) pairs of a doctor's sessions and consultations"""
+    return {
+        *TreatmentSession.objects.filter(treatment_doctor=doctor).values_list('treatment_doctor_id', 'date'),
+        *PatientConsultation.objects.filter(doctor=doctor).values_list('doctor_id', 'date'),
+    }
+
+
+# Field holding the doctor of a session or consultation
+BOOKING_DOCTOR = {TreatmentSession: 'treatment_doctor_id', PatientConsultation: 'doctor_id'}
+
+
+def booking_day(booking):
+    """(doctor id, date) of a session or consultation"""
+    return getattr(booking, BOOKING_DOCTOR[type(booking)]), booking.date
+
+
+def stored_booking_day(booking):
+    """(doctor id, date) a session or consultation has in the database, None when new"""
+    if booking.pk is None:
+        return None
+    model = type(booking)
+    return model.objects.filter(pk=booking.pk).values_list(BOOKING_DOCTOR[model], 'date').first()
+
+
+def invoice_day(invoice):
+    """(doctor id, invoice date) of an invoice"""
+    if invoice.consultation_id:
+        return invoice.consultation.doctor_id, invoice.invoice_date
+    if invoice.treatment_id:
+        return invoice.treatment.doctor_id, invoice.invoice_date
+    return None, invoice.invoice_date
+
+
+def payment_day(payment):
+    """(doctor id, payment date) of a payment"""
+    return invoice_day(payment.invoice)[0], payment.payment_date
+
+
+REVENUE_RELATIONS = {Invoice: ['consultation', 'treatment'], Payment: ['invoice__consultation', 'invoice__treatment']}
+
+
+def stored_revenue_row(row):
+    """An invoice or payment as it is in the database, with what invoice_day/payment_day read; None when new"""
+    if row.pk is None:
+        return None
+    model = type(row)
+    return model.objects.select_related(*REVENUE_RELATIONS[model]).filter(pk=row.pk).first()
+
+
+# Columns a rollup report is grouped by: (rollup fields, computed columns)
+REPORT_GROUPS = {
+    'date': (['date'], {}),
+    'month': ([], {'month': TruncMonth('date')}),
+    'doctor': (['doctor'], {'doctor_name': F('doctor__user__name')}),
+    'branch': (['branch'], {'branch_name': F('branch__name')}),
+}
+
+
+def summarize_rollups(rollups, group_by='date'):
+    """
+    Sum rollup rows per `group_by` (a REPORT_GROUPS key) in one grouped query.
+    Returns (rows, totals); each row holds the group columns and every measure.
+    """
+    sums = {name: Coalesce(Sum(name), 0, output_field=DailyActivityRollup._meta.get_field(name)) for name in MEASURES}
+    fields, computed = REPORT_GROUPS[group_by]
+    rows = list(
+        rollups.order_by().values(*fields, **computed).annotate(**sums).order_by(*fields, *computed)
+    )
+    totals = rollups.aggregate(**sums)
+    return rows, totals
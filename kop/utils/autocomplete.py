@@ -0,0 +1,118 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+
+from kop.models import Patient, PatientTreatment
+from kop.utils.patient_search import is_phone_search, match_rank, search_filters
+
+CACHE_KEY_PREFIX = 'kop:autocomplete'
+
+# Results per page, as django-autocomplete-light's Select2 widgets expect
+PAGE_SIZE = 10
+
+
+def _patient_label(first_name, last_name, phone):
+    return f'{first_name} {last_name} ({phone})'
+
+
+def _treatment_label(first_name, last_name, phone, program, program_branch):
+    return f'{_patient_label(first_name, last_name, phone)} - {program} ({program_branch})'
+
+
+# Rows, lookup path to the patient, extra fields for the label and label of every autocomplete
+SOURCES = {
+    'patients': (Patient.objects.all(), '', ('phone',), _patient_label),
+    'treatments': (
+        PatientTreatment.objects.all(), 'patient__',
+        ('patient__phone', 'treatment_program__name', 'treatment_program__branch__name'),
+        _treatment_label,
+    ),
+}
+
+
+def normalize_term(term):
+    """A search term as candidate sets are cached under: lower case, single spaces"""
+    return ' '.join((term or '').lower().split())
+
+
+def get_autocomplete_cache_key(source, branch_id, term):
+    """Cache key for the candidates of a normalized term in a branch (None for every branch)"""
+    digest = hashlib.md5(term.encode(), usedforsecurity=False).hexdigest()
+    return f'{CACHE_KEY_PREFIX}:{source}:{branch_id or "all"}:{digest}'
+
+
+def _narrow(rows, term):
+    """Rows of a shorter prefix's candidates that match `term`, ranked for it"""
+    ranked = []
+    for row in rows:
+        pk, first_name, last_name, digits, _ = row
+        rank = match_rank(term, first_name, last_name, digits)
+        if rank is not None:
+            ranked.append((-rank, pk, row))
+    ranked.sort(key=lambda item: item[:2])
+    return [row for _, _, row in ranked]
+
+
+async def _fetch(source, branch_id, term, limit):
+    """Up to `limit` best matches of `term` as (pk, first name, last name, phone digits, label) rows"""
+    queryset, prefix, label_fields, label = SOURCES[source]
+    queryset = queryset.for_branch(branch_id)
+    search = search_filters(term, prefix=prefix)
+    if search is None:
+        queryset = queryset.order_by('pk')
+    else:
+        # Ranked by the prefix score, which _narrow repeats in memory
+        filters, rank = search
+        queryset = queryset.filter(filters).annotate(search_rank=rank).order_by('-search_rank', 'pk')
+    names = (f'{prefix}first_name', f'{prefix}last_name')
+    rows = queryset.values_list('pk', *names, f'{prefix}phone_digits', *label_fields)[:limit]
+    return [
+        (pk, first_name, last_name, digits, label(first_name, last_name, *extra))
+        async for pk, first_name, last_name, digits, *extra in rows
+    ]
+
+
+async def autocomplete_candidates(source, branch_id, term):
+    """
+    Ranked (pk, first name, last name, phone digits, label) candidates of a
+    normalized term, cached for AUTOCOMPLETE_CACHE_TIMEOUT seconds per branch.
+
+    A term typed after a shorter one ("sm" -> "smi") is filtered in memory from
+    the shorter prefix's cached candidates, as long as those are complete: every
+    row matching "smi" also matches "sm". Sets cut at AUTOCOMPLETE_CANDIDATE_LIMIT
+    rows can't be narrowed, and neither can a name search into a phone search.
+    """
+    keys = {
+        term[:length]: get_autocomplete_cache_key(source, branch_id, term[:length])
+        for length in range(len(term) + 1)
+        if term[:length] == term[:length].rstrip()
+    }
+    cached = await cache.aget_many(keys.values())
+    if keys[term] in cached:
+        return cached[keys[term]]['rows']
+
+    limit = settings.AUTOCOMPLETE_CANDIDATE_LIMIT
+    for prefix in sorted(keys, key=len, reverse=True):
+        candidates = cached.get(keys[prefix])
+        if candidates and candidates['complete'] and (not prefix or is_phone_search(prefix) == is_phone_search(term)):
+            rows, complete = _narrow(candidates['rows'], term), True
+            break
+    else:
+        rows = await _fetch(source, branch_id, term, limit + 1)
+        rows, complete = rows[:limit], len(rows) <= limit
+
+    await cache.aset(keys[term], {'rows': rows, 'complete': complete}, settings.AUTOCOMPLETE_CACHE_TIMEOUT)
+    return rows
+
+
+def select2_page(rows, page):
+    """The django-autocomplete-light Select2 response body for one page of candidates"""
+    start = (page - 1) * PAGE_SIZE
+    return {
+        'results': [
+            {'id': str(pk), 'text': label, 'selected_text': label}
+            for pk, _, _, _, label in rows[start:start + PAGE_SIZE]
+        ],
+        'pagination': {'more': len(rows) > start + PAGE_SIZE},
+    }
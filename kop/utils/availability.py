@@ -0,0 +1,140 @@
+import datetime
+import heapq
+from bisect import bisect_right
+from collections import defaultdict
+
+from django.utils import timezone
+
+from kop.models import WeeklyAvailability, TreatmentSession, PatientConsultation, DoctorProfile
+
+# WeeklyAvailability.DAY_CHOICES is ordered like date.weekday()
+WEEKDAYS = [day for day, _ in WeeklyAvailability.DAY_CHOICES]
+
+# Bookings in these states don't hold the doctor's time
+FREE_STATUSES = ['cancelled']
+
+
+def _minutes(value):
+    return value.hour * 60 + value.minute
+
+
+def _time(minutes):
+    return datetime.time(minutes // 60, minutes % 60)
+
+
+def _subtract(intervals, start, end):
+    """Remove [start, end) from sorted, non-overlapping (start, end) intervals"""
+    result = []
+    for free_start, free_end in intervals:
+        if end <= free_start or start >= free_end:
+            result.append((free_start, free_end))
+            continue
+        if free_start < start:
+            result.append((free_start, start))
+        if end < free_end:
+            result.append((end, free_end))
+    return result
+
+
+class AvailabilityIndex:
+    """
+    Free time of a branch's doctors over a date range.
+
+    Everything is loaded up front in a fixed number of queries (weekly
+    availability, sessions, consultations); afterwards each doctor/day is a
+    sorted list of free (start, end) minute intervals with breaks and bookings
+    already removed, so slot lookups never touch the database.
+    """
+
+    def __init__(self, branch, start_date, end_date, doctors=None):
+        self.start_date = start_date
+        self.end_date = end_date
+
+        doctors = DoctorProfile.objects.filter(branch=branch, is_active=True) if doctors is None else doctors
+        self.doctor_ids = list(doctors.values_list('pk', flat=True))
+
+        self._weekly = defaultdict(dict)
+        for availability in WeeklyAvailability.objects.filter(doctor_id__in=self.doctor_ids, is_available=True):
+            self._weekly[availability.doctor_id][WEEKDAYS.index(availability.day)] = availability
+
+        self._bookings = defaultdict(list)
+        sessions = TreatmentSession.objects.filter(
+            treatment_doctor_id__in=self.doctor_ids,
+            date__range=(start_date, end_date),
+        ).exclude(status__in=FREE_STATUSES).values_list('treatment_doctor_id', 'date', 'start_time', 'end_time')
+        consultations = PatientConsultation.objects.filter(
+            doctor_id__in=self.doctor_ids,
+            date__range=(start_date, end_date),
+        ).exclude(status__in=FREE_STATUSES).values_list('doctor_id', 'date', 'start_time', 'end_time')
+        for queryset in (sessions, consultations):
+            for doctor_id, day, start, end in queryset.order_by():
+                self._bookings[(doctor_id, day)].append((_minutes(start), _minutes(end)))
+
+        self._free = {}
+
+    def free_intervals(self, doctor_id, day):
+        """Sorted free (start, end) minute intervals of a doctor on a day"""
+        key = (doctor_id, day)
+        if key not in self._free:
+            availability = self._weekly[doctor_id].get(day.weekday())
+            if not availability or not availability.login_time or not availability.logout_time:
+                intervals = []
+            else:
+                intervals = [(_minutes(availability.login_time), _minutes(availability.logout_time))]
+                if availability.break_start_time and availability.break_end_time:
+                    intervals = _subtract(
+                        intervals, _minutes(availability.break_start_time), _minutes(availability.break_end_time)
+                    )
+                for start, end in sorted(self._bookings.get(key, [])):
+                    intervals = _subtract(intervals, start, end)
+            self._free[key] = intervals
+        return self._free[key]
+
+    def is_free(self, doctor_id, day, start_time, end_time):
+        """Whether the doctor has nothing booked and is working for the whole span"""
+        intervals = self.free_intervals(doctor_id, day)
+        start, end = _minutes(start_time), _minutes(end_time)
+        index = bisect_right(intervals, (start, float('inf'))) - 1
+        return index >= 0 and intervals[index][0] <= start and end <= intervals[index][1]
+
+    def _doctor_slots(self, doctor_id, duration, after):
+        day = max(self.start_date, after.date())
+        while day <= self.end_date:
+            earliest = _minutes(after.time()) if day == after.date() else 0
+            for free_start, free_end in self.free_intervals(doctor_id, day):
+                start = max(free_start, earliest)
+                while start + duration <= free_end:
+                    yield day, start, doctor_id
+                    start += duration
+            day += datetime.timedelta(days=1)
+
+    def next_free_slots(self, count, duration=60, doctor_ids=None, after=None):
+        """
+        The `count` earliest free slots of `duration` minutes across the given
+        doctors, as dicts with doctor, date, start_time and end_time.
+        """
+        after = after or datetime.datetime.combine(self.start_date, datetime.time.min)
+        doctor_ids = self.doctor_ids if doctor_ids is None else [pk for pk in doctor_ids if pk in self.doctor_ids]
+        merged = heapq.merge(*[self._doctor_slots(pk, duration, after) for pk in doctor_ids])
+
+        slots = []
+        for day, start, doctor_id in merged:
+            slots.append({
+                'doctor': doctor_id,
+                'date': day,
+                'start_time': _time(start),
+                'end_time': _time(start + duration),
+            })
+            if len(slots) == count:
+                break
+        return slots
+
+
+def find_free_slots_for_program(program, count=5, duration=60, start_date=None, days=14, after=None):
+    """Next free slots with any doctor of a treatment program, in the program's branch"""
+    start_date = start_date or (after.date() if after else timezone.now().date())
+    doctors = program.doctors.filter(is_active=True)
+    index = AvailabilityIndex(
+        program.branch_id, start_date, start_date + datetime.timedelta(days=days - 1), doctors=doctors,
+    )
+    return index.next_free_slots(count, duration=duration, after=after)
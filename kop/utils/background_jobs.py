@@ -0,0 +1,147 @@
+import datetime
+import json
+import logging
+import traceback
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from kop.models import BackgroundJob
+
+logger = logging.getLogger('kop.jobs')
+
+# Registered job functions by name (see background_job)
+JOBS = {}
+
+
+def background_job(func=None, *, max_attempts=None):
+    """
+    Register a function as a job the worker can run, under its dotted path.
+    Use as @background_job or @background_job(max_attempts=5).
+    """
+    def register(func):
+        func.job_name = f'{func.__module__}.{func.__name__}'
+        func.max_attempts = max_attempts
+        JOBS[func.job_name] = func
+        return func
+
+    return register(func) if func else register
+
+
+def _json(value):
+    """value as the worker gets it back from the table: dates and decimals become strings"""
+    return json.loads(json.dumps(value, cls=DjangoJSONEncoder))
+
+
+def enqueue(func, user=None, **kwargs):
+    """
+    Queue func(**kwargs) for the worker and return the job.
+
+    The row is written in the caller's transaction, so the worker only sees it
+    once that commits and a rolled back request queues nothing. kwargs must be
+    JSON serializable; dates and decimals arrive as strings.
+
+    With BACKGROUND_JOBS_IMMEDIATE the job runs inline instead, once and without
+    a row, and its exceptions propagate.
+    """
+    job = BackgroundJob(
+        name=func.job_name,
+        arguments=_json(kwargs),
+        user=user,
+        max_attempts=func.max_attempts or settings.BACKGROUND_JOB_MAX_ATTEMPTS,
+    )
+    if settings.BACKGROUND_JOBS_IMMEDIATE:
+        job.started_at = timezone.now()
+        job.attempts = 1
+        job.result = _json(func(**job.arguments))
+        job.status = 'succeeded'
+        job.finished_at = timezone.now()
+    else:
+        job.save()
+    return job
+
+
+def claim_job(worker):
+    """
+    Take the next due job and mark it running, or None when there is none.
+    Workers skip rows another worker has locked instead of waiting for them.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        job = (
+            BackgroundJob.objects.select_for_update(skip_locked=True)
+            .filter(status='queued', run_after__lte=now)
+            .order_by('run_after', 'id')
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = 'running'
+        job.attempts += 1
+        job.started_at = now
+        job.finished_at = None
+        job.worker = worker
+        job.save(update_fields=['status', 'attempts', 'started_at', 'finished_at', 'worker'])
+    return job
+
+
+def run_job(job):
+    """
+    Run a claimed job in a transaction and store its outcome. A failed attempt
+    is queued again after BACKGROUND_JOB_RETRY_DELAY seconds, doubled for every
+    earlier attempt, until the job runs out of attempts.
+    """
+    func = JOBS.get(job.name)
+    try:
+        if func is None:
+            raise LookupError(f'No job is registered as {job.name}')
+        with transaction.atomic():
+            result = func(**job.arguments)
+    except Exception:
+        logger.exception('Job %s #%s failed on attempt %s', job.name, job.pk, job.attempts)
+        job.error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            job.status = 'queued'
+            job.run_after = timezone.now() + datetime.timedelta(
+                seconds=settings.BACKGROUND_JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+            )
+        else:
+            job.status = 'failed'
+    else:
+        job.status = 'succeeded'
+        job.result = result
+        job.error = ''
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'result', 'error', 'run_after', 'finished_at'])
+    return job
+
+
+def requeue_abandoned_jobs():
+    """
+    Jobs left running longer than BACKGROUND_JOB_TIMEOUT, by a worker that died
+    or was killed, count as a failed attempt: they are queued again, or fail
+    when they are out of attempts. Returns (requeued, failed).
+    """
+    now = timezone.now()
+    abandoned = BackgroundJob.objects.filter(
+        status='running', started_at__lt=now - datetime.timedelta(seconds=settings.BACKGROUND_JOB_TIMEOUT),
+    )
+    error = 'Abandoned: the worker stopped before the job finished'
+    requeued = abandoned.filter(attempts__lt=F('max_attempts')).update(status='queued', run_after=now, error=error)
+    failed = abandoned.update(status='failed', finished_at=now, error=error)
+    return requeued, failed
+
+
+def prune_jobs():
+    """Delete jobs finished more than BACKGROUND_JOB_RESULT_DAYS ago, with their result files"""
+    old = BackgroundJob.objects.filter(
+        status__in=['succeeded', 'failed'],
+        finished_at__lt=timezone.now() - datetime.timedelta(days=settings.BACKGROUND_JOB_RESULT_DAYS),
+    )
+    for result in old.filter(result__has_key='file').values_list('result', flat=True):
+        default_storage.delete(result['file'])
+    return old.delete()[0]
@@ -0,0 +1,112 @@
+import heapq
+from collections import defaultdict
+from itertools import count
+
+from django.db import models
+from django.db.models import Value
+
+from kop.models import PatientConsultation, TreatmentSession
+
+# Bookings in these states don't hold the doctor's time
+INACTIVE_STATUSES = ['cancelled']
+
+
+def _overlapping(queryset, doctor_field, doctor_id, date, start_time, end_time, kind, exclude_pk=None):
+    queryset = queryset.filter(
+        **{doctor_field: doctor_id},
+        date=date,
+        start_time__lt=end_time,
+        end_time__gt=start_time,
+    ).exclude(status__in=INACTIVE_STATUSES)
+    if exclude_pk:
+        queryset = queryset.exclude(pk=exclude_pk)
+    return queryset.annotate(
+        kind=Value(kind, output_field=models.CharField())
+    ).values_list('kind', 'pk', 'start_time', 'end_time').order_by()
+
+
+def find_doctor_conflict(doctor_id, date, start_time, end_time, session_id=None, consultation_id=None):
+    """
+    First session or consultation of the doctor overlapping the span, as
+    (kind, pk, start_time, end_time), or None.
+
+    Both tables are checked in a single UNION query served by the
+    (doctor, date, start_time, end_time) indexes.
+    """
+    sessions = _overlapping(
+        TreatmentSession.objects.all(), 'treatment_doctor_id', doctor_id, date, start_time, end_time,
+        'session', exclude_pk=session_id,
+    )
+    consultations = _overlapping(
+        PatientConsultation.objects.all(), 'doctor_id', doctor_id, date, start_time, end_time,
+        'consultation', exclude_pk=consultation_id,
+    )
+    return next(iter(sessions.union(consultations, all=True)[:1]), None)
+
+
+def conflict_message(conflict):
+    kind, _, start_time, end_time = conflict
+    return (
+        f"The doctor already has a {kind} from {start_time.strftime('%H:%M')} "
+        f"to {end_time.strftime('%H:%M')} on this date"
+    )
+
+
+def iter_overlaps(bookings):
+    """
+    Sweep over (doctor_id, date, start_time, end_time, ...) tuples sorted by
+    doctor, date and start time, yielding each overlapping (earlier, later) pair.
+
+    Only bookings still running when the next one starts are kept, so memory
+    stays at the busiest moment of one doctor's day and rows can be streamed.
+    """
+    running = []
+    current = None
+    tiebreak = count()
+    for booking in bookings:
+        doctor_id, date, start_time, end_time = booking[:4]
+        if (doctor_id, date) != current:
+            current = (doctor_id, date)
+            running = []
+        while running and running[0][0] <= start_time:
+            heapq.heappop(running)
+        for _, _, earlier in running:
+            yield earlier, booking
+        heapq.heappush(running, (end_time, next(tiebreak), booking))
+
+
+def find_overlaps(bookings):
+    """All overlapping pairs among unsorted booking tuples, e.g. rows of a bulk import"""
+    return list(iter_overlaps(sorted(bookings, key=lambda booking: booking[:3])))
+
+
+class DoctorBookings:
+    """
+    Existing bookings of some doctors over a date range, loaded in one query,
+    that new bookings can be checked against (and added to) without touching
+    the database again.
+    """
+
+    def __init__(self, doctor_ids, start_date, end_date):
+        self._bookings = defaultdict(list)
+        sessions = TreatmentSession.objects.filter(
+            treatment_doctor_id__in=doctor_ids, date__range=(start_date, end_date),
+        ).exclude(status__in=INACTIVE_STATUSES).values_list('treatment_doctor_id', 'date', 'start_time', 'end_time')
+        consultations = PatientConsultation.objects.filter(
+            doctor_id__in=doctor_ids, date__range=(start_date, end_date),
+        ).exclude(status__in=INACTIVE_STATUSES).values_list('doctor_id', 'date', 'start_time', 'end_time')
+        for doctor_id, date, start_time, end_time in sessions.order_by().union(consultations.order_by(), all=True):
+            self._bookings[(doctor_id, date)].append((start_time, end_time))
+
+    def is_free(self, doctor_id, date, start_time, end_time):
+        return not any(
+            start < end_time and start_time < end
+            for start, end in self._bookings.get((doctor_id, date), ())
+        )
+
+    def add(self, doctor_id, date, start_time, end_time):
+        """Book the span if the doctor is free then; returns whether it was booked"""
+        if not self.is_free(doctor_id, date, start_time, end_time):
+            return False
+        self._bookings[(doctor_id, date)].append((start_time, end_time))
+        return True
@@ -5,41 +5,39 @@ from kop.models import PatientTreatment, Patient, Branch, TreatmentSession, Pati
 from django.db import models
 
 
+EXPIRING_TREATMENT_THRESHOLD = 7
+
+
 def get_expiring_treatments(branch):
     """Get treatments with less than 7 pending sessions"""
-    expiring_treatments =  PatientTreatment.objects.filter(
-        patient__branch=branch,
+    return PatientTreatment.objects.for_branch(branch).filter(
         status='ongoing',
         is_active=True
-    )
-    return [t for t in expiring_treatments if t.pending_sessions < 7]
-
+    ).annotate(
+        remaining_sessions=models.F('total_sessions') - models.F('sessions_completed')
+    ).filter(
+        remaining_sessions__lt=EXPIRING_TREATMENT_THRESHOLD
+    ).select_related(
+        'patient', 'treatment_program', 'doctor__user'
+    ).order_by('remaining_sessions')
 
 
 def get_active_patients_count(branch):
     """Get count of active patients in the branch"""
-    return Patient.objects.filter(
-        branch=branch,
-        is_active=True
-    ).count()
-
-
-def get_today_appointments_count(branch):
-    """Get count of appointments for today"""
-    today = timezone.now().date()
-    return PatientConsultation.objects.filter(
-        patient__branch=branch,
-        date=today
-    ).count()
+    return Patient.objects.for_branch(branch).filter(is_active=True).count()
 
 
-def get_today_treatments_count(branch):
-    """Get count of treatments scheduled for today"""
+def get_today_counts(branch):
+    """
+    Get counts of today's appointments and treatment sessions. Counted from the
+    rows (branch and date indexed) rather than the rollup, which the worker
+    refreshes a moment later, so they agree with today's lists on the same page.
+    """
     today = timezone.now().date()
-    return TreatmentSession.objects.filter(
-        treatment_doctor__branch=branch,
-        date=today,
-    ).count()
+    return {
+        'appointments': PatientConsultation.objects.for_branch(branch).filter(date=today).count(),
+        'treatments': TreatmentSession.objects.for_branch(branch).filter(date=today).count(),
+    }
 
 
 def get_converted_leads_today(branch):
@@ -48,14 +46,30 @@ def get_converted_leads_today(branch):
     return 0
 
 
-def get_dashboard_stats(branch):
-    """Get all dashboard statistics for a branch"""
+def _compute_dashboard_stats(branch):
+    expiring_treatments = list(get_expiring_treatments(branch))
+    today_counts = get_today_counts(branch)
     return {
-        'expiring_treatments': get_expiring_treatments(branch),
-        'expiring_treatments_count': len(get_expiring_treatments(branch)),
+        'expiring_treatments': expiring_treatments,
+        'expiring_treatments_count': len(expiring_treatments),
         'active_patients_count': get_active_patients_count(branch),
-        'today_appointments_count': get_today_appointments_count(branch),
-        'today_treatments_count': get_today_treatments_count(branch),
+        'today_appointments_count': today_counts['appointments'],
+        'today_treatments_count': today_counts['treatments'],
         'converted_leads_today': get_converted_leads_today(branch),
         'recent_treatments': get_converted_leads_today(branch),
     }
+
+
+def get_dashboard_stats(branch, request=None):
+    """
+    Get all dashboard statistics for a branch.
+    When a request is given the result is memoized on it, so repeated calls while
+    rendering the same page do not hit the database again.
+    """
+    if request is None:
+        return _compute_dashboard_stats(branch)
+
+    memo = request.__dict__.setdefault('_branch_dashboard_stats', {})
+    if branch.pk not in memo:
+        memo[branch.pk] = _compute_dashboard_stats(branch)
+    return memo[branch.pk]
@@ -0,0 +1,54 @@
+from django.db import transaction
+from django.db.models import Max, OuterRef, Subquery
+
+from kop.models import DoctorProfile, Invoice, Patient, PatientConsultation, TreatmentSession
+
+# Where each denormalized `branch` column is copied from: (foreign key of the row, model it points to)
+BRANCH_SOURCES = {
+    TreatmentSession: ('treatment_doctor', DoctorProfile),
+    PatientConsultation: ('patient', Patient),
+    Invoice: ('patient', Patient),
+}
+
+
+def source_branch(model):
+    """Expression for the branch a row of `model` should carry, read from its source row"""
+    field, source = BRANCH_SOURCES[model]
+    return Subquery(source.objects.filter(pk=OuterRef(f'{field}_id')).values('branch_id')[:1])
+
+
+def backfill_branches(model, chunk_size=5000, missing_only=False):
+    """
+    Recompute the branch column of `model` from its source, `chunk_size` primary
+    keys per UPDATE and transaction so no lock is held for long.
+    Yields (last primary key of the chunk, rows updated) after every chunk.
+    """
+    rows = model.objects.all()
+    if missing_only:
+        rows = rows.filter(branch__isnull=True)
+    last_pk = rows.aggregate(last=Max('pk'))['last'] or 0
+
+    start = 0
+    while start <= last_pk:
+        end = start + chunk_size
+        with transaction.atomic():
+            updated = rows.filter(pk__gte=start, pk__lt=end).update(branch_id=source_branch(model))
+        yield min(end - 1, last_pk), updated
+        start = end
+
+
+def sync_patient_branch(patient):
+    """Move a patient's consultations and invoices to the patient's current branch, returns the rows moved"""
+    return sum(
+        model.objects.filter(patient=patient).exclude(
+            branch_id=patient.branch_id
+        ).update(branch_id=patient.branch_id)
+        for model in (PatientConsultation, Invoice)
+    )
+
+
+def sync_doctor_branch(doctor):
+    """Move a doctor's treatment sessions to the doctor's current branch, returns the rows moved"""
+    return TreatmentSession.objects.filter(treatment_doctor=doctor).exclude(
+        branch_id=doctor.branch_id
+    ).update(branch_id=doctor.branch_id)
@@ -1,10 +1,17 @@
+import re
+
+from kop.utils.roles import get_user_role
+
+
 def get_user_branch(user):
     """
     Get the branch associated with a user, whether they're a doctor or branch admin.
     Returns None if user doesn't have either profile.
     """
-    if hasattr(user, 'doctor_profile'):
-        return user.doctor_profile.branch
-    elif hasattr(user, 'branch_admin'):
-        return user.branch_admin.branch
-    return None
+    role = get_user_role(user)
+    return role.branch if role.is_doctor or role.is_branch_admin else None
+
+
+def phone_digits(value):
+    """Digits of a phone number, so "+91 98765-43210" and "919876543210" compare equal"""
+    return re.sub(r'\D', '', value or '')
@@ -0,0 +1,79 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from dateutil.relativedelta import relativedelta
+
+from kop.models import DailyActivityRollup, Patient
+from kop.utils.activity_rollup import status_total
+
+CACHE_KEY_PREFIX = 'kop:doctor-dashboard-stats'
+
+
+def get_dashboard_cache_key(doctor_id, day=None):
+    """Cache key for a doctor's dashboard counters on a given day"""
+    day = day or timezone.now().date()
+    return f'{CACHE_KEY_PREFIX}:{doctor_id}:{day.isoformat()}'
+
+
+def _counters(prefix, today):
+    """Sums over the daily rollup for the session or consultation counters"""
+    month_start = today.replace(day=1)
+    next_month_start = month_start + relativedelta(months=1)
+    return {
+        f'{prefix}_total': Coalesce(Sum(status_total(prefix)), 0),
+        f'{prefix}_monthly': Coalesce(
+            Sum(f'{prefix}_completed', filter=Q(date__gte=month_start, date__lt=next_month_start)), 0
+        ),
+        f'{prefix}_today_completed': Coalesce(Sum(f'{prefix}_completed', filter=Q(date=today)), 0),
+        f'{prefix}_today_scheduled': Coalesce(Sum(f'{prefix}_scheduled', filter=Q(date=today)), 0),
+    }
+
+
+def compute_doctor_dashboard_stats(doctor, today=None):
+    """
+    Work out all dashboard counters for a doctor.
+    The session and consultation counters are summed from the doctor's daily
+    activity rollup rows in one query instead of counting the raw rows.
+    """
+    today = today or timezone.now().date()
+
+    counts = DailyActivityRollup.objects.filter(doctor=doctor).aggregate(
+        **_counters('sessions', today), **_counters('consultations', today)
+    )
+    assigned_patients = Patient.objects.filter(treatments__doctor=doctor).distinct().count()
+
+    return {
+        # Treatment Sessions
+        'total_sessions': counts['sessions_total'],
+        'monthly_sessions': counts['sessions_monthly'],
+        'todays_completed': counts['sessions_today_completed'],
+        'scheduled_today': counts['sessions_today_scheduled'],
+
+        # Consultations
+        'total_consultations': counts['consultations_total'],
+        'monthly_consultations': counts['consultations_monthly'],
+        'todays_completed_consultations': counts['consultations_today_completed'],
+        'scheduled_consultations_today': counts['consultations_today_scheduled'],
+
+        # Patients
+        'assigned_patients': assigned_patients,
+    }
+
+
+def get_doctor_dashboard_stats(doctor):
+    """Cached dashboard counters for a doctor, recomputed at most once per TTL"""
+    today = timezone.now().date()
+    key = get_dashboard_cache_key(doctor.pk, today)
+    stats = cache.get(key)
+    if stats is None:
+        stats = compute_doctor_dashboard_stats(doctor, today)
+        cache.set(key, stats, settings.DOCTOR_DASHBOARD_CACHE_TIMEOUT)
+    return stats
+
+
+def invalidate_doctor_dashboard_stats(doctor_id):
+    """Drop the cached counters for a doctor so the next page load recomputes them"""
+    if doctor_id:
+        cache.delete(get_dashboard_cache_key(doctor_id))
@@ -0,0 +1,217 @@
+import csv
+import datetime
+import re
+import zipfile
+import zlib
+from decimal import Decimal
+from itertools import chain
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+# Bytes gathered before a chunk is handed to the response
+CHUNK_BYTES = 64 * 1024
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+# Cells a spreadsheet would read as a formula
+FORMULA_START = ('=', '+', '-', '@', '\t', '\r')
+# Characters XML 1.0 does not allow
+XML_INVALID = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+EXCEL_EPOCH = datetime.date(1899, 12, 30)
+
+XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Export" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+        'Target="styles.xml"/>'
+        '</Relationships>'
+    ),
+    # Cell formats: 0 general, 1 date, 2 time, 3 date and time
+    'xl/styles.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<fonts count="1"><font/></fonts>'
+        '<fills count="1"><fill/></fills>'
+        '<borders count="1"><border/></borders>'
+        '<cellStyleXfs count="1"><xf/></cellStyleXfs>'
+        '<cellXfs count="4"><xf/><xf numFmtId="14" applyNumberFormat="1"/>'
+        '<xf numFmtId="20" applyNumberFormat="1"/><xf numFmtId="22" applyNumberFormat="1"/></cellXfs>'
+        '</styleSheet>'
+    ),
+}
+SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+SHEET_END = '</sheetData></worksheet>'
+
+
+def iterate_rows(queryset, fields):
+    """Tuples of `fields` for every row, fetched `EXPORT_CHUNK_SIZE` at a time"""
+    return queryset.values_list(*fields).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+
+
+def _csv_value(value):
+    if isinstance(value, str) and value.startswith(FORMULA_START):
+        return f"'{value}"
+    return value
+
+
+class _Lines:
+    """File-like object handing back what csv.writer writes"""
+
+    def write(self, value):
+        return value
+
+
+def csv_chunks(header, rows):
+    """CSV text of a header and rows, in chunks of about CHUNK_BYTES"""
+    writer = csv.writer(_Lines())
+    lines = [writer.writerow(header)]
+    size = 0
+    for row in rows:
+        line = writer.writerow([_csv_value(value) for value in row])
+        lines.append(line)
+        size += len(line)
+        if size >= CHUNK_BYTES:
+            yield ''.join(lines)
+            lines, size = [], 0
+    yield ''.join(lines)
+
+
+def _xlsx_cell(value):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float, Decimal)):
+        return f'<c><v>{value}</v></c>'
+    if isinstance(value, datetime.datetime):
+        if timezone.is_aware(value):
+            value = timezone.make_naive(value)
+        days = (value - datetime.datetime.combine(EXCEL_EPOCH, datetime.time())).total_seconds() / 86400
+        return f'<c s="3"><v>{days}</v></c>'
+    if isinstance(value, datetime.date):
+        return f'<c s="1"><v>{(value - EXCEL_EPOCH).days}</v></c>'
+    if isinstance(value, datetime.time):
+        return f'<c s="2"><v>{(value.hour * 3600 + value.minute * 60 + value.second) / 86400}</v></c>'
+    text = escape(XML_INVALID.sub('', str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+class _Chunks:
+    """Unseekable file collecting what zipfile writes until it is drained"""
+
+    def __init__(self):
+        self.parts = []
+        self.size = 0
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts, self.size = [], 0
+        return data
+
+
+def xlsx_chunks(header, rows):
+    """
+    A one-sheet XLSX workbook of a header and rows, in chunks of about CHUNK_BYTES.
+    The worksheet is written into the zip as the rows arrive, so nothing but the
+    current chunk is held in memory.
+    """
+    out = _Chunks()
+    with zipfile.ZipFile(out, 'w', compression=zipfile.ZIP_DEFLATED) as workbook:
+        for name, content in XLSX_PARTS.items():
+            workbook.writestr(name, content)
+        with workbook.open('xl/worksheets/sheet1.xml', 'w') as sheet:
+            sheet.write(SHEET_START.encode())
+            for row in chain([header], rows):
+                sheet.write(f'<row>{"".join(_xlsx_cell(value) for value in row)}</row>'.encode())
+                if out.size >= CHUNK_BYTES:
+                    yield out.drain()
+            sheet.write(SHEET_END.encode())
+    yield out.drain()
+
+
+def gzip_chunks(chunks):
+    """Gzip a stream of byte chunks as it goes"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_file(filename, header, rows, export_format='csv', compress=False):
+    """
+    (file name, content type, byte chunks) of `rows` under `header` as
+    `filename`.csv or .xlsx, gzipped to a .gz file when `compress` is set.
+    `rows` should be a lazy iterator (see iterate_rows) so the export never sits
+    in memory whole.
+    """
+    if export_format == 'xlsx':
+        chunks = xlsx_chunks(header, rows)
+    else:
+        chunks = (chunk.encode() for chunk in csv_chunks(header, rows))
+    filename = f'{filename}.{export_format}'
+    content_type = CONTENT_TYPES[export_format]
+    if compress:
+        chunks = gzip_chunks(chunks)
+        filename = f'{filename}.gz'
+        content_type = 'application/gzip'
+    return filename, content_type, chunks
+
+
+def export_response(filename, header, rows, export_format='csv', compress=False):
+    """StreamingHttpResponse downloading an export (see export_file)"""
+    filename, content_type, chunks = export_file(filename, header, rows, export_format, compress)
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
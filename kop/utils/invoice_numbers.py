@@ -0,0 +1,71 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+from kop.jobs import queue_rollup_refresh
+from kop.models import Invoice, InvoiceSequence
+from kop.utils import metrics
+from kop.utils.activity_rollup import invoice_day
+
+
+def format_invoice_number(branch_id, year, number):
+    """Invoice number as printed, e.g. INV-2025-3-007"""
+    return f"INV-{year}-{branch_id or 0}-{str(number).zfill(3)}"
+
+
+def allocate_invoice_numbers(branch_id, year, count=1):
+    """
+    Reserve `count` consecutive invoice numbers for a branch and year.
+
+    The counter row is locked for the rest of the surrounding transaction, so
+    concurrent writers queue on it instead of reading the same last number.
+    Call this inside the transaction that inserts the invoices to keep the
+    sequence gap-free.
+    """
+    if count < 1:
+        raise ValueError("count must be at least 1")
+
+    with transaction.atomic():
+        sequence, _ = InvoiceSequence.objects.select_for_update().get_or_create(
+            branch_id=branch_id,
+            year=year,
+        )
+        first = sequence.last_number + 1
+        sequence.last_number += count
+        sequence.save(update_fields=['last_number'])
+
+    return range(first, first + count)
+
+
+def assign_invoice_numbers(invoices):
+    """
+    Give every unnumbered invoice a number, one block allocation per branch and year.
+    Invoices are numbered in the order they are passed in.
+    """
+    year = timezone.now().year
+    pending = defaultdict(list)
+    for invoice in invoices:
+        if not invoice.invoice_number:
+            pending[invoice.patient.branch_id].append(invoice)
+
+    for branch_id, group in pending.items():
+        numbers = allocate_invoice_numbers(branch_id, year, len(group))
+        for invoice, number in zip(group, numbers):
+            invoice.invoice_number = format_invoice_number(branch_id, year, number)
+
+    return invoices
+
+
+def bulk_create_invoices(invoices, batch_size=None):
+    """Number and insert many invoices in one transaction"""
+    with transaction.atomic():
+        assign_invoice_numbers(invoices)
+        # bulk_create skips Invoice.save, which counts the others and copies the branch,
+        # and the post_save receivers, which refresh the activity rollup
+        for invoice in invoices:
+            invoice.branch_id = invoice.patient.branch_id
+        invoices = Invoice.objects.bulk_create(invoices, batch_size=batch_size)
+        metrics.count_invoices_created(invoices)
+        queue_rollup_refresh({invoice_day(invoice) for invoice in invoices})
+        return invoices
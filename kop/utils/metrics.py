@@ -0,0 +1,74 @@
+import os
+
+from django.db import transaction
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, \
+    generate_latest, multiprocess
+
+# Seconds
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+# Queries per request
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+REQUEST_LATENCY = Histogram(
+    'kop_request_duration_seconds', 'Request wall time by URL name',
+    ['view', 'method', 'status'], buckets=LATENCY_BUCKETS,
+)
+REQUEST_QUERIES = Histogram(
+    'kop_request_db_queries', 'Database queries per request by URL name',
+    ['view'], buckets=QUERY_COUNT_BUCKETS,
+)
+QUERY_LATENCY = Histogram(
+    'kop_db_query_duration_seconds', 'Database query time by the URL name that ran it',
+    ['view'], buckets=QUERY_BUCKETS,
+)
+SESSIONS_COMPLETED = Counter('kop_treatment_sessions_completed', 'Treatment sessions marked completed')
+INVOICES_CREATED = Counter('kop_invoices_created', 'Invoices created', ['type'])
+PAYMENTS_CREATED = Counter('kop_payments_created', 'Payments recorded', ['method'])
+PAYMENT_AMOUNT = Counter('kop_payment_amount', 'Amount of the payments recorded', ['method'])
+
+
+def _on_commit(func):
+    # Rolled back saves didn't happen; count them only once committed
+    transaction.on_commit(func)
+
+
+def count_sessions_completed(count=1):
+    if count:
+        _on_commit(lambda: SESSIONS_COMPLETED.inc(count))
+
+
+def count_invoices_created(invoices):
+    types = ['consultation' if invoice.consultation_id else 'treatment' for invoice in invoices]
+
+    def record():
+        for invoice_type in types:
+            INVOICES_CREATED.labels(invoice_type).inc()
+
+    _on_commit(record)
+
+
+def count_payment_created(payment):
+    method, amount = payment.method, float(payment.amount)
+
+    def record():
+        PAYMENTS_CREATED.labels(method).inc()
+        PAYMENT_AMOUNT.labels(method).inc(amount)
+
+    _on_commit(record)
+
+
+def exposition():
+    """
+    (body, content type) of every metric in the Prometheus text format.
+
+    Under gunicorn, set PROMETHEUS_MULTIPROC_DIR to a directory shared by the
+    workers (emptied when the server starts, see config/gunicorn.py): every
+    worker writes its values there and they are added up here.
+    """
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
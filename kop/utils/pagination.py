@@ -0,0 +1,236 @@
+import base64
+import datetime
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import InvalidPage, Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def _estimate_rows(queryset):
+    """Planner row estimate for a queryset (PostgreSQL)"""
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def approximate_count(queryset):
+    """
+    Row count of a queryset, cached for PAGINATION_COUNT_CACHE_TIMEOUT seconds.
+
+    On PostgreSQL, results the planner expects to be larger than
+    PAGINATION_EXACT_COUNT_LIMIT use its estimate instead of a COUNT(*);
+    smaller ones (and other databases) are counted exactly.
+    """
+    queryset = queryset.order_by()
+    sql, params = queryset.query.sql_with_params()
+    cache_key = 'approximate-count:' + hashlib.md5(f'{sql}{params}'.encode(), usedforsecurity=False).hexdigest()
+
+    count = cache.get(cache_key)
+    if count is None:
+        if connections[queryset.db].vendor == 'postgresql':
+            estimate = _estimate_rows(queryset)
+            if estimate > settings.PAGINATION_EXACT_COUNT_LIMIT:
+                count = estimate
+        if count is None:
+            count = queryset.count()
+        cache.set(cache_key, count, settings.PAGINATION_COUNT_CACHE_TIMEOUT)
+    return count
+
+
+def _json_default(value):
+    # Full precision: DjangoJSONEncoder would cut datetimes to milliseconds,
+    # and a truncated key no longer matches the row it came from
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value)
+
+
+class CachedCountPaginator(Paginator):
+    """Page-number Paginator whose total comes from approximate_count()"""
+
+    @cached_property
+    def count(self):
+        return approximate_count(self.object_list)
+
+
+class KeysetPage:
+    """One page of a KeysetPaginator, iterable like a Django Page"""
+
+    is_keyset = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if self._has_next and self.object_list:
+            return self.paginator.encode_cursor(self.object_list[-1])
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous and self.object_list:
+            return self.paginator.encode_cursor(self.object_list[0], backwards=True)
+        return None
+
+
+class KeysetPaginator:
+    """
+    Cursor pagination over a unique ordering such as ('-created_at', '-id').
+
+    Each page is fetched with a WHERE on the ordering key of the last row seen
+    instead of an OFFSET, so page N costs the same as page 1 given an index on
+    the ordering columns. The total is approximate_count().
+    """
+
+    def __init__(self, object_list, ordering, per_page):
+        self.object_list = object_list
+        self.ordering = list(ordering)
+        self.per_page = int(per_page)
+
+    @cached_property
+    def count(self):
+        return approximate_count(self.object_list)
+
+    def _field(self, name):
+        try:
+            return self.object_list.model._meta.get_field(name.lstrip('-'))
+        except FieldDoesNotExist:
+            return None
+
+    def _key(self, obj):
+        values = []
+        for name in self.ordering:
+            field = self._field(name)
+            values.append(getattr(obj, field.attname if field else name.lstrip('-')))
+        return values
+
+    def encode_cursor(self, obj, backwards=False):
+        payload = json.dumps({'k': self._key(obj), 'b': backwards}, default=_json_default)
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            values = payload['k']
+            if len(values) != len(self.ordering):
+                raise ValueError
+            key = [
+                field.to_python(value) if (field := self._field(name)) else value
+                for name, value in zip(self.ordering, values)
+            ]
+            return key, bool(payload.get('b'))
+        # Bad base64 or JSON (ValueError), a payload of the wrong shape, a value the field rejects
+        except (KeyError, TypeError, ValueError, ValidationError) as e:
+            raise InvalidPage('Invalid cursor') from e
+
+    @staticmethod
+    def _after(ordering, key):
+        """Rows strictly after `key` in `ordering`: (a > x) OR (a = x AND b > y) OR ..."""
+        condition = Q()
+        for index, name in enumerate(ordering):
+            field = name.lstrip('-')
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            step = Q(**{f'{field}__{lookup}': key[index]})
+            for previous, value in zip(ordering[:index], key[:index]):
+                step &= Q(**{previous.lstrip('-'): value})
+            condition |= step
+        return condition
+
+    def page(self, cursor=None):
+        key, backwards = self.decode_cursor(cursor) if cursor else (None, False)
+        ordering = self.ordering
+        if backwards:
+            ordering = [name[1:] if name.startswith('-') else f'-{name}' for name in ordering]
+
+        queryset = self.object_list.order_by(*ordering)
+        if key is not None:
+            queryset = queryset.filter(self._after(ordering, key))
+
+        # One extra row tells whether there is anything beyond this page
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if backwards:
+            rows.reverse()
+            return KeysetPage(rows, self, has_next=True, has_previous=has_more)
+        return KeysetPage(rows, self, has_next=has_more, has_previous=key is not None)
+
+
+class KeysetPagination(BasePagination):
+    """
+    DRF keyset pagination. Responses keep the PageNumberPagination shape
+    (count, next, previous, results); count is approximate and cached.
+    Views can set `keyset_ordering` to a unique ordering.
+    """
+
+    page_size = api_settings.PAGE_SIZE
+    cursor_query_param = 'cursor'
+    ordering = ('-created_at', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.paginator = KeysetPaginator(queryset, getattr(view, 'keyset_ordering', self.ordering), self.page_size)
+        try:
+            self.page = self.paginator.page(request.query_params.get(self.cursor_query_param))
+        except InvalidPage as e:
+            raise NotFound('Invalid cursor.') from e
+        return list(self.page)
+
+    def _link(self, cursor):
+        url = self.request.build_absolute_uri()
+        if cursor is None:
+            return remove_query_param(url, self.cursor_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_next_link(self):
+        if not self.page.has_next():
+            return None
+        return self._link(self.page.next_cursor)
+
+    def get_previous_link(self):
+        if not self.page.has_previous():
+            return None
+        return self._link(self.page.previous_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.paginator.count,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
@@ -0,0 +1,60 @@
+from django.db.models import Prefetch
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+
+from kop.models import Invoice, Patient, PatientAttachment, PatientConsultation, PatientTreatment, Payment, \
+    TreatmentSession
+
+
+def get_patient_detail_queryset():
+    """
+    Patients with everything the detail page shows prefetched: one query per
+    relation (treatments, their last sessions, consultations, invoices, their
+    payments, attachments) no matter how long the patient's history is.
+    """
+    return Patient.objects.select_related('branch', 'source_of_lead').prefetch_related(
+        Prefetch(
+            'treatments',
+            queryset=PatientTreatment.objects.select_related('treatment_program', 'doctor__user'),
+        ),
+        # "Last session": the latest one that has taken place (or was called off), not the next one
+        Prefetch(
+            'treatments__treatmentsession_set',
+            queryset=TreatmentSession.objects.filter(date__lte=timezone.now().date()).exclude(
+                status='scheduled'
+            ).order_by('-date', '-start_time', '-id')[:1],
+            to_attr='last_sessions',
+        ),
+        Prefetch(
+            'consultations',
+            queryset=PatientConsultation.objects.select_related('doctor__user'),
+        ),
+        Prefetch(
+            'invoice_set',
+            queryset=Invoice.objects.select_related('consultation', 'treatment').order_by('-invoice_date', '-id'),
+            to_attr='invoices',
+        ),
+        Prefetch(
+            'invoices__payments',
+            queryset=Payment.objects.order_by('-payment_date', '-id'),
+        ),
+        Prefetch('attachments', queryset=PatientAttachment.objects.order_by('-created_at')),
+    )
+
+
+def load_patient_detail(pk):
+    """The patient and the related rows for its detail page, in a fixed number of queries"""
+    patient = get_object_or_404(get_patient_detail_queryset(), pk=pk)
+    payments = sorted(
+        (payment for invoice in patient.invoices for payment in invoice.payments.all()),
+        key=lambda payment: (payment.payment_date, payment.pk),
+        reverse=True,
+    )
+    return {
+        'patient': patient,
+        'treatments': patient.treatments.all(),
+        'consultations': patient.consultations.all(),
+        'invoices': patient.invoices,
+        'payments': payments,
+        'attachments': patient.attachments.all(),
+    }
@@ -0,0 +1,142 @@
+from django.db import connections
+from django.db.models import Case, FloatField, Q, Value, When
+from django.db.models.functions import Concat
+
+from kop.utils.common import phone_digits
+
+# Shorter digit strings are treated as part of a name search
+MIN_PHONE_DIGITS = 3
+
+_trigram_enabled = {}
+
+
+def trigram_enabled(using='default'):
+    """Whether pg_trgm is installed, i.e. migrations 0026 and 0032 created the trigram indexes"""
+    if using not in _trigram_enabled:
+        connection = connections[using]
+        enabled = False
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+                enabled = cursor.fetchone() is not None
+        _trigram_enabled[using] = enabled
+    return _trigram_enabled[using]
+
+
+def _looks_like_phone(term):
+    return not any(char.isalpha() for char in term) and len(phone_digits(term)) >= MIN_PHONE_DIGITS
+
+
+def _name_search(words, prefix, trigram):
+    filters = Q()
+    for word in words:
+        filters &= Q(**{f'{prefix}first_name__icontains': word}) | Q(**{f'{prefix}last_name__icontains': word})
+
+    term = ' '.join(words)
+    if trigram:
+        from django.contrib.postgres.search import TrigramSimilarity
+
+        rank = TrigramSimilarity(Concat(f'{prefix}first_name', Value(' '), f'{prefix}last_name'), term)
+    else:
+        rank = Case(
+            When(**{f'{prefix}first_name__iexact': words[0]}, then=Value(1.0)),
+            When(**{f'{prefix}first_name__istartswith': words[0]}, then=Value(0.75)),
+            When(**{f'{prefix}last_name__istartswith': words[0]}, then=Value(0.5)),
+            default=Value(0.25),
+            output_field=FloatField(),
+        )
+    return filters, rank
+
+
+def _phone_search(digits, prefix):
+    filters = Q(**{f'{prefix}phone_digits__contains': digits})
+    rank = Case(
+        When(**{f'{prefix}phone_digits': digits}, then=Value(1.0)),
+        When(**{f'{prefix}phone_digits__startswith': digits}, then=Value(0.75)),
+        When(**{f'{prefix}phone_digits__endswith': digits}, then=Value(0.5)),
+        default=Value(0.25),
+        output_field=FloatField(),
+    )
+    return filters, rank
+
+
+def search_filters(term='', phone='', prefix='', using=None):
+    """
+    (filters, rank expression) of a patient search, None when there is nothing
+    to search for (see search_patients). Ranked by trigram similarity when the
+    `using` database has pg_trgm, by a prefix score otherwise or without `using`.
+    """
+    term, phone = (term or '').strip(), (phone or '').strip()
+    if term and not phone and _looks_like_phone(term):
+        term, phone = '', term
+
+    filters = Q()
+    ranks = []
+    if term:
+        name_filters, rank = _name_search(term.split(), prefix, using is not None and trigram_enabled(using))
+        filters &= name_filters
+        ranks.append(rank)
+    if phone_digits(phone):
+        phone_filters, rank = _phone_search(phone_digits(phone), prefix)
+        filters &= phone_filters
+        ranks.append(rank)
+
+    if not ranks:
+        return None
+    return filters, sum(ranks[1:], ranks[0])
+
+
+def search_patients(queryset, term='', phone='', prefix=''):
+    """
+    Filter `queryset` to patients matching `term` and/or `phone`, best matches first.
+
+    Every word of `term` has to appear in the first or last name; a term made of
+    digits (and phone punctuation) searches the normalized phone number instead.
+    On PostgreSQL with pg_trgm the substring matches are served by trigram GIN
+    indexes and ranked by similarity, elsewhere by plain LIKE and a prefix score.
+
+    `prefix` is the lookup path to the patient, e.g. 'patient__' for treatments.
+    Results are annotated with `search_rank`.
+    """
+    search = search_filters(term, phone, prefix, using=queryset.db)
+    if search is None:
+        return queryset
+    filters, rank = search
+    ordering = [*queryset.query.order_by] or ['pk']
+    return queryset.filter(filters).annotate(search_rank=rank).order_by('-search_rank', *ordering)
+
+
+def is_phone_search(term):
+    """Whether a search term is taken for a phone number rather than a name"""
+    return _looks_like_phone((term or '').strip())
+
+
+def match_rank(term, first_name, last_name, digits):
+    """
+    In-memory twin of search_filters(term) with the prefix score: the rank of a
+    patient with these names and phone digits, None when they don't match.
+    Keep in step with _name_search and _phone_search.
+    """
+    term = (term or '').strip()
+    if not term:
+        return 0.0
+    first_name, last_name, digits = first_name or '', last_name or '', digits or ''
+    if _looks_like_phone(term):
+        wanted = phone_digits(term)
+        if wanted not in digits:
+            return None
+        if digits == wanted:
+            return 1.0
+        if digits.startswith(wanted):
+            return 0.75
+        return 0.5 if digits.endswith(wanted) else 0.25
+
+    words = term.lower().split()
+    first_name, last_name = first_name.lower(), last_name.lower()
+    if not all(word in first_name or word in last_name for word in words):
+        return None
+    if first_name == words[0]:
+        return 1.0
+    if first_name.startswith(words[0]):
+        return 0.75
+    return 0.5 if last_name.startswith(words[0]) else 0.25
@@ -0,0 +1,60 @@
+from collections import Counter
+
+from django.db import connection
+
+from kop.models import Invoice
+
+
+def format_payment_reference(invoice_id, number):
+    """Payment reference as printed, e.g. PAY-42-3"""
+    return f"PAY-{invoice_id}-{number}"
+
+
+def allocate_payment_numbers(counts):
+    """
+    Reserve payment sequence numbers for several invoices in one statement.
+
+    `counts` maps invoice id to how many numbers it needs. Every invoice row is
+    bumped by a single UPDATE ... RETURNING, which is atomic per row, so two
+    writers can never be handed the same number and no table is scanned.
+    Returns a dict of invoice id to the range of numbers reserved for it.
+    """
+    counts = {invoice_id: count for invoice_id, count in counts.items() if count}
+    if not counts:
+        return {}
+
+    table = connection.ops.quote_name(Invoice._meta.db_table)
+    pk = connection.ops.quote_name(Invoice._meta.pk.column)
+    column = connection.ops.quote_name(Invoice._meta.get_field('last_payment_number').column)
+    cases = ' '.join(['WHEN %s THEN %s'] * len(counts))
+    placeholders = ', '.join(['%s'] * len(counts))
+    params = [value for item in counts.items() for value in item] + list(counts)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {table} SET {column} = {column} + CASE {pk} {cases} END "
+            f"WHERE {pk} IN ({placeholders}) RETURNING {pk}, {column}",
+            params,
+        )
+        rows = cursor.fetchall()
+
+    if len(rows) != len(counts):
+        missing = set(counts) - {invoice_id for invoice_id, _ in rows}
+        raise Invoice.DoesNotExist(f"Invoices not found: {sorted(missing)}")
+
+    return {
+        invoice_id: range(last - counts[invoice_id] + 1, last + 1)
+        for invoice_id, last in rows
+    }
+
+
+def assign_payment_references(payments):
+    """Fill in the reference of every payment that has none, in one round trip"""
+    unreferenced = [payment for payment in payments if not payment.reference]
+    allocated = allocate_payment_numbers(Counter(payment.invoice_id for payment in unreferenced))
+
+    numbers = {invoice_id: iter(block) for invoice_id, block in allocated.items()}
+    for payment in unreferenced:
+        payment.reference = format_payment_reference(payment.invoice_id, next(numbers[payment.invoice_id]))
+
+    return payments
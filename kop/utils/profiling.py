@@ -0,0 +1,167 @@
+import re
+import threading
+import time
+from collections import deque
+from itertools import count
+
+from django.conf import settings
+from django.template.backends.django import Template
+
+_state = threading.local()
+_ids = count(1)
+_lock = threading.Lock()
+_buffer = deque(maxlen=settings.REQUEST_PROFILING_BUFFER_SIZE)
+
+# Duplicate groups kept per request, most repeated first
+MAX_DUPLICATES = 10
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """
+    The shape of a statement with its values taken out, so the same query with
+    other parameters (the N+1 pattern) groups together: literals become ?,
+    IN lists of any length become (...).
+    """
+    sql = _STRING_LITERAL.sub('?', sql)
+    sql = _NUMBER_LITERAL.sub('?', sql)
+    sql = _PLACEHOLDER_LIST.sub('(...)', sql.replace('%s', '?'))
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+class RequestProfile:
+    """SQL and template timings of one request; collect it with profile()"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = []
+        self.template_ms = 0.0
+        self._template_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # A connection.execute_wrapper: time every statement
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, repr(params), (time.perf_counter() - started) * 1000))
+
+    def duplicates(self):
+        """Fingerprints run more than once: how often, with how many repeated parameter sets, and their time"""
+        groups = {}
+        for sql, params, ms in self.queries:
+            group = groups.setdefault(fingerprint(sql), {'count': 0, 'ms': 0.0, 'calls': set()})
+            group['count'] += 1
+            group['ms'] += ms
+            group['calls'].add((sql, params))
+        duplicates = [
+            {
+                'fingerprint': key,
+                'count': group['count'],
+                'identical': group['count'] - len(group['calls']),
+                'ms': round(group['ms'], 2),
+            }
+            for key, group in groups.items()
+            if group['count'] > 1
+        ]
+        duplicates.sort(key=lambda duplicate: (-duplicate['count'], -duplicate['ms']))
+        return duplicates[:MAX_DUPLICATES]
+
+    def summary(self, request, response):
+        """The record logged and kept in the ring buffer"""
+        match = getattr(request, 'resolver_match', None)
+        user = getattr(request, 'user', None)
+        return {
+            'id': next(_ids),
+            'at': time.time(),
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'user': user.pk if user is not None and user.is_authenticated else None,
+            'ms': round((time.perf_counter() - self.started) * 1000, 2),
+            'sql_count': len(self.queries),
+            'sql_ms': round(sum(ms for _, _, ms in self.queries), 2),
+            'template_ms': round(self.template_ms, 2),
+            'duplicates': self.duplicates(),
+        }
+
+
+def current_profile():
+    return getattr(_state, 'profile', None)
+
+
+def start_profile():
+    _state.profile = RequestProfile()
+    return _state.profile
+
+
+def stop_profile():
+    _state.profile = None
+
+
+def _timed_render(render):
+    def wrapper(self, context=None, request=None):
+        profile = current_profile()
+        if profile is None:
+            return render(self, context, request)
+        # Only the outermost render counts; nested render_to_string calls are part of it
+        profile._template_depth += 1
+        started = time.perf_counter()
+        try:
+            return render(self, context, request)
+        finally:
+            profile._template_depth -= 1
+            if not profile._template_depth:
+                profile.template_ms += (time.perf_counter() - started) * 1000
+
+    wrapper.profiled = True
+    return wrapper
+
+
+def instrument_templates():
+    """Time Django template renders while a profile is active; safe to call more than once"""
+    if not getattr(Template.render, 'profiled', False):
+        Template.render = _timed_render(Template.render)
+
+
+def record(summary):
+    with _lock:
+        _buffer.append(summary)
+
+
+def recent_profiles():
+    """Profiled requests of this process, newest first"""
+    with _lock:
+        return list(reversed(_buffer))
+
+
+def clear_profiles():
+    with _lock:
+        _buffer.clear()
+
+
+def view_breakdown(profiles):
+    """Per view: requests, average and worst wall time, SQL count and SQL time, slowest first"""
+    views = {}
+    for profile in profiles:
+        views.setdefault(profile['view'] or profile['path'], []).append(profile)
+    rows = [
+        {
+            'view': view,
+            'requests': len(group),
+            'avg_ms': round(sum(p['ms'] for p in group) / len(group), 2),
+            'max_ms': max(p['ms'] for p in group),
+            'avg_sql_count': round(sum(p['sql_count'] for p in group) / len(group), 1),
+            'max_sql_count': max(p['sql_count'] for p in group),
+            'avg_sql_ms': round(sum(p['sql_ms'] for p in group) / len(group), 2),
+            'avg_template_ms': round(sum(p['template_ms'] for p in group) / len(group), 2),
+        }
+        for view, group in views.items()
+    ]
+    rows.sort(key=lambda row: -row['avg_ms'])
+    return rows
@@ -0,0 +1,217 @@
+import datetime
+import time
+from collections import defaultdict
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+from django.core.cache import cache
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from kop.models import Invoice, Payment
+from kop.utils.activity_rollup import INVOICE_DOCTOR, PAYMENT_DOCTOR
+
+CACHE_KEY_PREFIX = 'kop:revenue-report'
+
+# (key, name) of every revenue grouping, for invoices and for payments; None when it doesn't apply
+DIMENSIONS = {
+    'branch': (
+        (F('branch_id'), F('branch__name')),
+        (F('invoice__branch_id'), F('invoice__branch__name')),
+    ),
+    'program': (
+        (F('treatment__treatment_program_id'), F('treatment__treatment_program__name')),
+        (F('invoice__treatment__treatment_program_id'), F('invoice__treatment__treatment_program__name')),
+    ),
+    'doctor': (
+        (INVOICE_DOCTOR, Coalesce(F('consultation__doctor__user__name'), F('treatment__doctor__user__name'))),
+        (PAYMENT_DOCTOR, Coalesce(
+            F('invoice__consultation__doctor__user__name'), F('invoice__treatment__doctor__user__name')
+        )),
+    ),
+    'method': (
+        None,
+        (F('method'), F('method')),
+    ),
+}
+
+# Names of rows without a key: consultation invoices have no program
+UNGROUPED_NAMES = {'branch': 'No branch', 'program': 'Consultations', 'doctor': 'No doctor'}
+METHOD_NAMES = dict(Payment.PAYMENT_METHODS)
+
+# (label, first day overdue, last day overdue) of the receivables aging buckets
+AGING_BUCKETS = [
+    ('current', None, 0),
+    ('1-30', 1, 30),
+    ('31-60', 31, 60),
+    ('61-90', 61, 90),
+    ('90+', 91, None),
+]
+
+
+MEASURES = ('invoiced', 'invoice_count', 'collected', 'discounts', 'payment_count')
+MONEY_MEASURES = ('invoiced', 'collected', 'discounts')
+
+
+def _empty_measures():
+    return {measure: Decimal('0') if measure in MONEY_MEASURES else 0 for measure in MEASURES}
+
+
+def _empty_row():
+    return {'name': None, **_empty_measures()}
+
+
+def get_partition_cache_key(branch_id, month):
+    """Cache key for the revenue sums of one closed calendar month"""
+    # A fresh version whenever the old one is gone, so evicted versions are never reused
+    version = cache.get_or_set(f'{CACHE_KEY_PREFIX}:version', time.time_ns, None)
+    return f'{CACHE_KEY_PREFIX}:{version}:{branch_id or "all"}:{month:%Y-%m}'
+
+
+def compute_partition(branch_id, start, end):
+    """
+    Revenue sums of invoices issued and payments taken from start to end, as
+    {dimension: {key: row}}. One grouped query per dimension and table.
+    """
+    invoices = Invoice.objects.for_branch(branch_id).filter(invoice_date__range=(start, end))
+    payments = Payment.objects.filter(payment_date__range=(start, end))
+    if branch_id:
+        payments = payments.filter(invoice__branch_id=branch_id)
+
+    sums = {}
+    for dimension, (invoice_group, payment_group) in DIMENSIONS.items():
+        rows = defaultdict(_empty_row)
+        if invoice_group:
+            key, name = invoice_group
+            for row in invoices.order_by().annotate(key=key, name=name).values('key', 'name').annotate(
+                invoiced=Sum('total'), invoice_count=Count('id'),
+            ):
+                rows[row['key']].update(
+                    name=row['name'], invoiced=row['invoiced'], invoice_count=row['invoice_count'],
+                )
+        key, name = payment_group
+        for row in payments.order_by().annotate(key=key, name=name).values('key', 'name').annotate(
+            collected=Sum('amount'), discounts=Sum('discount_amount'), payment_count=Count('id'),
+        ):
+            rows[row['key']].update(
+                name=rows[row['key']]['name'] or row['name'],
+                collected=row['collected'], discounts=row['discounts'], payment_count=row['payment_count'],
+            )
+        sums[dimension] = dict(rows)
+    return sums
+
+
+def month_partitions(start, end):
+    """Split start..end at calendar month boundaries into (month, first day, last day, last day of the month)"""
+    month = start.replace(day=1)
+    while month <= end:
+        month_end = month + relativedelta(months=1, days=-1)
+        yield month, max(start, month), min(end, month_end), month_end
+        month += relativedelta(months=1)
+
+
+def revenue_sums(branch_id, start, end, today=None):
+    """
+    Revenue sums of start..end, partitioned by calendar month.
+
+    Whole months that have ended are closed: their sums are cached without a
+    timeout (until a receiver drops them for a late change). The open month
+    and partial months at the ends of the range are summed on every call.
+    """
+    today = today or timezone.now().date()
+    total = {dimension: defaultdict(_empty_row) for dimension in DIMENSIONS}
+
+    for month, first, last, month_end in month_partitions(start, end):
+        if first == month and last == month_end < today:
+            key = get_partition_cache_key(branch_id, month)
+            sums = cache.get(key)
+            if sums is None:
+                sums = compute_partition(branch_id, first, last)
+                cache.set(key, sums, None)
+        else:
+            sums = compute_partition(branch_id, first, last)
+
+        for dimension, rows in sums.items():
+            for group, row in rows.items():
+                merged = total[dimension][group]
+                merged['name'] = merged['name'] or row['name']
+                for measure in MEASURES:
+                    merged[measure] += row[measure]
+    return total
+
+
+def aging_buckets(branch_id, today=None):
+    """Outstanding balance of sent invoices by days past their due date, as of today. One query."""
+    today = today or timezone.now().date()
+    filters = {}
+    for label, first, last in AGING_BUCKETS:
+        overdue = Q()
+        if first is not None:
+            overdue &= Q(due_date__lte=today - datetime.timedelta(days=first))
+        if last is not None:
+            overdue &= Q(due_date__gte=today - datetime.timedelta(days=last))
+        filters[label] = overdue
+
+    aggregates = {}
+    for label, overdue in filters.items():
+        aggregates[f'{label}_balance'] = Coalesce(Sum('balance', filter=overdue), Decimal('0'))
+        aggregates[f'{label}_count'] = Count('id', filter=overdue)
+    sums = Invoice.objects.for_branch(branch_id).filter(balance__gt=0).exclude(status='draft').aggregate(
+        **aggregates
+    )
+    return [
+        {'bucket': label, 'balance': sums[f'{label}_balance'], 'count': sums[f'{label}_count']}
+        for label in filters
+    ]
+
+
+def revenue_report(branch_id, start, end, today=None):
+    """Revenue by branch, program, doctor and payment method, discount totals and receivables aging"""
+    today = today or timezone.now().date()
+    sums = revenue_sums(branch_id, start, end, today)
+
+    revenue = {}
+    for dimension, rows in sums.items():
+        revenue[dimension] = sorted(
+            (
+                {
+                    'key': group,
+                    **row,
+                    'name': METHOD_NAMES.get(group, group) if dimension == 'method'
+                    else row['name'] or UNGROUPED_NAMES[dimension],
+                }
+                for group, row in rows.items()
+            ),
+            key=lambda row: (-row['invoiced'], -row['collected'], str(row['name'])),
+        )
+
+    totals = _empty_measures()
+    for row in revenue['branch']:
+        for measure in totals:
+            totals[measure] += row[measure]
+
+    aging = aging_buckets(branch_id, today)
+    return {
+        'start': start,
+        'end': end,
+        'revenue': revenue,
+        'totals': totals,
+        'aging': {
+            'as_of': today,
+            'outstanding': sum((bucket['balance'] for bucket in aging), Decimal('0')),
+            'buckets': aging,
+        },
+    }
+
+
+def invalidate_revenue_report(branch_id, day):
+    """Drop the cached closed month holding `day`, for the branch and for all branches"""
+    if day:
+        month = day.replace(day=1)
+        cache.delete_many([get_partition_cache_key(branch_id, month), get_partition_cache_key(None, month)])
+
+
+def invalidate_revenue_reports():
+    """Drop every cached month, e.g. after invoices moved between branches"""
+    cache.set(f'{CACHE_KEY_PREFIX}:version', time.time_ns(), None)
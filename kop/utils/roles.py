@@ -0,0 +1,133 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from smart_physio.users.models import User
+
+CACHE_KEY_PREFIX = 'kop:user-role'
+
+# Profile relations in the order they decide a user's role: a doctor who is
+# also a branch admin is treated as a doctor, as get_user_branch always has
+PROFILE_RELATIONS = (
+    ('doctor', 'doctor_profile'),
+    ('branch_admin', 'branch_admin'),
+    ('staff', 'staff_profile'),
+)
+
+
+class UserRole:
+    """
+    The kop profiles a user holds, as {role: (profile id, branch)}.
+
+    `role` is the one that decides what they see ('doctor', 'branch_admin',
+    'staff' or None) and `branch` is its branch; the is_* checks ask whether
+    the user holds a profile at all, as hasattr() on the relation did.
+    """
+
+    def __init__(self, profiles=None):
+        self.profiles = profiles or {}
+        self.role = next((role for role, _ in PROFILE_RELATIONS if role in self.profiles), None)
+
+    @property
+    def profile_id(self):
+        return self.profiles[self.role][0] if self.role else None
+
+    @property
+    def branch(self):
+        return self.branch_for(self.role)
+
+    @property
+    def branch_id(self):
+        return self.branch.pk if self.branch else None
+
+    def branch_for(self, role):
+        """Branch of the user's `role` profile, None when they don't hold one"""
+        return self.profiles[role][1] if role in self.profiles else None
+
+    @property
+    def is_doctor(self):
+        return 'doctor' in self.profiles
+
+    @property
+    def is_branch_admin(self):
+        return 'branch_admin' in self.profiles
+
+    @property
+    def is_staff_member(self):
+        return 'staff' in self.profiles
+
+    def __repr__(self):
+        return f'<UserRole {self.role} profile={self.profile_id} branch={self.branch_id}>'
+
+
+def get_role_cache_key(user_id):
+    return f'{CACHE_KEY_PREFIX}:{user_id}'
+
+
+def _load_role(user):
+    """Read the role from the database in one query and prime `user`'s profile relations with it"""
+    loaded = User.objects.select_related(
+        *(f'{relation}__branch' for _, relation in PROFILE_RELATIONS)
+    ).get(pk=user.pk)
+
+    profiles = {}
+    for role, relation in PROFILE_RELATIONS:
+        profile = getattr(loaded, relation, None)
+        # A miss is cached too, so a later hasattr() on the same user doesn't query again
+        getattr(User, relation).related.set_cached_value(user, profile)
+        if profile is not None:
+            profiles[role] = (profile.pk, profile.branch)
+    return profiles
+
+
+def get_user_role(user):
+    """
+    The UserRole of `user`, read from the database at most once per request.
+
+    The result is memoized on the user object (request.user lives as long as the
+    request) and cached under the user's id for USER_ROLE_CACHE_TIMEOUT seconds;
+    receivers drop the cached entry whenever a profile or branch changes.
+    """
+    if not user.is_authenticated:
+        return UserRole()
+
+    role = user.__dict__.get('_kop_role')
+    if role is None:
+        key = get_role_cache_key(user.pk)
+        profiles = cache.get(key)
+        if profiles is None:
+            profiles = _load_role(user)
+            cache.set(key, profiles, settings.USER_ROLE_CACHE_TIMEOUT)
+        role = user._kop_role = UserRole(profiles)
+    return role
+
+
+def invalidate_user_role(user_id):
+    """Drop the cached role of a user so the next request reads it again"""
+    if user_id:
+        cache.delete(get_role_cache_key(user_id))
+
+
+def invalidate_branch_roles(branch):
+    """Drop the cached roles of everyone with a profile in `branch`, which carry the branch with them"""
+    user_ids = [
+        *branch.doctorprofile_set.values_list('user_id', flat=True),
+        *branch.admins.values_list('user_id', flat=True),
+        *branch.staffprofile_set.values_list('user_id', flat=True),
+    ]
+    cache.delete_many([get_role_cache_key(user_id) for user_id in user_ids])
+
+
+def branch_members(branch_id):
+    """Users holding a doctor, branch admin or staff profile in the branch"""
+    members = Q()
+    for _, relation in PROFILE_RELATIONS:
+        members |= Q(**{f'{relation}__branch_id': branch_id})
+    return User.objects.filter(members)
+
+
+def get_branch_id(obj):
+    """Branch of a doctor, patient or other branch-bound object; for a user, the branch of their role"""
+    if isinstance(obj, User):
+        return get_user_role(obj).branch_id
+    return obj.branch_id
@@ -0,0 +1,359 @@
+import datetime
+import math
+import random
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.db import connection, connections, transaction
+from django.utils import timezone
+from faker import Faker
+
+from kop.models import Branch, BranchAdmin, DoctorProfile, DoctorSpecialization, Invoice, LeadSource, Patient, \
+    PatientConsultation, PatientTreatment, PatientWeeklySchedule, Payment, TreatmentProgram, TreatmentSession, \
+    WeeklyAvailability
+from kop.utils.activity_rollup import refresh_rollups
+from kop.utils.common import phone_digits
+from kop.utils.invoice_numbers import bulk_create_invoices
+from kop.utils.payment_references import format_payment_reference
+from smart_physio.users.models import User
+
+# Per branch at scale=1: thousands of patients, tens of thousands of sessions
+PATIENTS_PER_BRANCH = 2000
+DOCTORS_PER_BRANCH = 10
+SESSIONS_PER_TREATMENT = 12
+
+# Hourly slots a doctor works per day (09:00 - 17:00)
+FIRST_SLOT_HOUR = 9
+SLOTS_PER_DAY = 8
+
+LEAD_SOURCES = ['Website', 'Referral', 'Social Media', 'Walk-in']
+SPECIALIZATIONS = ['Orthopaedic', 'Neurological', 'Sports', 'Paediatric']
+PROGRAMS = [('Back Pain', Decimal('600.00')), ('Knee Rehab', Decimal('750.00')), ('Post-Surgery', Decimal('900.00'))]
+WORKING_DAYS = ['mon', 'tue', 'wed', 'thu', 'fri']
+
+SUMMARY_KEYS = ['branches', 'doctors', 'patients', 'treatments', 'sessions', 'consultations', 'invoices', 'payments']
+
+
+def _scaled(value, scale, minimum=1):
+    return max(minimum, int(round(value * scale)))
+
+
+class _DoctorSlots:
+    """Hands out a doctor's hourly slots in random order so bookings never overlap"""
+
+    def __init__(self, rng, start_date, slots):
+        self.start_date = start_date
+        self.slots = list(range(slots))
+        rng.shuffle(self.slots)
+        self.next = 0
+
+    def take(self, count):
+        taken = self.slots[self.next:self.next + count]
+        self.next += count
+        return sorted(
+            (
+                self.start_date + datetime.timedelta(days=slot // SLOTS_PER_DAY),
+                datetime.time(FIRST_SLOT_HOUR + slot % SLOTS_PER_DAY),
+            )
+            for slot in taken
+        )
+
+
+def build_scenario(branches=1, scale=1.0, seed=0, label='Scenario', patients=PATIENTS_PER_BRANCH,
+                   doctors=DOCTORS_PER_BRANCH, sessions=SESSIONS_PER_TREATMENT, batch_size=1000, workers=1,
+                   progress=None):
+    """
+    Insert a realistic clinic data set with bulk_create, `batch_size` rows per INSERT.
+
+    Every branch gets `doctors` * scale doctors with weekly availability,
+    treatment programs, a branch admin and `patients` * scale patients, each
+    with a treatment, its weekly schedule, `sessions` sessions (past ones
+    completed), a consultation, invoices and part payments. Patients are shared
+    out between the doctors in turn and doctors are never double booked.
+
+    Branches are built one transaction each, by `workers` processes when more
+    than one and not called inside a transaction (PostgreSQL only: SQLite
+    allows a single writer). Each branch has its own random stream derived
+    from `seed`, so the same seed gives the same data however the work is
+    split. Branch names and emails carry `label` and a running number so
+    repeated runs don't collide. `progress` is called with each branch's
+    summary as it finishes.
+
+    bulk_create skips Model.save(), so values save() would derive (Patient.phone_digits,
+    the copied branches, invoice numbers, payment references, totals and the activity rollup)
+    are filled in here.
+    Returns a summary dict of row counts.
+    """
+    patients = _scaled(patients, scale)
+    doctors = min(_scaled(doctors, scale, minimum=2), patients)
+
+    with transaction.atomic():
+        lead_source_ids = [LeadSource.objects.get_or_create(name=name)[0].pk for name in LEAD_SOURCES]
+        specialization_ids = [
+            DoctorSpecialization.objects.get_or_create(name=name)[0].pk for name in SPECIALIZATIONS
+        ]
+        offset = Branch.objects.filter(name__startswith=f'{label} Branch ').count()
+
+    jobs = [
+        {
+            'number': offset + index + 1,
+            'seed': f'{seed}:{index}',
+            'label': label,
+            'patients': patients,
+            'doctors': doctors,
+            'sessions': sessions,
+            'lead_source_ids': lead_source_ids,
+            'specialization_ids': specialization_ids,
+            'batch_size': batch_size,
+        }
+        for index in range(branches)
+    ]
+
+    summary = dict.fromkeys(SUMMARY_KEYS, 0)
+    if workers > 1 and not connection.in_atomic_block:
+        # Children must open their own connections rather than share the parent's socket
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as pool:
+            results = list(_report(pool.map(_build_branch, jobs), progress))
+    else:
+        results = list(_report(map(_build_branch, jobs), progress))
+
+    for result in results:
+        for key in SUMMARY_KEYS:
+            summary[key] += result[key]
+    return summary
+
+
+def _report(results, progress):
+    for result in results:
+        if progress:
+            progress(result)
+        yield result
+
+
+def _build_branch(job):
+    """One branch of build_scenario() and everything in it, in one transaction"""
+    rng = random.Random(job['seed'])
+    fake = Faker()
+    fake.seed_instance(job['seed'])
+    today = timezone.now().date()
+    password = make_password(None)
+    number, label, batch_size = job['number'], job['label'], job['batch_size']
+    sessions_per_treatment = job['sessions']
+
+    # Enough slots for every doctor's share of sessions and consultations, half of them in the past
+    slots_per_doctor = math.ceil(job['patients'] / job['doctors']) * (sessions_per_treatment + 1)
+    start_date = today - datetime.timedelta(days=slots_per_doctor // SLOTS_PER_DAY // 2)
+
+    with transaction.atomic():
+        branch = Branch.objects.create(
+            name=f'{label} Branch {number}',
+            address=fake.address(),
+            phone_number=fake.msisdn()[:10],
+            email=f'branch-{number}@{label.lower()}.example.com',
+        )
+
+        def user(role, index):
+            return User(
+                email=f'{role}-{number}-{index}@{label.lower()}.example.com',
+                name=fake.name(),
+                password=password,
+            )
+
+        admin_user = User.objects.bulk_create([user('admin', 1)])[0]
+        BranchAdmin.objects.create(user=admin_user, branch=branch, phone_number=fake.msisdn()[:10])
+
+        doctor_users = User.objects.bulk_create(
+            [user('doctor', index) for index in range(job['doctors'])], batch_size=batch_size
+        )
+        doctors = DoctorProfile.objects.bulk_create(
+            [
+                DoctorProfile(
+                    user=doctor_user,
+                    branch=branch,
+                    license_number=f'LIC-{number}-{index}',
+                    years_of_experience=rng.randint(1, 30),
+                )
+                for index, doctor_user in enumerate(doctor_users)
+            ],
+            batch_size=batch_size,
+        )
+        DoctorProfile.specialization.through.objects.bulk_create(
+            [
+                DoctorProfile.specialization.through(
+                    doctorprofile=doctor, doctorspecialization_id=rng.choice(job['specialization_ids'])
+                )
+                for doctor in doctors
+            ],
+            batch_size=batch_size,
+        )
+        WeeklyAvailability.objects.bulk_create(
+            [
+                WeeklyAvailability(
+                    doctor=doctor,
+                    day=day,
+                    is_available=day in WORKING_DAYS,
+                    login_time=datetime.time(FIRST_SLOT_HOUR) if day in WORKING_DAYS else None,
+                    logout_time=datetime.time(FIRST_SLOT_HOUR + SLOTS_PER_DAY) if day in WORKING_DAYS else None,
+                )
+                for doctor in doctors
+                for day, _ in WeeklyAvailability.DAY_CHOICES
+            ],
+            batch_size=batch_size,
+        )
+
+        programs = TreatmentProgram.objects.bulk_create(
+            [
+                TreatmentProgram(name=name, rate_per_session=rate, default_duration=30, branch=branch)
+                for name, rate in PROGRAMS
+            ]
+        )
+        TreatmentProgram.doctors.through.objects.bulk_create(
+            [
+                TreatmentProgram.doctors.through(treatmentprogram=program, doctorprofile=doctor)
+                for program in programs
+                for doctor in doctors
+            ],
+            batch_size=batch_size,
+        )
+
+        patients = []
+        for _ in range(job['patients']):
+            phone = fake.msisdn()[:10]
+            patients.append(Patient(
+                first_name=fake.first_name(),
+                last_name=fake.last_name(),
+                date_of_birth=fake.date_of_birth(minimum_age=18, maximum_age=80),
+                gender=rng.choice(['M', 'F', 'O']),
+                address=fake.address(),
+                phone=phone,
+                phone_digits=phone_digits(phone),
+                medical_history=fake.sentence() if rng.random() < 0.5 else None,
+                branch=branch,
+                source_of_lead_id=rng.choice(job['lead_source_ids']),
+            ))
+        patients = Patient.objects.bulk_create(patients, batch_size=batch_size)
+
+        slots = {doctor.pk: _DoctorSlots(rng, start_date, slots_per_doctor) for doctor in doctors}
+        treatments, schedules, consultations, treatment_bookings = [], [], [], []
+        for index, patient in enumerate(patients):
+            doctor = doctors[index % len(doctors)]
+            program = rng.choice(programs)
+            bookings = slots[doctor.pk].take(sessions_per_treatment + 1)
+            (consultation_date, consultation_time), bookings = bookings[0], bookings[1:]
+            consultations.append(PatientConsultation(
+                patient=patient,
+                branch_id=patient.branch_id,
+                doctor=doctor,
+                consultation_type='initial',
+                status='completed' if consultation_date < today else 'scheduled',
+                date=consultation_date,
+                start_time=consultation_time,
+                end_time=datetime.time(consultation_time.hour, 30),
+            ))
+            if not bookings:
+                continue
+
+            completed = sum(1 for day, _ in bookings if day < today)
+            treatment = PatientTreatment(
+                patient=patient,
+                treatment_program=program,
+                doctor=doctor,
+                total_sessions=sessions_per_treatment,
+                session_rate=program.rate_per_session,
+                sessions_completed=completed,
+                status='completed' if completed == sessions_per_treatment else 'ongoing',
+            )
+            treatments.append(treatment)
+            treatment_bookings.append((treatment, doctor, bookings))
+
+        treatments = PatientTreatment.objects.bulk_create(treatments, batch_size=batch_size)
+        consultations = PatientConsultation.objects.bulk_create(consultations, batch_size=batch_size)
+
+        session_rows = []
+        for treatment, doctor, bookings in treatment_bookings:
+            first_date, first_time = bookings[0]
+            schedules.append(PatientWeeklySchedule(
+                patient_treatment=treatment,
+                day_of_week=PatientWeeklySchedule.DAY_CHOICES[first_date.weekday()][0],
+                start_time=first_time,
+                end_time=datetime.time(first_time.hour + 1),
+            ))
+            session_rows.extend(
+                TreatmentSession(
+                    treatment=treatment,
+                    treatment_doctor=doctor,
+                    branch_id=doctor.branch_id,
+                    date=day,
+                    start_time=start_time,
+                    end_time=datetime.time(start_time.hour + 1),
+                    status='completed' if day < today else 'scheduled',
+                )
+                for day, start_time in bookings
+            )
+        PatientWeeklySchedule.objects.bulk_create(schedules, batch_size=batch_size)
+        TreatmentSession.objects.bulk_create(session_rows, batch_size=batch_size)
+
+        invoices = [
+            Invoice(
+                patient=treatment.patient,
+                treatment=treatment,
+                due_date=today + datetime.timedelta(days=14),
+                status='sent',
+                total=treatment.total_cost,
+                balance=treatment.total_cost,
+            )
+            for treatment in treatments
+        ] + [
+            Invoice(
+                patient=consultation.patient,
+                consultation=consultation,
+                due_date=today + datetime.timedelta(days=14),
+                status='sent',
+                total=Decimal('600.00'),
+                balance=Decimal('600.00'),
+            )
+            for consultation in consultations
+        ]
+        # Settle totals before the insert so the invoices don't need a second, bulk_update pass
+        paid = []
+        for invoice in invoices:
+            if rng.random() < 0.3:
+                continue
+            amount = (invoice.total * Decimal(rng.choice([25, 50, 100])) / 100).quantize(Decimal('0.01'))
+            paid.append((invoice, amount, rng.choice(['cash', 'card', 'insurance'])))
+            invoice.paid_total = amount
+            invoice.balance = invoice.total - amount
+            invoice.status = 'paid' if invoice.balance == 0 else 'partially_paid'
+            invoice.last_payment_number = 1
+        invoices = bulk_create_invoices(invoices, batch_size=batch_size)
+
+        payments = [
+            Payment(
+                invoice=invoice,
+                amount=amount,
+                method=method,
+                reference=format_payment_reference(invoice.pk, invoice.last_payment_number),
+            )
+            for invoice, amount, method in paid
+        ]
+        Payment.objects.bulk_create(payments, batch_size=batch_size)
+        refresh_rollups({
+            *((session.treatment_doctor_id, session.date) for session in session_rows),
+            *((consultation.doctor_id, consultation.date) for consultation in consultations),
+            *((doctor.pk, today) for doctor in doctors),
+        })
+
+    return {
+        'branch': branch.name,
+        'branches': 1,
+        'doctors': len(doctors),
+        'patients': len(patients),
+        'treatments': len(treatments),
+        'sessions': len(session_rows),
+        'consultations': len(consultations),
+        'invoices': len(invoices),
+        'payments': len(payments),
+    }
@@ -0,0 +1,114 @@
+import datetime
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F
+
+from kop.jobs import queue_rollup_refresh
+from kop.models import PatientWeeklySchedule, TreatmentSession
+from kop.utils.booking_conflicts import DoctorBookings
+
+# PatientWeeklySchedule.DAY_CHOICES is ordered like date.weekday()
+WEEKDAYS = [day for day, _ in PatientWeeklySchedule.DAY_CHOICES]
+
+
+def get_active_schedules(branch=None):
+    """Weekly schedules of ongoing, active treatments, optionally for one branch; older treatments first"""
+    schedules = PatientWeeklySchedule.objects.filter(
+        patient_treatment__status='ongoing',
+        patient_treatment__is_active=True,
+    ).select_related('patient_treatment').order_by('patient_treatment_id', 'pk')
+    if branch:
+        schedules = schedules.filter(patient_treatment__patient__branch=branch)
+    return schedules
+
+
+def generate_sessions(start_date, weeks=12, branch=None, batch_size=1000):
+    """
+    Expand active weekly schedules into scheduled TreatmentSession rows.
+
+    Covers `weeks` weeks from `start_date`. A treatment never gets more scheduled
+    sessions ahead than it has pending sessions, and sessions that already exist
+    for the same treatment, date and start time are skipped - first by a single
+    lookup, then by the unique constraint if another writer got there first.
+    Returns a summary dict.
+    """
+    end_date = start_date + datetime.timedelta(weeks=weeks, days=-1)
+    # bulk_create skips TreatmentSession.save, which copies the doctor's branch
+    schedules = list(get_active_schedules(branch).annotate(doctor_branch_id=F('patient_treatment__doctor__branch_id')))
+    treatment_ids = {schedule.patient_treatment_id for schedule in schedules}
+
+    existing = set(
+        TreatmentSession.objects.filter(
+            treatment_id__in=treatment_ids,
+            date__range=(start_date, end_date),
+        ).values_list('treatment_id', 'date', 'start_time')
+    )
+    scheduled_ahead = Counter(dict(
+        TreatmentSession.objects.filter(
+            treatment_id__in=treatment_ids,
+            date__gte=start_date,
+            status='scheduled',
+        ).order_by().values('treatment').annotate(count=Count('id')).values_list('treatment', 'count')
+    ))
+    bookings = DoctorBookings(
+        {schedule.patient_treatment.doctor_id for schedule in schedules}, start_date, end_date
+    )
+    budget = {
+        schedule.patient_treatment_id: schedule.patient_treatment.pending_sessions
+        - scheduled_ahead[schedule.patient_treatment_id]
+        for schedule in schedules
+    }
+
+    by_weekday = defaultdict(list)
+    for schedule in schedules:
+        by_weekday[WEEKDAYS.index(schedule.day_of_week)].append(schedule)
+
+    sessions = []
+    skipped = 0
+    conflicts = 0
+    day = start_date
+    while day <= end_date:
+        for schedule in by_weekday[day.weekday()]:
+            treatment = schedule.patient_treatment
+            if (treatment.pk, day, schedule.start_time) in existing:
+                skipped += 1
+                continue
+            if budget[treatment.pk] <= 0:
+                continue
+            if not bookings.add(treatment.doctor_id, day, schedule.start_time, schedule.end_time):
+                conflicts += 1
+                continue
+            budget[treatment.pk] -= 1
+            sessions.append(TreatmentSession(
+                treatment=treatment,
+                treatment_doctor_id=treatment.doctor_id,
+                branch_id=schedule.doctor_branch_id,
+                date=day,
+                start_time=schedule.start_time,
+                end_time=schedule.end_time,
+                status='scheduled',
+            ))
+        day += datetime.timedelta(days=1)
+
+    # ignore_conflicts leaves no trace of the rows it skipped, so count what actually landed (rows
+    # another writer commits in the moment between the two counts would still count as ours)
+    in_range = TreatmentSession.objects.filter(treatment_id__in=treatment_ids, date__range=(start_date, end_date))
+    with transaction.atomic():
+        before = in_range.count()
+        TreatmentSession.objects.bulk_create(sessions, batch_size=batch_size, ignore_conflicts=True)
+        created = in_range.count() - before
+    # Lost to the unique constraint: another writer got there first
+    skipped += len(sessions) - created
+
+    # bulk_create skips the post_save receivers
+    queue_rollup_refresh({(session.treatment_doctor_id, session.date) for session in sessions})
+
+    return {
+        'start_date': start_date,
+        'end_date': end_date,
+        'schedules': len(schedules),
+        'created': created,
+        'skipped': skipped,
+        'conflicts': conflicts,
+    }
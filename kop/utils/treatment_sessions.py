@@ -0,0 +1,131 @@
+from collections import Counter
+
+from django.db import models, transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from kop.jobs import queue_rollup_refresh
+from kop.models import PatientTreatment, TreatmentSession
+from kop.utils import metrics
+from kop.utils.booking_conflicts import INACTIVE_STATUSES, DoctorBookings
+
+
+def _per_treatment(counts, default, output_field):
+    """CASE expression picking a per-treatment value, for one grouped UPDATE"""
+    return Case(
+        *[When(pk=pk, then=Value(value)) for pk, value in counts.items()],
+        default=default,
+        output_field=output_field,
+    )
+
+
+def set_sessions_status(session_ids, status='completed', queryset=None):
+    """
+    Move many treatment sessions to `status` in one transaction.
+
+    Completing a session counts it against its treatment, and moving a completed
+    session to any other status gives the count back. The treatment counters and
+    statuses are changed with a single grouped UPDATE instead of one save per session.
+    A cancelled session only comes back if its doctor is still free at that time.
+
+    `queryset` limits which sessions may be touched (e.g. the caller's branch).
+    Returns one result dict per requested id, in request order.
+    """
+    completing = status == 'completed'
+    today = timezone.now().date()
+    queryset = TreatmentSession.objects.all() if queryset is None else queryset
+    results = {pk: {'id': pk, 'status': 'not_found'} for pk in session_ids}
+
+    with transaction.atomic():
+        sessions = list(
+            queryset.select_for_update(of=('self',)).filter(pk__in=results).values(
+                'pk', 'status', 'date', 'start_time', 'end_time', 'treatment_id', 'treatment_doctor_id'
+            ).order_by('pk')
+        )
+        # Earlier ids in the request win when a treatment runs out of sessions
+        position = {pk: index for index, pk in enumerate(results)}
+        sessions.sort(key=lambda session: position[session['pk']])
+        treatments = PatientTreatment.objects.select_for_update().in_bulk(
+            {session['treatment_id'] for session in sessions if session['treatment_id']}
+        )
+        # Cancelled sessions coming back take their doctor's time again; their doctors' bookings in one query
+        reviving = [
+            session for session in sessions
+            if session['status'] in INACTIVE_STATUSES and status not in INACTIVE_STATUSES
+        ]
+        bookings = DoctorBookings(
+            {session['treatment_doctor_id'] for session in reviving},
+            min(session['date'] for session in reviving),
+            max(session['date'] for session in reviving),
+        ) if reviving else None
+        reviving = {session['pk'] for session in reviving}
+
+        changed = []
+        delta = Counter()
+        for session in sessions:
+            result = results[session['pk']]
+            treatment = treatments.get(session['treatment_id'])
+
+            if session['status'] == status:
+                result['status'] = 'unchanged'
+                continue
+
+            slot = (session['treatment_doctor_id'], session['date'], session['start_time'], session['end_time'])
+            if session['pk'] in reviving and not bookings.is_free(*slot):
+                result.update(status='error', error="The doctor already has a booking at this time")
+                continue
+
+            if completing:
+                if session['date'] > today:
+                    result.update(status='error', error="Cannot complete a session with a future date")
+                    continue
+                if treatment and treatment.status != 'ongoing':
+                    result.update(status='error', error="Cannot add sessions to a non-ongoing treatment")
+                    continue
+                if treatment and treatment.sessions_completed + delta[treatment.pk] >= treatment.total_sessions:
+                    result.update(status='error', error="All treatment sessions are already completed")
+                    continue
+                if treatment:
+                    delta[treatment.pk] += 1
+            elif session['status'] == 'completed' and treatment:
+                # Ensure we don't go below 0
+                if treatment.sessions_completed + delta[treatment.pk] > 0:
+                    delta[treatment.pk] -= 1
+
+            if session['pk'] in reviving:
+                # Later sessions of the request can't take the same time
+                bookings.add(*slot)
+            result['status'] = 'updated'
+            changed.append(session)
+
+        TreatmentSession.objects.filter(pk__in=[session['pk'] for session in changed]).update(status=status)
+        queue_rollup_refresh({(session['treatment_doctor_id'], session['date']) for session in changed})
+        if completing:
+            metrics.count_sessions_completed(len(changed))
+
+        if delta:
+            if completing:
+                # If this was the last session, mark treatment as completed
+                finished = [
+                    pk for pk, count in delta.items()
+                    if treatments[pk].sessions_completed + count >= treatments[pk].total_sessions
+                ]
+                status_update = {
+                    'status': _per_treatment({pk: 'completed' for pk in finished}, F('status'), models.CharField()),
+                    'end_date': _per_treatment({pk: today for pk in finished}, F('end_date'), models.DateField()),
+                }
+            else:
+                # If treatment was completed, revert its status
+                status_update = {
+                    'status': Case(When(status='completed', then=Value('ongoing')), default=F('status')),
+                    'end_date': Case(When(status='completed', then=Value(None)), default=F('end_date')),
+                }
+
+            PatientTreatment.objects.filter(pk__in=delta).update(
+                sessions_completed=F('sessions_completed') + _per_treatment(
+                    delta, Value(0), models.IntegerField()
+                ),
+                **status_update,
+            )
+
+    return list(results.values())
@@ -0,0 +1,293 @@
+import json
+import math
+import re
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, reset_queries
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, get_resolver
+
+from kop.jobs import write_export
+from kop.models import BackgroundJob, Branch, BranchAdmin, DoctorProfile, DoctorSpecialization, Invoice, LeadSource, Patient, \
+    PatientAttachment, PatientConsultation, PatientTreatment, PatientWeeklySchedule, TreatmentProgram, \
+    TreatmentSession, WeeklyAvailability
+from kop.urls import router
+from kop.utils.scenario import build_scenario
+
+ROLES = ('superadmin', 'branch_admin', 'doctor')
+
+# Models behind URL kwargs other than `pk`
+KWARG_MODELS = {
+    'patient_id': Patient,
+    'doctor_id': DoctorProfile,
+    'invoice_id': Invoice,
+    'attachment_id': PatientAttachment,
+    'session_id': TreatmentSession,
+}
+
+# `pk` routes whose view has no `model`/`queryset` to read it from
+PK_MODELS = {
+    'patient-detail': Patient,
+    'patient-update': Patient,
+    'patient-delete': Patient,
+    'complete_consultation': PatientConsultation,
+    'availability-detail': WeeklyAvailability,
+    'treatment_sessions-detail': TreatmentSession,
+    'background-job': BackgroundJob,
+    'background-job-download': BackgroundJob,
+}
+
+# Routes that fail with a server error for a role today, with the reason. check_budgets lets these
+# 5xx through and flags an entry once the route works again; every other 5xx fails the check
+KNOWN_BROKEN = {
+    **{
+        ('consultations/<int:pk>/update/', role): "KeyError 'user': the view doesn't pass the user to its form"
+        for role in ROLES
+    },
+    **{
+        ('patients/<int:pk>/update/', role): "KeyError 'user': the view doesn't pass the user to its form"
+        for role in ('superadmin', 'branch_admin')
+    },
+    **{
+        ('schedules/<int:pk>/edit/', role): "KeyError 'patient': the view doesn't pass the patient to its form"
+        for role in ROLES
+    },
+    **{
+        ('schedules/<int:pk>/delete/', role): "NoReverseMatch: the template reverses 'patient-weekly-schedule-list' with no patient_id"
+        for role in ROLES
+    },
+    **{
+        ('treatment_sessions/<int:pk>/delete/', role): "NoReverseMatch: the template links to 'session-detail', which doesn't exist"
+        for role in ROLES
+    },
+    ('session/<int:session_id>/mark-attendance/', 'doctor'):
+        "NoReverseMatch: the template reverses 'mark_attendance' with no session id",
+}
+
+
+class ViewRoute:
+    """One URL pattern of kop.urls, keyed by its route with placeholders, e.g. 'patients/<int:pk>/'"""
+
+    def __init__(self, key, prefix, pattern):
+        self.key = key
+        self.prefix = prefix
+        self.pattern = pattern
+        self.name = pattern.name
+
+    def model_for(self, kwarg):
+        if kwarg != 'pk':
+            return KWARG_MODELS[kwarg]
+        if self.name in PK_MODELS:
+            return PK_MODELS[self.name]
+        callback = self.pattern.callback
+        view = getattr(callback, 'view_class', None) or getattr(callback, 'cls', None)
+        model = getattr(view, 'model', None)
+        if model is None and getattr(view, 'queryset', None) is not None:
+            model = view.queryset.model
+        if model is None:
+            raise ImproperlyConfigured(f"Add the model behind {self.key!r} to kop.utils.view_budgets.PK_MODELS")
+        return model
+
+    def url(self, objects):
+        """The route filled in with the pk of the matching object from `objects` (model -> instance)"""
+        path = re.sub(r'<(?:\w+:)?(\w+)>', lambda match: str(objects[self.model_for(match.group(1))].pk), self.key)
+        return self.prefix + path
+
+
+def _route_key(pattern):
+    # Router patterns are regexes: '^patients/(?P<pk>[^/.]+)/$' -> 'patients/<pk>/'
+    route = str(pattern.pattern)
+    route = re.sub(r'\(\?P<(\w+)>[^)]*\)', r'<\1>', route)
+    return route.lstrip('^').rstrip('$')
+
+
+def iter_view_routes():
+    """Every URL pattern in kop.urls, API router included; format-suffix variants are skipped"""
+    for resolver in get_resolver().url_patterns:
+        if isinstance(resolver, URLResolver) and getattr(resolver.urlconf_module, '__name__', None) == 'kop.urls':
+            yield from _walk(resolver.url_patterns, '/' + str(resolver.pattern), '')
+
+
+def _walk(patterns, prefix, route):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            # Only the API router; other apps' includes (allauth) aren't kop views
+            if pattern.url_patterns is router.urls:
+                yield from _walk(pattern.url_patterns, prefix, route + _route_key(pattern))
+        elif isinstance(pattern, URLPattern):
+            key = route + _route_key(pattern)
+            if 'format' not in re.findall(r'<(?:\w+:)?(\w+)>', key):
+                yield ViewRoute(key, prefix, pattern)
+
+
+def seed_budget_data(scale=0.02, seed=0):
+    """
+    Build a scenario (kop.utils.scenario) plus what it leaves out - a superadmin,
+    a patient attachment and a branch admin's finished export - and return
+    (objects, users) for ViewBudgetRun. The attachment's and the export's files
+    are written to default storage; delete them when done.
+    """
+    build_scenario(scale=scale, seed=seed, label='Budget')
+    User = get_user_model()
+    if not User.objects.filter(is_superuser=True).exists():
+        User.objects.create_superuser(email='superadmin@budget.example.com', password=None)
+    objects, users = budget_objects(Branch.objects.filter(name__startswith='Budget Branch ').latest('pk'))
+    attachment = PatientAttachment(patient=objects[Patient], title='Referral letter')
+    attachment.file.save('referral.pdf', ContentFile(b'%PDF-1.4\n%%EOF\n'))
+    objects[PatientAttachment] = attachment
+    objects[BackgroundJob] = BackgroundJob.objects.create(
+        name=write_export.job_name, user=users['branch_admin'], status='succeeded', attempts=1,
+        result=write_export(export='patients', user_id=users['branch_admin'].pk, params=''),
+    )
+    return objects, users
+
+
+def budget_objects(branch):
+    """
+    The instance each URL kwarg points at and the user for each role, taken from `branch`.
+
+    Detail pages get the patient with the longest history in the branch
+    (and its newest treatment, session, invoice...), so they are measured at
+    their worst rather than on an empty record.
+    """
+    User = get_user_model()
+    patient = (
+        Patient.objects.filter(branch=branch)
+        .annotate(history=Count('treatments__treatmentsession'))
+        .order_by('-history', 'pk')
+        .first()
+    )
+    treatment = patient.treatments.order_by('-pk').first()
+    doctor = treatment.doctor
+    branch_admin = branch.admins.order_by('pk').first()
+    objects = {
+        Branch: branch,
+        BranchAdmin: branch_admin,
+        DoctorProfile: doctor,
+        DoctorSpecialization: DoctorSpecialization.objects.order_by('pk').first(),
+        Invoice: Invoice.objects.filter(patient=patient).order_by('-pk').first(),
+        LeadSource: LeadSource.objects.order_by('pk').first(),
+        Patient: patient,
+        PatientAttachment: patient.attachments.order_by('-pk').first(),
+        PatientConsultation: patient.consultations.first(),
+        PatientTreatment: treatment,
+        PatientWeeklySchedule: PatientWeeklySchedule.objects.filter(patient_treatment=treatment).first(),
+        TreatmentProgram: treatment.treatment_program,
+        TreatmentSession: TreatmentSession.objects.filter(treatment=treatment).first(),
+        User: doctor.user,
+        WeeklyAvailability: doctor.weekly_availability.first(),
+    }
+    users = {
+        'superadmin': User.objects.filter(is_superuser=True).order_by('pk').first(),
+        'branch_admin': branch_admin.user,
+        'doctor': doctor.user,
+    }
+    return objects, users
+
+
+class ViewBudgetRun:
+    """
+    GET every kop URL as every role and record status, query count and wall time.
+
+    `objects` maps models to the instance their URL kwargs should point at;
+    `users` maps each role in ROLES to a user. The cache is cleared before every
+    request so each one is measured cold.
+    """
+
+    def __init__(self, objects, users, repeat=1):
+        self.objects = objects
+        self.users = users
+        self.repeat = repeat
+
+    def measure(self, route, role):
+        client = Client(raise_request_exception=False)
+        client.force_login(self.users[role])
+        url = route.url(self.objects)
+        timings, queries = [], 0
+        for _ in range(self.repeat):
+            cache.clear()
+            # The query log is capped; start each request from an empty one so it is counted in full
+            reset_queries()
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = client.get(url)
+                if response.streaming:
+                    # Downloads and exports do their work while streaming
+                    b''.join(response.streaming_content)
+                timings.append((time.perf_counter() - started) * 1000)
+            queries = max(queries, len(captured))
+        return {
+            'route': route.key,
+            'name': route.name,
+            'role': role,
+            'url': url,
+            'status': response.status_code,
+            'queries': queries,
+            'ms': round(statistics.median(timings), 1),
+        }
+
+    def run(self, routes=None):
+        routes = list(iter_view_routes()) if routes is None else routes
+        return [self.measure(route, role) for route in routes for role in ROLES]
+
+
+def load_budgets(path):
+    """Stored budgets as {route: {role: {'status', 'queries', 'ms'}}}; empty when there is no file yet"""
+    try:
+        with open(path) as budgets_file:
+            return json.load(budgets_file)
+    except FileNotFoundError:
+        return {}
+
+
+def make_budgets(results, latency_headroom=3.0):
+    """
+    Budgets from a run: the measured status and query count, and `latency_headroom`
+    times the measured wall time (at least 100 ms) so timing noise doesn't fail runs.
+    """
+    budgets = {}
+    for result in results:
+        budgets.setdefault(result['route'], {})[result['role']] = {
+            'status': result['status'],
+            'queries': result['queries'],
+            'ms': max(100, math.ceil(result['ms'] * latency_headroom)),
+        }
+    return budgets
+
+
+def check_budgets(results, budgets, latency=True, known_broken=KNOWN_BROKEN):
+    """
+    Messages for every result without a budget, failing with a server error or
+    over its budget. Server errors in `known_broken` pass, but an entry there
+    whose route has stopped failing is reported so it gets removed.
+    """
+    failures = []
+    for result in results:
+        label = f"{result['role']} GET {result['url']} ({result['route']})"
+        budget = budgets.get(result['route'], {}).get(result['role'])
+        if budget is None:
+            failures.append(f"{label}: no budget")
+            continue
+        broken = (result['route'], result['role']) in known_broken
+        if result['status'] >= 500 and not broken:
+            failures.append(f"{label}: status {result['status']}")
+        elif result['status'] < 500 and broken:
+            failures.append(f"{label}: status {result['status']}, remove it from KNOWN_BROKEN")
+        if result['queries'] > budget['queries']:
+            failures.append(f"{label}: {result['queries']} queries, budget {budget['queries']}")
+        if latency and 'ms' in budget and result['ms'] > budget['ms']:
+            failures.append(f"{label}: {result['ms']} ms, budget {budget['ms']} ms")
+    return failures
+
+
+def write_json(path, data):
+    with open(path, 'w') as output:
+        json.dump(data, output, indent=2, sort_keys=True)
+        output.write('\n')
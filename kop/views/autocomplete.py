@@ -0,0 +1,58 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.db import transaction
+from django.http import JsonResponse
+
+from kop.utils.autocomplete import autocomplete_candidates, normalize_term, select2_page
+from kop.utils.roles import get_user_role
+
+
+def _page(request):
+    try:
+        return max(int(request.GET.get('page') or 1), 1)
+    except ValueError:
+        return 1
+
+
+@sync_to_async
+def _user_role(request):
+    """
+    The request's user and role. ThreadLocalUserMiddleware (sync) has already
+    loaded request.user, which request.auser() would read from the database again.
+    """
+    user = request.user
+    return user, get_user_role(user) if user.is_authenticated else None
+
+
+async def _respond(request, source, branch_id):
+    rows = await autocomplete_candidates(source, branch_id, normalize_term(request.GET.get('q')))
+    return JsonResponse(select2_page(rows, _page(request)))
+
+
+# Async views can't run in a request transaction (ATOMIC_REQUESTS in local settings); they only read anyway
+@transaction.non_atomic_requests
+async def patient_autocomplete(request):
+    """Patients of the user's branch (every patient for other users) matching ?q="""
+    user, role = await _user_role(request)
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+
+    branch_id = role.branch_id if role.is_doctor or role.is_branch_admin else None
+    return await _respond(request, 'patients', branch_id)
+
+
+@transaction.non_atomic_requests
+async def treatment_autocomplete(request):
+    """Treatments of a doctor's branch, or of every branch for staff and superadmins, by patient ?q="""
+    user, role = await _user_role(request)
+    if not user.is_authenticated:
+        return JsonResponse(select2_page([], 1))
+
+    if role.is_doctor:
+        branch = role.branch_for('doctor')
+        branch_id = branch.pk if branch else None
+    elif user.is_staff or user.is_superuser:
+        branch_id = None
+    else:
+        return JsonResponse(select2_page([], 1))
+    return await _respond(request, 'treatments', branch_id)
@@ -14,6 +14,7 @@ from kop.decorators import branch_admin_required
 from kop.utils.branch_admin import get_dashboard_stats
 from kop.models import Branch
 from kop.utils.common import get_user_branch
+from kop.utils.roles import get_user_role
 
 
 @method_decorator(login_required, name='dispatch')
@@ -25,12 +26,10 @@ class BranchAdminListView(ListView):
     paginate_by = 10
 
     def get_queryset(self):
-        qs = super().get_queryset().select_related("branch", "user")
         branch = self.request.GET.get("branch")
         search = self.request.GET.get("search")
 
-        if branch:
-            qs = qs.filter(branch__id=branch)
+        qs = super().get_queryset().for_user(self.request.user).for_branch(branch).select_related("branch", "user")
         if search:
             qs = qs.filter(
                 models.Q(user__first_name__icontains=search)
@@ -40,8 +39,8 @@ class BranchAdminListView(ListView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        if hasattr(self.request.user, 'branch_admin') or hasattr(self.request.user, 'doctor_profile'):
-            branch = get_user_branch(self.request.user)
+        branch = get_user_branch(self.request.user)
+        if branch:
             context['branches'] = Branch.objects.filter(id=branch.id)
         else:
             # For superusers/staff, show all branches
@@ -99,11 +98,11 @@ def branch_admin_dashboard(request):
 
     """Dashboard view for branch administrators"""
     # Get the branch associated with the admin
-    branch = request.user.branch_admin.branch
+    branch = get_user_role(request.user).branch_for('branch_admin')
     today = timezone.now().date()
 
     # Get dashboard statistics
-    stats = get_dashboard_stats(branch)
+    stats = get_dashboard_stats(branch, request)
 
     context = {
         'branch': branch,
@@ -112,9 +111,11 @@ def branch_admin_dashboard(request):
         'active_patients_count': stats['active_patients_count'],
         'today_appointments_count': stats['today_appointments_count'],
         'today_treatments_count': stats['today_treatments_count'],
-        'todays_appointments': PatientConsultation.objects.filter(date=today, patient__branch=branch),
-        'recent_treatments': TreatmentSession.objects.filter(
-            treatment_doctor__branch=branch
+        'todays_appointments': PatientConsultation.objects.for_branch(branch).filter(
+            date=today
+        ).select_related('patient', 'doctor__user'),
+        'recent_treatments': TreatmentSession.objects.for_branch(branch).select_related(
+            'treatment_doctor__user', 'treatment__patient', 'treatment__treatment_program__branch'
         ).order_by('-date', '-start_time')[:5],
         'converted_leads_today': stats['converted_leads_today'],
         'today': today
@@ -4,6 +4,7 @@ from django.urls import reverse_lazy
 from kop.decorators import branch_admin_or_superadmin_required
 from kop.models import PatientConsultation, Branch, Invoice
 from kop.forms.consultation import PatientConsultationForm, PatientConsultationUpdateForm
+from kop.widgets.pagination import KeysetPaginationMixIn
 from django.db.models import Q
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
@@ -74,11 +75,12 @@ class PatientConsultationDeleteView(DeleteView):
         return reverse_lazy('patient-detail', kwargs={'pk': self.object.patient.id})
 
 @method_decorator(login_required, name='dispatch')
-class PatientConsultationListView(ListView):
+class PatientConsultationListView(KeysetPaginationMixIn, ListView):
     model = PatientConsultation
     template_name = 'consultations/list.html'
     paginate_by = 10
     ordering = ['-date', '-start_time']
+    keyset_ordering = ('-date', '-start_time', '-id')
     context_object_name = 'consultations'
 
     def get_context_data(self, **kwargs):
@@ -89,11 +91,9 @@ class PatientConsultationListView(ListView):
 
     def get_queryset(self):
         queryset = super().get_queryset()
-        # Debug print
         queryset = queryset.select_related(
             'patient',
             'doctor__user',
-            'patient__branch'
         ).order_by('-date', '-start_time')
 
         branch = self.request.GET.get('branch')
@@ -101,14 +101,8 @@ class PatientConsultationListView(ListView):
         date = self.request.GET.get('date')
         status = self.request.GET.get('status')
 
-        print(branch, patient, date)
-
         # Apply filters
-        if branch:
-            queryset = queryset.filter(
-                Q(patient__branch_id=branch) |
-                Q(doctor__branch_id=branch)
-            )
+        queryset = queryset.for_user(self.request.user).for_branch(branch)
 
         # Then filter by patient (if provided)
         if patient:
@@ -129,3 +123,6 @@ class PatientConsultationListView(ListView):
 class PatientConsultationDetailView(DetailView):
     model = PatientConsultation
     template_name = 'consultations/detail.html'
+
+    def get_queryset(self):
+        return super().get_queryset().select_related('patient', 'doctor__user', 'branch')
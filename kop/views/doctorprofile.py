@@ -4,11 +4,15 @@ from rest_framework.permissions import IsAuthenticated
 from kop.decorators import doctor_required, superadmin_required
 from kop.forms.doctor_profile import DoctorForm
 from kop.permissions.doctorprofile import DoctorViewPermission, DoctorModifyPermission
-from kop.serializers.doctorprofile import WeeklyAvailabilitySerializer
+from kop.serializers.doctorprofile import WeeklyAvailabilitySerializer, FreeSlotQuerySerializer, FreeSlotSerializer
+from kop.utils.availability import find_free_slots_for_program
+from kop.utils.common import get_user_branch
+from kop.utils.roles import get_branch_id, get_user_role
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters
 
 from django.utils.decorators import method_decorator
+from django.utils import timezone
 
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required
@@ -44,13 +48,14 @@ class SerializerBase(viewsets.ModelViewSet):
         """Helper method to check if user can modify a doctor"""
         if user.is_superuser:
             return True
-        if hasattr(user, 'branch_admin_profile'):
-            return doctor.branch == user.branch_admin_profile.branch
+        role = get_user_role(user)
+        if role.is_branch_admin:
+            return get_branch_id(doctor) == role.branch_for('branch_admin').pk
         return False
 
     def update(self, request, *args, **kwargs):
         instance = self.get_object()
-        serializer = self.get_serializer(data=request.data)
+        serializer = self.get_serializer(instance, data=request.data, partial=kwargs.get('partial', False))
         serializer.is_valid(raise_exception=True)
         serializer.validated_data['updated_by'] = request.user
 
@@ -75,11 +80,12 @@ class SerializerBase(viewsets.ModelViewSet):
         return super().destroy(request, *args, **kwargs)
 
     def get_create_permissions(self, request):
-        return request.user.is_superuser or hasattr(request.user, 'branch_admin_profile')
+        return request.user.is_superuser or get_user_role(request.user).is_branch_admin
 
     def create(self, request, *args, **kwargs):
         # Only allow creation if user is superadmin or branch admin
-        if not (request.user.is_superuser or hasattr(request.user, 'branch_admin_profile')):
+        role = get_user_role(request.user)
+        if not (request.user.is_superuser or role.is_branch_admin):
             return Response(
                 {"detail": "You do not have permission to perform this action."},
                 status=status.HTTP_403_FORBIDDEN
@@ -89,8 +95,8 @@ class SerializerBase(viewsets.ModelViewSet):
         serializer.is_valid(raise_exception=True)
 
         # For branch admins, automatically assign their branch
-        if hasattr(request.user, 'branch_admin_profile'):
-            serializer.validated_data['branch'] = request.user.branch_admin_profile.branch
+        if role.is_branch_admin:
+            serializer.validated_data['branch'] = role.branch_for('branch_admin')
 
         serializer.validated_data['created_by'] = request.user
 
@@ -108,12 +114,6 @@ class DoctorDetailView(LoginRequiredMixIn, DetailView):
 
     # context_object_name = 'doctor'
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        # Add any additional context you need
-        print(context['object'].specialization)
-        return context
-
 
 @method_decorator(login_required, name='dispatch')
 @method_decorator(superadmin_required, name='dispatch')
@@ -212,6 +212,32 @@ class WeeklyAvailabilityViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(availabilities, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'], url_path='free-slots')
+    def free_slots(self, request):
+        """Next free slots with any doctor of a treatment program"""
+        query = FreeSlotQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        program = query.validated_data['program']
+
+        if not request.user.is_superuser and get_user_branch(request.user) != program.branch:
+            return Response(
+                {"detail": "You do not have permission to perform this action."},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        # Never offer slots that have already started
+        now = timezone.localtime().replace(tzinfo=None, second=0, microsecond=0)
+        start_date = query.validated_data.get('start_date') or now.date()
+        slots = find_free_slots_for_program(
+            program,
+            count=query.validated_data['count'],
+            duration=query.validated_data['duration'],
+            start_date=start_date,
+            days=query.validated_data['days'],
+            after=now,
+        )
+        return Response(FreeSlotSerializer(slots, many=True).data)
+
 
 @login_required
 def doctor_schedule(request, doctor_id):
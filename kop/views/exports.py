@@ -0,0 +1,160 @@
+from django.contrib.auth.decorators import login_required
+from django.http import HttpResponseBadRequest
+from django.shortcuts import redirect
+from django.utils import timezone
+
+from kop.decorators import branch_admin_or_superadmin_required
+from kop.jobs import write_export
+from kop.models import Invoice, Payment, TreatmentSession
+from kop.utils.background_jobs import enqueue
+from kop.utils.exports import CONTENT_TYPES, export_response, iterate_rows
+from kop.views.invoice import InvoiceFilter
+from kop.views.jobs import result_file_response
+from kop.views.patients import filter_patient_list
+from kop.views.treatment_session import filter_session_list
+
+# (column header, values_list lookup) of every export
+INVOICE_COLUMNS = [
+    ('Invoice number', 'invoice_number'),
+    ('Invoice date', 'invoice_date'),
+    ('Due date', 'due_date'),
+    ('Patient first name', 'patient__first_name'),
+    ('Patient last name', 'patient__last_name'),
+    ('Branch', 'branch__name'),
+    ('Consultation', 'consultation_id'),
+    ('Treatment', 'treatment_id'),
+    ('Status', 'status'),
+    ('Total', 'total'),
+    ('Paid', 'paid_total'),
+    ('Balance', 'balance'),
+]
+PAYMENT_COLUMNS = [
+    ('Reference', 'reference'),
+    ('Payment date', 'payment_date'),
+    ('Invoice number', 'invoice__invoice_number'),
+    ('Patient first name', 'invoice__patient__first_name'),
+    ('Patient last name', 'invoice__patient__last_name'),
+    ('Branch', 'invoice__branch__name'),
+    ('Method', 'method'),
+    ('Amount', 'amount'),
+    ('Discount', 'discount_amount'),
+]
+SESSION_COLUMNS = [
+    ('Date', 'date'),
+    ('Start time', 'start_time'),
+    ('End time', 'end_time'),
+    ('Patient first name', 'treatment__patient__first_name'),
+    ('Patient last name', 'treatment__patient__last_name'),
+    ('Program', 'treatment__treatment_program__name'),
+    ('Doctor', 'treatment_doctor__user__name'),
+    ('Branch', 'branch__name'),
+    ('Status', 'status'),
+]
+PATIENT_COLUMNS = [
+    ('First name', 'first_name'),
+    ('Last name', 'last_name'),
+    ('Date of birth', 'date_of_birth'),
+    ('Gender', 'gender'),
+    ('Phone', 'phone'),
+    ('Email', 'email'),
+    ('Branch', 'branch__name'),
+    ('Source of lead', 'source_of_lead__name'),
+    ('Active', 'is_active'),
+    ('Registered', 'created_at'),
+]
+
+
+def _invoices(user, params):
+    """The invoice list's rows under its filters, None when the filters don't validate"""
+    invoices = InvoiceFilter(params, queryset=Invoice.objects.for_user(user))
+    return invoices.qs.order_by('-invoice_date', '-id') if invoices.is_valid() else None
+
+
+def _payments(user, params):
+    """Payments of the invoices the invoice list filters select"""
+    invoices = _invoices(user, params)
+    if invoices is None:
+        return None
+    return Payment.objects.filter(invoice__in=invoices.values('pk')).order_by('-payment_date', '-id')
+
+
+def _treatment_sessions(user, params):
+    return filter_session_list(TreatmentSession.objects.for_user(user), params).order_by('-date', '-start_time', '-id')
+
+
+def _patients(user, params):
+    patients, _, _ = filter_patient_list(user, params)
+    return patients
+
+
+# Columns and rows (for a user and the list filters) of every export, by name
+EXPORTS = {
+    'invoices': (INVOICE_COLUMNS, _invoices),
+    'payments': (PAYMENT_COLUMNS, _payments),
+    'treatment-sessions': (SESSION_COLUMNS, _treatment_sessions),
+    'patients': (PATIENT_COLUMNS, _patients),
+}
+
+
+def build_export(name, user, params):
+    """(header, lazy rows) of an export for the user under the list filters in params, None if they don't validate"""
+    columns, rows = EXPORTS[name]
+    queryset = rows(user, params)
+    if queryset is None:
+        return None
+    return [header for header, _ in columns], iterate_rows(queryset, [lookup for _, lookup in columns])
+
+
+def _export(request, name):
+    """
+    Stream an export as ?format=csv (default) or xlsx, gzipped with ?compress=gzip.
+    With ?background=1 it is written by a background job instead, and the user is
+    sent to the job's page to download it when it is done.
+    """
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in CONTENT_TYPES:
+        return HttpResponseBadRequest(f"Unknown export format: {export_format}")
+    compress = request.GET.get('compress') == 'gzip'
+
+    export = build_export(name, request.user, request.GET)
+    if export is None:
+        return HttpResponseBadRequest(f"Invalid {name} filters")
+
+    if request.GET.get('background'):
+        job = enqueue(
+            write_export, user=request.user, export=name, user_id=request.user.pk,
+            params=request.GET.urlencode(), export_format=export_format, compress=compress,
+        )
+        if job.status == 'succeeded':
+            # Ran inline (BACKGROUND_JOBS_IMMEDIATE)
+            return result_file_response(job)
+        return redirect('background-job', pk=job.pk)
+
+    header, rows = export
+    return export_response(
+        f'{name}-{timezone.now().date().isoformat()}', header, rows, export_format, compress=compress,
+    )
+
+
+@login_required
+@branch_admin_or_superadmin_required
+def export_invoices(request):
+    return _export(request, 'invoices')
+
+
+@login_required
+@branch_admin_or_superadmin_required
+def export_payments(request):
+    return _export(request, 'payments')
+
+
+@login_required
+@branch_admin_or_superadmin_required
+def export_treatment_sessions(request):
+    return _export(request, 'treatment-sessions')
+
+
+@login_required
+@branch_admin_or_superadmin_required
+def export_patients(request):
+    return _export(request, 'patients')
@@ -1,10 +1,18 @@
 from django.views.generic import ListView, DetailView
 from django_filters.views import FilterView
 from kop.models import Invoice, Branch
+from kop.utils.common import get_user_branch
+from kop.widgets.pagination import KeysetPaginationMixIn
 
 import django_filters
 
 
+def user_branches(request):
+    """Branches a user can filter by: their own, or all of them for users without one"""
+    branch = get_user_branch(request.user) if request else None
+    return Branch.objects.filter(pk=branch.pk) if branch else Branch.objects.all()
+
+
 class InvoiceFilter(django_filters.FilterSet):
     patient = django_filters.CharFilter(
         field_name='patient__last_name',
@@ -12,9 +20,8 @@ class InvoiceFilter(django_filters.FilterSet):
         label='Patient Last Name'
     )
     branch = django_filters.ModelChoiceFilter(
-        field_name='branch',
-        queryset=lambda request: request.user.doctorprofile.branch if hasattr(request.user,
-                                                                              'doctorprofile') else Branch.objects.none(),
+        queryset=user_branches,
+        method='filter_by_branch',
         label='Branch'
     )
     invoice_type = django_filters.ChoiceFilter(
@@ -27,6 +34,9 @@ class InvoiceFilter(django_filters.FilterSet):
         model = Invoice
         fields = []
 
+    def filter_by_branch(self, queryset, name, value):
+        return queryset.for_branch(value)
+
     def filter_by_type(self, queryset, name, value):
         if value == 'consultation':
             return queryset.filter(consultation__isnull=False)
@@ -35,15 +45,16 @@ class InvoiceFilter(django_filters.FilterSet):
         return queryset
 
 
-class InvoiceListView(FilterView):
+class InvoiceListView(KeysetPaginationMixIn, FilterView):
     model = Invoice
     template_name = 'invoices/list.html'
     context_object_name = 'invoices'
     filterset_class = InvoiceFilter
     paginate_by = 20
+    keyset_ordering = ('-invoice_date', '-id')
 
     def get_queryset(self):
-        return super().get_queryset().select_related(
+        return super().get_queryset().for_user(self.request.user).select_related(
             'patient',
             'consultation',
             'treatment'
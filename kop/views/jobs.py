@@ -0,0 +1,34 @@
+from django.contrib.auth.decorators import login_required
+from django.core.files.storage import default_storage
+from django.http import FileResponse
+from django.shortcuts import get_object_or_404, render
+
+from kop.models import BackgroundJob
+
+
+def _user_jobs(user):
+    """Superadmins see every job, everyone else the jobs they queued"""
+    jobs = BackgroundJob.objects.all()
+    return jobs if user.is_superuser else jobs.filter(user=user)
+
+
+def result_file_response(job):
+    """Download of the file a finished job wrote (its result's 'file')"""
+    return FileResponse(
+        default_storage.open(job.result['file'], 'rb'),
+        as_attachment=True,
+        filename=job.result['filename'],
+        content_type=job.result.get('content_type'),
+    )
+
+
+@login_required
+def background_job_detail(request, pk):
+    job = get_object_or_404(_user_jobs(request.user), pk=pk)
+    return render(request, 'jobs/detail.html', {'job': job})
+
+
+@login_required
+def background_job_download(request, pk):
+    job = get_object_or_404(_user_jobs(request.user), pk=pk, status='succeeded', result__has_key='file')
+    return result_file_response(job)
@@ -2,6 +2,8 @@
 from django.views import View
 from django.shortcuts import redirect
 
+from kop.utils.roles import get_user_role
+
 
 def login_redirect(request):
     """
@@ -10,9 +12,10 @@ def login_redirect(request):
     # Check if user is authenticated (should be after login)
     if request.user.is_authenticated:
         # Check user type and redirect accordingly
-        if hasattr(request.user, 'doctor_profile'):
+        role = get_user_role(request.user)
+        if role.is_doctor:
             return redirect('doctor_dashboard')
-        elif hasattr(request.user, 'branch_admin'):
+        elif role.is_branch_admin:
             return redirect('branch_admin_dashboard')
         elif request.user.is_superuser or request.user.is_staff:
             return redirect('doctor_dashboard')
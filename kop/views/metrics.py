@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+
+from kop.utils.metrics import exposition
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint. Open to superadmins, and to scrapers sending
+    `Authorization: Bearer <METRICS_TOKEN>` when that setting is configured.
+    """
+    token = settings.METRICS_TOKEN
+    authorized = request.user.is_superuser or (
+        token and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    )
+    if not authorized:
+        return HttpResponse('Forbidden', status=403, content_type='text/plain')
+
+    body, content_type = exposition()
+    return HttpResponse(body, content_type=content_type)
@@ -28,8 +28,7 @@ class PatientTreatmentListView(ListView):
             queryset = queryset.filter(doctor__user__name__icontains=doctor)
         if status:
             queryset = queryset.filter(status=status)
-        if branch:
-            queryset = queryset.filter(treatment_program__branch_id=branch)
+        queryset = queryset.for_user(self.request.user).for_branch(branch)
 
         return queryset
 
@@ -58,10 +57,6 @@ class PatientTreatmentCreateView(CreateView):
 
         return kwargs
 
-    def form_invalid(self, form):
-        print("Form errors:", form.errors)  # Debug output
-        return super().form_invalid(form)
-
 
 class PatientTreatmentUpdateView(UpdateView):
     model = PatientTreatment
@@ -42,13 +42,11 @@ class PatientWeeklyScheduleListView(ListView):
         qs_all = super().get_queryset()
         patient_id = self.kwargs['patient_id']
         qs = qs_all.filter(patient_treatment__patient_id=patient_id)
-        print(qs)
         return qs
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['patient'] = self.get_queryset().first().patient_treatment.patient if self.get_queryset().exists() else None
-        print(context)
         return context
 
 
@@ -1,13 +1,17 @@
-from django.core.paginator import Paginator
+from django.core.paginator import InvalidPage
+from django.http import Http404
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from django.db.models import Q
+from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework import filters
 
 from kop.decorators import superadmin_required, doctor_or_superadmin_required, branch_admin_or_superadmin_required
 from kop.forms.patient import PatientForm, PatientSearchForm
 from kop.models import *
 from kop.serializers.patients import PatientSerializer
-from kop.utils.common import get_user_branch
+from kop.utils.pagination import CachedCountPaginator, KeysetPaginator, KeysetPagination
+from kop.utils.patient_detail import load_patient_detail
+from kop.utils.patient_search import search_patients
 from kop.views.doctorprofile import SerializerBase
 from django.contrib import messages
 
@@ -26,46 +30,50 @@ class PatientViewSet(SerializerBase):
     # Fields to search in (partial matches)
     search_fields = ['first_name']
 
-    # Fields available for ordering
-    ordering_fields = ['created_at', 'updated_at']
-    ordering = ['created_at']  # Default ordering
+    # Keyset pages follow keyset_ordering, so there is no ?ordering= (OrderingFilter)
+    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('created_at', 'id')
 
+    def get_queryset(self):
+        return super().get_queryset().for_user(self.request.user)
 
-@login_required
-def patient_list(request):
-    doctor_or_admin = hasattr(request.user, 'doctor_profile') or hasattr(request.user, 'branch_admin')
-    if request.user and doctor_or_admin:
-        branch = get_user_branch(request.user)
-        patients = Patient.objects.filter(branch=branch).order_by('-created_at')
-    else:
-        patients = Patient.objects.all().order_by('-created_at')
+
+def filter_patient_list(user, params):
+    """
+    The user's patients narrowed by the search form in the query parameters.
+    Returns (patients, search form, whether a name or phone was searched).
+    """
+    patients = Patient.objects.for_user(user).select_related('branch').order_by('-created_at')
 
     # Search functionality
-    search_form = PatientSearchForm(request.GET or None, user=request.user)
+    search_form = PatientSearchForm(params or None, user=user)
+    searching = False
     if search_form.is_valid():
         name = search_form.cleaned_data['name']
         phone = search_form.cleaned_data['phone']
         branch = search_form.cleaned_data['branch']
-        filters = Q()
-
-        if name:
-            filters &= (Q(first_name__icontains=name) | Q(last_name__icontains=name))
 
-        if phone:
-            filters &= Q(phone__icontains=phone)
+        patients = patients.for_branch(branch)
+        patients = search_patients(patients, name, phone=phone)
+        searching = bool(name or phone)
+    return patients, search_form, searching
 
-        if branch:
-            filters &= Q(branch=branch)
 
-        patients = patients.filter(filters)
+@login_required
+def patient_list(request):
+    patients, search_form, searching = filter_patient_list(request.user, request.GET)
 
+    # Pagination: ranked search results and old ?page= links page by number,
+    # browsing the whole list pages by keyset so deep pages stay cheap
+    if searching or ('page' in request.GET and 'cursor' not in request.GET):
+        paginator = CachedCountPaginator(patients, 10)
+        page_obj = paginator.get_page(request.GET.get('page'))
     else:
-        print("Form errors:", search_form.errors)
-
-    # Pagination
-    paginator = Paginator(patients, 10)  # Show 20 patients per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+        try:
+            page_obj = KeysetPaginator(patients, ('-created_at', '-id'), 10).page(request.GET.get('cursor'))
+        except InvalidPage as e:
+            raise Http404(str(e)) from e
 
     context = {
         'page_obj': page_obj,
@@ -91,20 +99,13 @@ def add_patient(request):
 
 @login_required
 def patient_detail(request, pk):
-    patient = get_object_or_404(Patient, id=pk)
-    attachments = PatientAttachment.objects.filter(patient=patient)
-    invoices = Invoice.objects.filter(patient=patient).order_by('-invoice_date')
-    payments = Payment.objects.filter(invoice__patient=patient).select_related('invoice').order_by('-payment_date')
-
     if request.method == 'POST':
+        patient = get_object_or_404(Patient, id=pk)
         return redirect('patients/detail', patient_id=patient.id)
 
-    return render(request, 'patients/detail.html', {
-        'patient': patient,
-        'attachments': attachments,
-        'invoices': invoices,
-        'payments': payments,  # Add payments to context
-    })
+    # Patient, treatments, sessions, consultations, invoices, payments and attachments
+    # in a fixed number of queries
+    return render(request, 'patients/detail.html', load_patient_detail(pk))
 
 
 @login_required
@@ -30,11 +30,7 @@ class CreatePaymentView(CreateView):
 
         payment = form.save(commit=False)
         payment.invoice = invoice
-
-        # Generate reference if not provided
-        if not payment.reference:
-            payment.reference = f"PAY-{invoice.id}-{Payment.objects.count() + 1}"
-
+        # Payment.save fills in the reference when it was left blank
         payment.save()
 
         messages.success(
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.shortcuts import redirect, render
+
+from kop.decorators import superadmin_required
+from kop.utils.profiling import clear_profiles, recent_profiles, view_breakdown
+
+
+@login_required
+@superadmin_required
+def profiling_dashboard(request):
+    """Recent request profiles of this process and their per-view breakdown; POST clears them"""
+    if request.method == 'POST':
+        clear_profiles()
+        return redirect('request-profiling')
+
+    profiles = recent_profiles()
+    return render(request, 'profiling/dashboard.html', {
+        'profiles': profiles,
+        'views': view_breakdown(profiles),
+        'always_on': settings.REQUEST_PROFILING,
+        'header': settings.REQUEST_PROFILING_HEADER,
+        'buffer_size': settings.REQUEST_PROFILING_BUFFER_SIZE,
+    })
@@ -0,0 +1,51 @@
+from rest_framework import permissions, viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from kop.models import DailyActivityRollup
+from kop.permissions.reports import ReportPermission, RevenueReportPermission
+from kop.serializers.reports import ActivityMeasuresSerializer, ActivityReportQuerySerializer, ActivityRowSerializer, \
+    ReportQuerySerializer, RevenueReportSerializer
+from kop.utils.activity_rollup import summarize_rollups
+from kop.utils.common import get_user_branch
+from kop.utils.revenue_report import revenue_report
+
+
+class ReportViewSet(viewsets.ViewSet):
+    permission_classes = [permissions.IsAuthenticated, ReportPermission]
+
+    @action(detail=False, methods=['get'])
+    def activity(self, request):
+        """Sessions, consultations and revenue per day, month, doctor or branch, from the daily rollup"""
+        query = ActivityReportQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        # A branch user always gets their own branch, whatever they ask for
+        branch = get_user_branch(request.user) or params.get('branch')
+        rollups = DailyActivityRollup.objects.for_branch(branch).filter(
+            date__range=(params['start'], params['end'])
+        )
+        if params.get('doctor'):
+            rollups = rollups.filter(doctor=params['doctor'])
+        rows, totals = summarize_rollups(rollups, params['group_by'])
+
+        return Response({
+            'start': params['start'],
+            'end': params['end'],
+            'group_by': params['group_by'],
+            'results': ActivityRowSerializer(rows, many=True).data,
+            'totals': ActivityMeasuresSerializer(totals).data,
+        })
+
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated, RevenueReportPermission])
+    def revenue(self, request):
+        """Revenue by branch, program, doctor and payment method, discounts and receivables aging"""
+        query = ReportQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        # A branch user always gets their own branch, whatever they ask for
+        branch = get_user_branch(request.user) or params.get('branch')
+        report = revenue_report(branch.pk if branch else None, params['start'], params['end'])
+        return Response(RevenueReportSerializer({'branch': branch.pk if branch else None, **report}).data)
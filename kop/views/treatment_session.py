@@ -6,6 +6,7 @@ from django.urls import reverse_lazy
 from django.db.models import Q
 from kop.models import TreatmentSession, PatientTreatment, Branch
 from kop.forms.treatment_session import TreatmentSessionForm
+from kop.widgets.pagination import KeysetPaginationMixIn
 from django.utils.decorators import method_decorator
 
 from django.contrib.auth.decorators import login_required
@@ -19,7 +20,6 @@ class TreatmentSessionCreateView(CreateView):
 
     def get_form_kwargs(self):
         kwargs = super().get_form_kwargs()
-        print(kwargs, self.kwargs)
         if 'patient_id' in self.kwargs:
             kwargs['patient'] = self.kwargs['patient_id']
         return kwargs
@@ -49,45 +49,46 @@ class TreatmentSessionDeleteView(DeleteView):
     success_url = reverse_lazy('treatment-session-list')
 
 
-class TreatmentSessionListView(ListView):
+def filter_session_list(queryset, params):
+    """Apply the session list filters (branch, patient, date, treatment) from query parameters"""
+    # Get filter parameters
+    branch = params.get('branch')
+    patient = params.get('patient')
+    date = params.get('date')
+    treatment = params.get('treatment')  # New treatment filter
+
+    # Apply filters
+    queryset = queryset.for_branch(branch)
+
+    # Filter by treatment first (if provided)
+    if treatment:
+        queryset = queryset.filter(treatment_id=treatment)
+
+    # Then filter by patient (if provided)
+    if patient:
+        queryset = queryset.filter(
+            Q(treatment__patient__first_name__icontains=patient) |
+            Q(treatment__patient__last_name__icontains=patient)
+        )
+
+    if date:
+        queryset = queryset.filter(date=date)
+
+    return queryset
+
+
+class TreatmentSessionListView(KeysetPaginationMixIn, ListView):
     model = TreatmentSession
     template_name = 'treatment_sessions/list.html'
     paginate_by = 10
+    keyset_ordering = ('-date', '-start_time', '-id')
     context_object_name = 'treatment_sessions'
 
     def get_queryset(self):
         queryset = super().get_queryset().select_related(
             'treatment', 'treatment_doctor__user'
         )
-
-        # Get filter parameters
-        branch = self.request.GET.get('branch')
-        patient = self.request.GET.get('patient')
-        date = self.request.GET.get('date')
-        treatment = self.request.GET.get('treatment')  # New treatment filter
-
-        # Apply filters
-        if branch:
-            queryset = queryset.filter(
-                Q(treatment__treatment_program__branch_id=branch) |
-                Q(treatment_doctor__branch_id=branch)
-            )
-
-        # Filter by treatment first (if provided)
-        if treatment:
-            queryset = queryset.filter(treatment_id=treatment)
-
-        # Then filter by patient (if provided)
-        if patient:
-            queryset = queryset.filter(
-                Q(treatment__patient__first_name__icontains=patient) |
-                Q(treatment__patient__last_name__icontains=patient)
-            )
-
-        if date:
-            queryset = queryset.filter(date=date)
-
-        return queryset
+        return filter_session_list(queryset.for_user(self.request.user), self.request.GET)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -106,3 +107,62 @@ class TreatmentSessionListView(ListView):
         context['current_treatment'] = self.request.GET.get('treatment', '')
 
         return context
+
+
+from django.utils import timezone
+from rest_framework import viewsets, permissions, status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from kop.serializers.treatment_session import TreatmentSessionSerializer, BulkSessionStatusSerializer, \
+    GenerateSessionsSerializer
+from kop.utils.common import get_user_branch
+from kop.utils.pagination import KeysetPagination
+from kop.utils.session_generator import generate_sessions
+from kop.utils.treatment_sessions import set_sessions_status
+
+
+class TreatmentSessionViewSet(viewsets.ReadOnlyModelViewSet):
+    serializer_class = TreatmentSessionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-date', '-start_time', '-id')
+
+    def get_queryset(self):
+        branch = get_user_branch(self.request.user)
+        if not branch and not self.request.user.is_superuser:
+            return TreatmentSession.objects.none()
+        return TreatmentSession.objects.for_branch(branch)
+
+    @action(detail=False, methods=['post'], url_path='bulk-status')
+    def bulk_status(self, request):
+        """Complete or un-complete many sessions at once, e.g. a whole day's attendance"""
+        serializer = BulkSessionStatusSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        results = set_sessions_status(
+            serializer.validated_data['session_ids'],
+            status=serializer.validated_data['status'],
+            queryset=self.get_queryset(),
+        )
+        return Response({'results': results}, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'], url_path='generate')
+    def generate(self, request):
+        """Create the scheduled sessions of the user's branch from the weekly schedules"""
+        branch = get_user_branch(request.user)
+        if not branch and not request.user.is_superuser:
+            return Response(
+                {"detail": "You do not have permission to perform this action."},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        serializer = GenerateSessionsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        summary = generate_sessions(
+            serializer.validated_data.get('start_date') or timezone.now().date(),
+            weeks=serializer.validated_data['weeks'],
+            branch=branch,
+        )
+        return Response(summary, status=status.HTTP_201_CREATED)
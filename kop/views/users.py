@@ -4,6 +4,7 @@ from django.contrib.auth import get_user_model
 from kop.models import WeeklyAvailability
 from kop.serializers.doctorprofile import WeeklyAvailabilitySerializer
 from kop.serializers.users import UserSerializer
+from kop.utils.roles import branch_members, get_user_role
 
 
 from kop.views.doctorprofile import SerializerBase
@@ -16,10 +17,13 @@ class UserProfileViewSet(SerializerBase):
     serializer_class = UserSerializer
 
     def get_queryset(self):
-        queryset = User.objects.all()
+        if self.request.user.is_superuser:
+            return User.objects.all()
 
-        if self.request.user.is_superuser or hasattr(self.request.user, 'branch_admin_profile'):
-            return queryset
+        # Branch admins manage the doctors, staff and admins of their own branch
+        role = get_user_role(self.request.user)
+        if role.is_branch_admin:
+            return branch_members(role.branch_for('branch_admin').pk)
 
         return User.objects.none()
 
@@ -0,0 +1,25 @@
+from django.core.paginator import InvalidPage
+from django.http import Http404
+
+from kop.utils.pagination import CachedCountPaginator, KeysetPaginator
+
+
+class KeysetPaginationMixIn:
+    """
+    ListView pagination by keyset (?cursor=...) instead of OFFSET/COUNT.
+    Old ?page=N links still work, with a cached approximate count.
+    `keyset_ordering` has to be unique, so end it with the primary key.
+    """
+    keyset_ordering = ('-created_at', '-id')
+    paginator_class = CachedCountPaginator
+
+    def paginate_queryset(self, queryset, page_size):
+        if 'page' in self.request.GET and 'cursor' not in self.request.GET:
+            return super().paginate_queryset(queryset, page_size)
+
+        paginator = KeysetPaginator(queryset, self.keyset_ordering, page_size)
+        try:
+            page = paginator.page(self.request.GET.get('cursor'))
+        except InvalidPage as e:
+            raise Http404(str(e)) from e
+        return paginator, page, page.object_list, page.has_other_pages()